@@ -1,4 +1,3 @@
-import bpy
 import json
 import numpy as np
 import os
@@ -8,6 +7,10 @@ file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
 from dataset_config import *
+try:
+	import bpy
+except ImportError:  # annotations of the .gltf files read without Blender
+	bpy = None
 
 
 class Annotation:
@@ -19,6 +22,7 @@ class Annotation:
 	def __init__(self):
 		self.content = {}
 		self.full = []
+		self._models = {}  # model -> position of its record in full
 		self._clean()
 
 	def add(self, building, name, model):
@@ -29,6 +33,50 @@ class Annotation:
 		:param model: name of the model .obj file, str
 		:return:
 		"""
+		self.commit(self.make(building, name, model))
+
+	def commit(self, record):
+		"""
+		Function that stores a finished annotation record. A record of a model
+		that was already committed replaces the previous one.
+		:param record: annotation of one model, dict
+		:return:
+		"""
+		if record['model'] in self._models:
+			self.full[self._models[record['model']]] = record
+			return
+		self._models[record['model']] = len(self.full)
+		self.full.append(record)
+
+	def has(self, model):
+		"""
+		Function that checks whether the record of a model was committed.
+		:param model: name of the model .obj file, str
+		:return: bool
+		"""
+		return MODEL_SAVE + '/' + model in self._models
+
+	def load(self, filename):
+		"""
+		Function that reads the records of an annotation written by a previous
+		run, to resume it.
+		:param filename: path of the .json file, str
+		:return: number of records, int
+		"""
+		with open(filename, 'r') as f:
+			for record in json.load(f):
+				self.commit(record)
+		print('Resuming annotation {} from {} records'.format(filename, len(self.full)))
+		return len(self.full)
+
+	def make(self, building, name, model):
+		"""
+		Function that makes the annotation of a model without storing it.
+		:param building: building to annotate, Building class
+		:param name: name of the image file, str
+		:param model: name of the model .obj file, str
+		:return: annotation of the model, dict
+		"""
 		assert isinstance(name, str)
 
 		self.content['img'] += name
@@ -48,17 +96,19 @@ class Annotation:
 		except Exception:
 			pass
 
-		for v in building.volumes:
+		for v in getattr(building, 'volumes', []):
 			try:
 				self.content['material'].append(v.mesh.active_material.name.split('.')[0])
 			except Exception:
 				pass
 		self.content['material'] = list(set(self.content['material']))
-		self.content['img_size'] = (bpy.data.scenes[0].render.resolution_y,
-		                            bpy.data.scenes[0].render.resolution_x)
+		if bpy is not None:
+			self.content['img_size'] = (bpy.data.scenes[0].render.resolution_y,
+			                            bpy.data.scenes[0].render.resolution_x)
 		self.content['bbox'] = building.get_bb()
-		self.full.append(self.content)
+		record = self.content
 		self._clean()
+		return record
 
 	def write(self, filename='test.json'):
 		"""
@@ -97,3 +147,101 @@ class Annotation:
 		                'bbox': [0.0, 0.0, 0.0, 0.0],
 		                'material': []}
 
+
+
+class StreamingAnnotation(Annotation):
+	"""
+	Class that writes every annotation record to a JSON Lines file as soon as it
+	is committed instead of keeping the full annotation in memory. A run that
+	crashed can be resumed from the last committed record.
+	"""
+	def __init__(self, filename, fsync=ANNOTATION_FSYNC, resume=True):
+		"""
+		Class initialization
+		:param filename: path of the .jsonl file, str
+		:param fsync: number of records between two flushes to disk, int,
+		default ANNOTATION_FSYNC
+		:param resume: keep the records already in the file, bool, default True
+		"""
+		Annotation.__init__(self)
+		self.path = filename
+		self.fsync = max(1, fsync)
+		self.count = self._recover() if resume else 0
+		self._pending = 0
+		self._file = open(self.path, 'a' if resume else 'w')
+
+	def close(self):
+		"""
+		Function that flushes the committed records to disk and closes the file.
+		:return:
+		"""
+		if not self._file.closed:
+			self._sync()
+			self._file.close()
+
+	def commit(self, record):
+		"""
+		Function that appends a finished annotation record to the file.
+		:param record: annotation of one model, dict
+		:return:
+		"""
+		self._file.write(json.dumps(record) + '\n')
+		self.count += 1
+		self._pending += 1
+		if self._pending >= self.fsync:
+			self._sync()
+
+	def write(self, filename='test.json'):
+		"""
+		Function that writes the full json annotation to the provided location,
+		copying the records one by one. A model committed several times (a
+		sample generated again) gets its last record at the position of its
+		first one, as with Annotation.commit.
+		:param filename: name of the file to write, str, default='test.json'
+		:return:
+		"""
+		assert isinstance(filename, str), 'Expected filename to be str, got {}'.format(type(filename))
+		self._sync()
+		last = {}  # model -> offset of its last record, in the order of the first one
+		with open(self.path, 'rb') as records:
+			offset = 0
+			for line in records:
+				last[json.loads(line)['model']] = offset
+				offset += len(line)
+		with open(filename, 'w') as f, open(self.path, 'rb') as records:
+			f.write('[')
+			for i, offset in enumerate(last.values()):
+				records.seek(offset)
+				f.write((', ' if i else '') + records.readline().decode('utf-8').rstrip('\n'))
+			f.write(']')
+
+		print('Annotation successfully written as {}'.format(filename))
+
+	def _recover(self):
+		"""
+		Function that counts the records committed by a previous run and cuts
+		off a record that was only partially written.
+		:return: number of committed records, int
+		"""
+		if not os.path.isfile(self.path):
+			return 0
+		count, end = 0, 0
+		with open(self.path, 'rb') as f:
+			for line in f:
+				try:
+					assert line.endswith(b'\n')
+					json.loads(line)
+				except (AssertionError, ValueError):
+					break
+				count += 1
+				end += len(line)
+		with open(self.path, 'r+b') as f:
+			f.truncate(end)
+		if count:
+			print('Resuming annotation {} from {} records'.format(self.path, count))
+		return count
+
+	def _sync(self):
+		self._file.flush()
+		os.fsync(self._file.fileno())
+		self._pending = 0
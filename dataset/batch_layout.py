@@ -0,0 +1,348 @@
+import argparse
+import numpy as np
+import os
+import sys
+import textwrap
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset_config import *
+from layout import BuildingLayout, VolumeLayout
+from validity import check
+
+
+# One row per volume, rows of a building are contiguous and ordered by volume
+LAYOUT_DTYPE = np.dtype([('building', np.int64),
+                         ('typology', 'U12'),
+                         ('volume', np.int8),
+                         ('width', np.float64),
+                         ('length', np.float64),
+                         ('height', np.float64),
+                         ('x', np.float64),
+                         ('y', np.float64),
+                         ('z', np.float64),
+                         ('rotation', np.float64)])
+
+
+class BatchLayoutFactory:
+	"""
+	Factory that plans the layouts of a whole batch of buildings at once with
+	array operations. Applies the same typology rules as layout.py, but draws
+	its random numbers per typology and per column, so its layouts differ from
+	LayoutFactory for the same seed.
+	"""
+	def __init__(self):
+		self.mapping = {'Patio': (self._patio, 4),
+		                'L': (self._l_building, 2),
+		                'C': (self._c_building, 3),
+		                'Single': (self._single, 1),
+		                'Skyscraper': (self._skyscraper, 1),
+		                'Closedpatio': (self._closed_patio, 2),
+		                'Equalpatio': (self._patio_equal, 4)}
+		self.mapping = {x: y for x, y in self.mapping.items() if x in BUILDINGS}
+
+	def produce(self, number, seed=None, names=None, attempts=VALIDITY_ATTEMPTS):
+		"""
+		Function that plans the layouts of a batch of buildings.
+		:param number: number of buildings, int
+		:param seed: seed of the random generator, int or np.random.Generator,
+		default None
+		:param names: typology of every building, array of str, default None
+		(random)
+		:param attempts: number of times the invalid layouts are planned again
+		with the same typology, see validity.check, 0 - not checked, int, default
+		VALIDITY_ATTEMPTS
+		:return: layouts, np.ndarray of LAYOUT_DTYPE, one row per volume
+		"""
+		rng = np.random.default_rng(seed)
+		rows = self._plan(rng, number, names)
+		if not attempts:
+			return rows
+		typologies = rows['typology'][rows['volume'] == 0]
+		invalid = _invalid(rows)
+		replaced, pieces = invalid, []
+		for attempt in range(attempts):
+			if not len(invalid):
+				break
+			again = self._plan(rng, len(invalid), typologies[invalid])
+			again['building'] = invalid[again['building']]
+			# only the buildings planned again are checked again, the last draw is
+			# kept for the ones that stay invalid
+			invalid = _invalid(again) if attempt < attempts - 1 else invalid[:0]
+			pieces.append(again[~np.isin(again['building'], invalid)])
+		if not pieces:
+			return rows
+		rows = np.concatenate([rows[~np.isin(rows['building'], replaced)]] + pieces)
+		return rows[np.lexsort((rows['volume'], rows['building']))]
+
+	def _plan(self, rng, number, names=None):
+		"""
+		Function that plans the layouts of a batch of buildings.
+		:param rng: random generator, np.random.Generator
+		:param number: number of buildings, int
+		:param names: typology of every building, array of str, default None
+		(random)
+		:return: layouts, np.ndarray of LAYOUT_DTYPE, one row per volume
+		"""
+		typologies = np.array(list(self.mapping.keys()))
+		if names is None:
+			names = typologies[rng.integers(0, len(typologies), number)]
+		names = np.asarray(names)
+		assert len(names) == number, "Expected {} typologies, " \
+		                             "got {}".format(number, len(names))
+		assert np.isin(names, typologies).all(), "Unknown building typology " \
+		                                         "in {}".format(np.unique(names))
+
+		rows = []
+		for name in typologies:
+			ids = np.flatnonzero(names == name)
+			if len(ids) == 0:
+				continue
+			rule, count = self.mapping[name]
+			v = self._random_volumes(rng, len(ids), count)
+			rule(rng, v)
+			rows.append(self._rows(ids, name, v))
+		if not rows:
+			return np.zeros(0, dtype=LAYOUT_DTYPE)
+		rows = np.concatenate(rows)
+		return rows[np.lexsort((rows['volume'], rows['building']))]
+
+	def to_layouts(self, rows):
+		"""
+		Function that turns batch rows into layouts that can be realised in
+		Blender with BuildingFactory.realise.
+		:param rows: layouts, np.ndarray of LAYOUT_DTYPE
+		:return: layouts, list of BuildingLayout
+		"""
+		layouts = []
+		for building in np.split(rows, np.flatnonzero(np.diff(rows['building'])) + 1):
+			volumes = []
+			for row in building:
+				v = VolumeLayout()
+				v.width, v.length, v.height = row['width'], row['length'], row['height']
+				v.location = [row['x'], row['y'], row['z']]
+				v.rotation = row['rotation']
+				volumes.append(v)
+			layout = BuildingLayout(volumes)
+			layout.typology = str(building['typology'][0])
+			layouts.append(layout)
+		return layouts
+
+	def _random_volumes(self, rng, number, count):
+		"""
+		Function that draws the scales of the volumes as Factory does and clamps
+		them as Volume does.
+		:param rng: random generator, np.random.Generator
+		:param number: number of buildings, int
+		:param count: number of volumes per building, int
+		:return: volumes, dict of np.ndarray (number, count)
+		"""
+		shape = (number, count)
+		scale = [rng.integers(MIN_LENGTH, MAX_LENGTH, shape),
+		         rng.integers(MIN_WIDTH, MAX_WIDTH, shape),
+		         rng.integers(MIN_HEIGHT, MAX_HEIGHT, shape)]
+		return {'width': np.maximum(MIN_WIDTH, scale[0]).astype(np.float64),
+		        'length': np.maximum(MIN_LENGTH, scale[1]).astype(np.float64),
+		        'height': np.maximum(MIN_HEIGHT, scale[2]).astype(np.float64),
+		        'x': np.zeros(shape),
+		        'y': np.zeros(shape),
+		        'rotation': np.zeros(shape)}
+
+	def _rows(self, ids, name, v):
+		"""
+		Function that flattens the volume arrays of one typology into rows.
+		:param ids: building ids, np.ndarray (n,)
+		:param name: typology, str
+		:param v: volumes, dict of np.ndarray (n, count)
+		:return: rows, np.ndarray of LAYOUT_DTYPE
+		"""
+		number, count = v['width'].shape
+		rows = np.zeros(number * count, dtype=LAYOUT_DTYPE)
+		rows['building'] = np.repeat(ids, count)
+		rows['typology'] = name
+		rows['volume'] = np.tile(np.arange(count), number)
+		for key in ['width', 'length', 'height', 'x', 'y', 'rotation']:
+			rows[key] = v[key].ravel()
+		rows['z'] = -rows['height'] / 2.0
+		return rows
+
+	################################################################################
+	# typology rules, same as in layout.py
+
+	def _single(self, rng, v):
+		pass
+
+	def _l_building(self, rng, v):
+		self._same_height(rng, v)
+		self._sort(v, descending=True)
+		_attach(v, 0, 1, 0, 0, 0)
+
+	def _c_building(self, rng, v):
+		self._same_height(rng, v)
+		self._sort(v, descending=True)
+		v['rotation'][:, 1:] = np.where(v['width'][:, 1:] < v['length'][:, 1:],
+		                                np.radians(90), 0.0)
+		_attach(v, 0, 1, 0, 1, 0)
+		_attach(v, 0, 2, 0, 0, 0)
+
+	def _patio(self, rng, v):
+		self._patio_volumes(rng, v)
+		v['height'] = np.clip(np.minimum(v['height'], v['width'] * 3), MIN_HEIGHT,
+		                      MAX_HEIGHT)
+		self._sort(v)
+		self._patio_links(rng, v)
+
+	def _patio_equal(self, rng, v):
+		_height = np.clip(np.minimum(v['height'][:, 0], v['width'][:, 0] * 3),
+		                  MIN_HEIGHT, MAX_HEIGHT)
+		self._patio_volumes(rng, v)
+		v['height'][:] = _height[:, None]
+		self._sort(v)
+		self._patio_links(rng, v)
+
+	def _closed_patio(self, rng, v):
+		self._patio_volumes(rng, v)
+		v['height'] = np.clip(np.minimum(v['height'], v['width'] * 3), MIN_HEIGHT,
+		                      MAX_HEIGHT)
+		copies = {'width': np.maximum(MIN_WIDTH, v['width']),
+		          'length': np.maximum(MIN_LENGTH, v['length']),
+		          'height': np.maximum(MIN_HEIGHT, v['height'])}
+		for key in v:
+			v[key] = np.concatenate([v[key], copies.get(key, np.zeros_like(v[key]))],
+			                        axis=1)
+		self._patio_links(rng, v)
+
+	def _skyscraper(self, rng, v):
+		v['height'] = rng.integers(100, 200, v['height'].shape).astype(np.float64)
+		v['length'] = np.maximum(30, v['length'])
+		v['width'] = np.maximum(30, v['width'])
+
+	def _patio_volumes(self, rng, v):
+		v['width'] = np.clip(v['width'], 3, 12)
+		v['length'] = v['width'] * (rng.random(v['width'].shape) + 1.5)
+
+	def _patio_links(self, rng, v):
+		circular = rng.random(len(v['width'])) < 0.5
+		v['rotation'][:, 1::2] = np.radians(90)
+		# (axis, border1, border2) of every link for circular and cap linkage
+		links = [((0, 1, 1), (1, 1, 0)), ((1, 1, 0), (1, 1, 0)), ((0, 0, 0), (1, 0, 1))]
+		for i, (_circular, _cap) in enumerate(links):
+			params = np.where(circular[:, None], _circular, _cap)
+			_attach(v, i, i + 1, params[:, 0], params[:, 1], params[:, 2])
+
+	def _same_height(self, rng, v):
+		same = rng.random(len(v['height'])) < 0.5
+		_height = np.maximum(np.minimum(v['height'][:, 0],
+		                                np.minimum(v['width'][:, 0] * 3, MAX_HEIGHT)),
+		                     MIN_HEIGHT)
+		v['height'] = np.where(same[:, None], _height[:, None], v['height'])
+
+	def _sort(self, v, descending=False):
+		order = np.argsort(-v['length'] if descending else v['length'], axis=1,
+		                   kind='stable')
+		for key in v:
+			v[key] = np.take_along_axis(v[key], order, axis=1)
+
+
+def _invalid(rows):
+	"""
+	Function that returns the buildings of a batch whose layout is invalid.
+	:param rows: layouts, np.ndarray of LAYOUT_DTYPE
+	:return: building ids, np.ndarray
+	"""
+	result = check(rows)
+	return result['building'][~result['valid']]
+
+
+def _limits(v, i):
+	"""
+	Function that returns the limits of the i-th volume of every building.
+	:param v: volumes, dict of np.ndarray (n, count)
+	:param i: index of the volume, int
+	:return: limits, np.ndarray (n, 2, 2), [building, axis, min/max]
+	"""
+	c, s = np.abs(np.cos(v['rotation'][:, i])), np.abs(np.sin(v['rotation'][:, i]))
+	half = np.stack([c * v['length'][:, i] + s * v['width'][:, i],
+	                 s * v['length'][:, i] + c * v['width'][:, i]], axis=1)
+	centre = np.stack([v['x'][:, i], v['y'][:, i]], axis=1)
+	return np.stack([centre - half, centre + half], axis=2)
+
+
+def _attach(v, i, j, axis, border1, border2):
+	"""
+	Function that attaches the j-th volume of every building to its i-th volume,
+	same as gancio. Parameters may differ between buildings.
+	:param v: volumes, dict of np.ndarray (n, count)
+	:param i: index of the volume to attach to, int
+	:param j: index of the volume to attach, int
+	:param axis: axis of the attachment, int or np.ndarray (n,)
+	:param border1: max or min side of the axis, int or np.ndarray (n,)
+	:param border2: max or min side of the opposite axis, int or np.ndarray (n,)
+	:return:
+	"""
+	n = len(v['x'])
+	axis, border1, border2 = [np.broadcast_to(np.asarray(x), (n,)) for x in
+	                          (axis, border1, border2)]
+	other = 1 - axis
+	rows = np.arange(n)
+	coords1, coords2 = _limits(v, i), _limits(v, j)
+	size1 = coords1[:, :, 1] - coords1[:, :, 0]
+	size2 = coords2[:, :, 1] - coords2[:, :, 0]
+	sign1, sign2 = 2 * border1 - 1, 2 * border2 - 1
+
+	location = np.stack([v['x'][:, j], v['y'][:, j]], axis=1)
+	location[rows, axis] = coords1[rows, axis, border1] + \
+	                       0.5 * size2[rows, axis] * sign1
+	location[rows, other] = coords1[rows, other, border2] - \
+	                        sign2 * size1[rows, other] + \
+	                        0.5 * size2[rows, other] * sign2
+	v['x'][:, j], v['y'][:, j] = location[:, 0], location[:, 1]
+
+
+def bounding_boxes(rows):
+	"""
+	Function that returns the bounding box of every building of a batch.
+	:param rows: layouts, np.ndarray of LAYOUT_DTYPE
+	:return: building ids, np.ndarray (n,), bounding boxes, np.ndarray (n, 4),
+	[width_from, width_to, length_from, length_to]
+	"""
+	c, s = np.abs(np.cos(rows['rotation'])), np.abs(np.sin(rows['rotation']))
+	half_x = c * rows['length'] + s * rows['width']
+	half_y = s * rows['length'] + c * rows['width']
+	starts = np.concatenate([[0], np.flatnonzero(np.diff(rows['building'])) + 1])
+	boxes = np.stack([np.minimum.reduceat(rows['x'] - half_x, starts),
+	                  np.maximum.reduceat(rows['x'] + half_x, starts),
+	                  np.minimum.reduceat(rows['y'] - half_y, starts),
+	                  np.maximum.reduceat(rows['y'] + half_y, starts)], axis=1)
+	return rows['building'][starts], np.round(boxes, 3)
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+		USAGE: python batch_layout.py --size 1000000 --seed 0 --out layouts.npy
+
+		------------------------------------------------------------------------
+
+		This is an algorithm that plans the layouts of a batch of buildings with
+		array operations and saves them as a structured NumPy array.
+
+		------------------------------------------------------------------------
+
+		'''))
+	parser.add_argument('--size', type=int, default=SIZE,
+	                    help='number of buildings to plan')
+	parser.add_argument('--seed', type=int, default=None,
+	                    help='seed of the random generator')
+	parser.add_argument('--out', type=str, default='layouts.npy',
+	                    help='path of the .npy file to write')
+	parser.add_argument('--attempts', type=int, default=VALIDITY_ATTEMPTS,
+	                    help='number of times the invalid layouts are planned again')
+	args = parser.parse_args()
+
+	layouts = BatchLayoutFactory().produce(args.size, seed=args.seed,
+	                                       attempts=args.attempts)
+	np.save(args.out, layouts)
+	print('{} volumes of {} buildings successfully written as {}'.format(
+		len(layouts), args.size, args.out))
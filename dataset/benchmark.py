@@ -0,0 +1,369 @@
+import argparse
+import bpy
+import json
+from math import ceil
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset import Dataset
+from dataset_config import *
+from generator import BuildingFactory
+from lifecycle import SceneManager
+from module import BatchGridApplier, GridApplier, ModuleFactory
+from point_cloud import PointCloud
+from renderer import Renderer
+from seeding import sample_rng
+from volume import Factory
+
+
+def volume_benchmark(size=100, seed=SEED):
+	"""
+	Function that times the creation of random volumes.
+	:param size: number of volumes, int, default 100
+	:param seed: run seed, int, default SEED
+	:return: times of the volumes, dict
+	"""
+	times = []
+	for i in range(size):
+		volume = Factory(sample_rng(seed, i)).produce()
+		start = time.perf_counter()
+		volume.create()
+		times.append(time.perf_counter() - start)
+	SceneManager().demolish(compositor=False)
+	return {'geometry': GEOMETRY, 'volume': _stats(times)}
+
+
+def typology_benchmark(size=10, seed=SEED):
+	"""
+	Function that times producing and making the buildings of every typology of
+	BuildingFactory.mapping.
+	:param size: number of buildings per typology, int, default 10
+	:param seed: run seed, int, default SEED
+	:return: times of every typology, dict
+	"""
+	results = {}
+	for name in BuildingFactory().mapping:
+		times = []
+		for i in range(size):
+			factory = BuildingFactory(sample_rng(seed, i))
+			start = time.perf_counter()
+			building = factory.produce(name)
+			building.make()
+			times.append(time.perf_counter() - start)
+			building.demolish()
+		results[name] = _stats(times)
+	return results
+
+
+def module_benchmark(size=5, seed=SEED):
+	"""
+	Function that times the placement of the modules on every facade of the
+	same buildings with every module applier.
+	:param size: number of buildings, int, default 5
+	:param seed: run seed, int, default SEED
+	:return: times per facade and per module of every applier, dict
+	"""
+	results = {}
+	for mode in [None, 'instance', 'merge']:
+		times, modules = [], 0
+		for i in range(size):
+			rng = sample_rng(seed, i)
+			building = BuildingFactory(rng).produce()
+			building.make()
+			for v in building.volumes:
+				for module_name in MODULES:
+					for side in range(2):
+						module_type = ModuleFactory().mapping[module_name]
+						if mode is None:
+							applier = GridApplier(module_type)
+						else:
+							applier = BatchGridApplier(module_type, mode=mode)
+						start = time.perf_counter()
+						module = ModuleFactory().produce(module_name)
+						module.connect(v, side)
+						step = (int(rng.integers(ceil(module.scale[0]), 6)),
+						        int(rng.integers(ceil(module.scale[0]), 6)))
+						offset = (2.0, 2.0, 2.0, 1.0)
+						modules += len(applier._grid(module, None, offset, step))
+						applier.apply(module, step=step, offset=offset)
+						times.append(time.perf_counter() - start)
+			building.demolish()
+		results[mode or 'single'] = {'facade': _stats(times), 'modules': modules,
+		                             'per_module': sum(times) / max(modules, 1)}
+	return results
+
+
+def point_cloud_benchmark(size=5, seed=SEED):
+	"""
+	Function that times reading the triangles of the buildings and sampling
+	their point clouds.
+	:param size: number of buildings, int, default 5
+	:param seed: run seed, int, default SEED
+	:return: times of the two steps, dict
+	"""
+	triangles, sampling, counts = [], [], []
+	for i, building in _buildings(size, seed):
+		start = time.perf_counter()
+		_triangles = building.triangles()
+		triangles.append(time.perf_counter() - start)
+		counts.append(len(_triangles))
+		start = time.perf_counter()
+		PointCloud().make(i, _triangles, save=False, rng=sample_rng(seed, i))
+		sampling.append(time.perf_counter() - start)
+	return {'triangles': _stats(triangles), 'sampling': _stats(sampling),
+	        'mean_triangles': float(np.mean(counts)), 'points': POINTS}
+
+
+def profile_benchmark(size=5, seed=SEED, profiles=None, threads=THREADS):
+	"""
+	Function that renders the same buildings with every render profile and
+	reports the seconds per image and the noise of the images. The noise is
+	estimated on every image alone and as the difference to the image of the
+	profile with most samples.
+	:param size: number of buildings to render, int, default 5
+	:param seed: run seed, int, default SEED
+	:param profiles: names of the profiles, list of str, default None (all the
+	profiles of RENDER_PROFILES)
+	:param threads: number of render threads, 0 - all the cores, int,
+	default THREADS
+	:return: results of every building and their summary, dict
+	"""
+	profiles = profiles or list(RENDER_PROFILES)
+	reference = max(profiles, key=lambda x: RENDER_PROFILES[x]['samples'])
+	samples = []
+	for i, building in _buildings(size, seed):
+		sample, images = {'index': i}, {}
+		for profile in profiles:
+			renderer = Renderer(mode=0, outputs=['rgb'], render_mode='full',
+			                    profile=profile, threads=threads)
+			start = time.perf_counter()
+			renderer.render(filename='benchmark_{}_{}'.format(profile, i))
+			seconds = time.perf_counter() - start
+			images[profile] = _pixels('{}/benchmark_{}_{}.png'.format(IMG_SAVE, profile, i))
+			sample[profile] = {'seconds': seconds, 'noise': noise(images[profile])}
+		for profile in profiles:
+			sample[profile]['rmse'] = float(np.sqrt(np.mean(
+				(images[profile][..., :3] - images[reference][..., :3]) ** 2)))
+			print('Building {} {}: {seconds:.2f} s, noise {noise:.4f}, '
+			      'rmse {rmse:.4f}'.format(i, profile, **sample[profile]))
+		samples.append(sample)
+	_remove_outputs('benchmark_')
+
+	summary = {}
+	for profile in profiles:
+		summary[profile] = {key: float(np.median([x[profile][key] for x in samples]))
+		                    for key in ['seconds', 'noise', 'rmse']}
+	return {'samples': samples, 'reference': reference, 'threads': threads,
+	        'summary': summary}
+
+
+def render_mode_benchmark(size=5, seed=SEED):
+	"""
+	Function that renders the same buildings with the full render and with the
+	mask render mode, and compares the times and the masks of the two modes.
+	:param size: number of buildings to render, int, default 5
+	:param seed: run seed, int, default SEED
+	:return: times and comparison of every building and their summary, dict
+	"""
+	samples = []
+	for i, building in _buildings(size, seed):
+		sample = {'index': i}
+		for render_mode in ['full', 'mask']:
+			renderer = Renderer(mode=0, render_mode=render_mode)
+			start = time.perf_counter()
+			renderer.render(filename='benchmark_{}_{}'.format(render_mode, i))
+			sample[render_mode] = time.perf_counter() - start
+		full = _pixels('{}/benchmark_full_{}_mask.png'.format(MASK_SAVE, i))
+		mask = _pixels('{}/benchmark_mask_{}_mask.png'.format(MASK_SAVE, i))
+		sample['identical'] = bool(full.shape == mask.shape and np.array_equal(full, mask))
+		sample['different_pixels'] = int(np.any(full != mask, axis=-1).sum()) \
+			if full.shape == mask.shape else -1
+		print('Building {}: full {:.2f} s, mask {:.2f} s, identical {}'.format(
+			i, sample['full'], sample['mask'], sample['identical']))
+		samples.append(sample)
+	_remove_outputs('benchmark_')
+
+	# the first render loads the kernels, the median is not affected by it
+	full = float(np.median([x['full'] for x in samples]))
+	mask = float(np.median([x['mask'] for x in samples]))
+	return {'samples': samples,
+	        'summary': {'full': full, 'mask': mask, 'speedup': full / mask,
+	                    'identical': all(x['identical'] for x in samples)}}
+
+
+def noise(pixels):
+	"""
+	Function that estimates the standard deviation of the noise of an image
+	from its response to a Laplacian difference kernel (Immerkaer, 1996). Only
+	the pixels of the building are used if the image has an alpha channel.
+	:param pixels: image, np.ndarray (height, width, channels), float in [0, 1]
+	:return: standard deviation of the noise, float
+	"""
+	gray = pixels[..., :3] @ np.array([0.2126, 0.7152, 0.0722], dtype=pixels.dtype)
+	response = gray[:-2, :-2] - 2 * gray[:-2, 1:-1] + gray[:-2, 2:] \
+	           - 2 * gray[1:-1, :-2] + 4 * gray[1:-1, 1:-1] - 2 * gray[1:-1, 2:] \
+	           + gray[2:, :-2] - 2 * gray[2:, 1:-1] + gray[2:, 2:]
+	if pixels.shape[-1] == 4:
+		response = response[pixels[1:-1, 1:-1, 3] > 0]
+	if response.size == 0:
+		return 0.0
+	return float(np.sqrt(np.pi / 2) / 6 * np.abs(response).mean())
+
+
+def run(workloads, size=None, seed=SEED, profiles=None, threads=THREADS):
+	"""
+	Function that runs several workloads and collects their results together
+	with the versions they were measured with.
+	:param workloads: names of the workloads of WORKLOADS, list of str
+	:param size: size of every workload, int, default None (workload default)
+	:param seed: run seed, int, default SEED
+	:param profiles: render profiles of the profiles workload, list of str,
+	default None (all the profiles of RENDER_PROFILES)
+	:param threads: number of render threads of the profiles workload, 0 - all
+	the cores, int, default THREADS
+	:return: results, dict
+	"""
+	assert set(workloads) <= set(WORKLOADS), "Unknown workloads {}, expected " \
+		"some of {}".format(sorted(set(workloads) - set(WORKLOADS)), list(WORKLOADS))
+	results = {'seed': seed, 'size': size, 'commit': _commit(),
+	           'blender': bpy.app.version_string, 'python': platform.python_version(),
+	           'machine': platform.platform(), 'processor': platform.processor(),
+	           'cpus': os.cpu_count(), 'threads': threads, 'profile': RENDER_PROFILE,
+	           'workloads': {}}
+	for name in workloads:
+		print('Running {}'.format(name))
+		kwargs = {'seed': seed} if size is None else {'seed': seed, 'size': size}
+		if name == 'profiles':
+			kwargs.update(profiles=profiles, threads=threads)
+		start = time.perf_counter()
+		results['workloads'][name] = WORKLOADS[name](**kwargs)
+		results['workloads'][name]['seconds'] = time.perf_counter() - start
+	return results
+
+
+def _buildings(size, seed):
+	"""
+	Function that generates the buildings of the benchmark one by one from the
+	random generators of the dataset samples, and removes every building once it is used.
+	The annotation of the dataset is written to a temporary folder removed at the end.
+	:param size: number of buildings, int
+	:param seed: run seed, int
+	:return: index and building, generator of (int, ComposedBuilding)
+	"""
+	with tempfile.TemporaryDirectory() as folder:
+		dataset = Dataset(size=size, seed=seed,
+		                  filename=os.path.join(folder, 'benchmark.json'))
+		for i in range(size):
+			building = dataset.build(sample_rng(seed, i))
+			yield i, building
+			building.demolish()
+		dataset.write()
+
+
+def _commit():
+	"""
+	Function that returns the git commit of the code being measured.
+	:return: hash of the commit, str or None outside of a git repository
+	"""
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=file_dir or None,
+		                               stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def _pixels(filename):
+	"""
+	Function that reads the pixels of an image.
+	:param filename: path of the image, str
+	:return: pixels, np.ndarray (height, width, channels), float32
+	"""
+	image = bpy.data.images.load(os.path.abspath(filename))
+	pixels = np.empty(len(image.pixels), dtype=np.float32)
+	image.pixels.foreach_get(pixels)
+	pixels = pixels.reshape(image.size[1], image.size[0], image.channels)
+	bpy.data.images.remove(image)
+	return pixels
+
+
+def _stats(times):
+	"""
+	Function that summarises the times of a workload.
+	:param times: times in seconds, list of float
+	:return: count, total, mean, min, p50, p90 and max, dict
+	"""
+	times = np.asarray(times, dtype=np.float64)
+	if not len(times):
+		return {'count': 0}
+	return {'count': len(times), 'total': float(times.sum()),
+	        'mean': float(times.mean()), 'min': float(times.min()),
+	        'p50': float(np.percentile(times, 50)),
+	        'p90': float(np.percentile(times, 90)), 'max': float(times.max())}
+
+
+def _remove_outputs(prefix):
+	"""
+	Function that removes the images written by the benchmark.
+	:param prefix: beginning of the names of the files to remove, str
+	:return:
+	"""
+	for folder in [IMG_SAVE, MASK_SAVE, DEPTH_SAVE, NORMAL_SAVE]:
+		if not os.path.isdir(folder):
+			continue
+		for filename in [x for x in os.listdir(folder) if x.startswith(prefix)]:
+			os.remove(os.path.join(folder, filename))
+
+
+WORKLOADS = {'volumes': volume_benchmark,
+             'typologies': typology_benchmark,
+             'modules': module_benchmark,
+             'profiles': profile_benchmark,
+             'render_mode': render_mode_benchmark,
+             'point_clouds': point_cloud_benchmark}
+
+
+if __name__ == '__main__':
+
+	argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+	parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+		USAGE: blender --background setup.blend --python benchmark.py -- volumes modules --seed 0
+
+		------------------------------------------------------------------------
+
+		This is an algorithm that times fixed, seeded workloads of the generator:
+		volumes, buildings of every typology, modules placed on the facades,
+		renders of every profile, the mask render mode and point clouds. The
+		results are written to a .json file to compare versions of the code.
+
+		------------------------------------------------------------------------
+
+		'''))
+	parser.add_argument('workloads', type=str, nargs='*',
+	                    help='workloads to run from {}, default all'.format(
+		                    ', '.join(WORKLOADS)))
+	parser.add_argument('--size', type=int, default=None,
+	                    help='size of every workload, default the size of the workload')
+	parser.add_argument('--seed', type=int, default=SEED, help='run seed')
+	parser.add_argument('--profiles', type=str, nargs='+', default=None,
+	                    choices=list(RENDER_PROFILES),
+	                    help='render profiles to compare in the profiles workload')
+	parser.add_argument('--threads', type=int, default=THREADS,
+	                    help='number of render threads, 0 - all the cores')
+	parser.add_argument('--out', type=str, default='benchmark.json',
+	                    help='path of the .json file to write the results to')
+	args = parser.parse_args(argv)
+
+	results = run(args.workloads or list(WORKLOADS), size=args.size, seed=args.seed,
+	              profiles=args.profiles, threads=args.threads)
+	with open(args.out, 'w') as f:
+		json.dump(results, f, indent=4)
+	print('Results written as {}'.format(args.out))
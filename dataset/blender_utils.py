@@ -54,20 +54,318 @@ def extrude(mesh, height, direction=-1):
 	bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY', center='BOUNDS')
 
 
+class BoundsCache:
+	"""
+	Class that caches the world axis aligned bounding boxes of objects. Local
+	bounds are kept per mesh, world bounds per object and recomputed only when
+	the transform of the object changes. The meshes are told apart by their
+	session uid, so a copy of a mesh gets its own bounds.
+	"""
+	def __init__(self, limit=100000):
+		"""
+		Class initialization
+		:param limit: number of meshes or objects to keep before the cache is
+		emptied, int
+		"""
+		self.limit = limit
+		self._local = {}  # mesh key -> local corners, np.ndarray (8, 3)
+		self._world = {}  # object pointer -> (mesh key, matrix, bounds)
+
+	def get(self, volume):
+		"""
+		Function that returns the world bounds of an object.
+		:param volume: object to get the bounds of, Blender object
+		:return: bounds, np.ndarray (2, 3), [[x_min, y_min, z_min],
+		                                     [x_max, y_max, z_max]]
+		"""
+		if len(self._local) > self.limit or len(self._world) > self.limit:
+			self._local.clear()  # together, the world bounds refer to the local ones
+			self._world.clear()
+		token = self._token(volume)
+		matrix = self._matrix(volume)
+		pointer = volume.as_pointer()
+		cached = self._world.get(pointer)
+		if cached is not None and cached[0] == token:
+			if np.array_equal(cached[1], matrix):
+				return cached[2]
+			if np.array_equal(cached[1][:3, :3], matrix[:3, :3]):
+				# only moved: shift the cached bounds
+				bounds = cached[2] + (matrix[:3, 3] - cached[1][:3, 3])
+				self._world[pointer] = (token, matrix, bounds)
+				return bounds
+		corners = self._local[token] @ matrix[:3, :3].T + matrix[:3, 3]
+		bounds = np.stack([corners.min(axis=0), corners.max(axis=0)])
+		self._world[pointer] = (token, matrix, bounds)
+		return bounds
+
+	def get_many(self, volumes):
+		"""
+		Function that returns the world bounds of several objects at once.
+		:param volumes: objects to get the bounds of, list of Blender objects
+		:return: bounds, np.ndarray (n, 2, 3)
+		"""
+		if not volumes:
+			return np.zeros((0, 2, 3))
+		return np.stack([self.get(v) for v in volumes])
+
+	def invalidate(self, volume=None):
+		"""
+		Function that drops the cached bounds after the mesh of an object was
+		edited in place.
+		:param volume: object to drop, Blender object, default None (all)
+		:return:
+		"""
+		if volume is None:
+			self._local.clear()
+			self._world.clear()
+			return
+		if volume.data is not None:
+			self._local.pop(_mesh_key(volume.data), None)
+		self._world.pop(volume.as_pointer(), None)
+
+	def _matrix(self, volume):
+		"""
+		Function that returns the world matrix of an object. Objects without a
+		parent use the matrix made from their location, rotation and scale, so
+		that the view layer does not have to be updated.
+		:param volume: Blender object
+		:return: matrix, np.ndarray (4, 4)
+		"""
+		if volume.parent is None:
+			return np.array(volume.matrix_basis)
+		bpy.context.view_layer.update()
+		return np.array(volume.matrix_world)
+
+	def _token(self, volume):
+		"""
+		Function that returns the key of the local bounds of the object mesh,
+		computing them the first time the mesh is seen.
+		:param volume: Blender object
+		:return: token, int
+		"""
+		data = volume.data
+		if data is None or not hasattr(data, 'vertices'):
+			token = ('bound_box', volume.name)
+			self._local[token] = np.array([list(v) for v in volume.bound_box])
+			return token
+		token = _mesh_key(data)
+		if token not in self._local:
+			vertices = np.empty(len(data.vertices) * 3, dtype=np.float32)
+			data.vertices.foreach_get('co', vertices)
+			vertices = vertices.reshape(-1, 3)
+			if len(vertices) == 0:
+				vertices = np.zeros((1, 3), dtype=np.float32)
+			low, high = vertices.min(axis=0), vertices.max(axis=0)
+			self._local[token] = np.array([[x, y, z] for x in (low[0], high[0])
+			                               for y in (low[1], high[1])
+			                               for z in (low[2], high[2])],
+			                              dtype=np.float64)
+		return token
+
+
+def _mesh_key(data):
+	"""
+	Function that returns the key of a mesh in the bounds cache: its session
+	uid, unique in a Blender session, or its pointer in Blender < 2.91.
+	:param data: mesh, Blender mesh
+	:return: key, tuple
+	"""
+	return ('mesh', getattr(data, 'session_uid', None), data.as_pointer())
+
+
+BOUNDS = BoundsCache()
+
+
+def get_bounds(volumes):
+	"""
+	Function that returns the world bounds of several meshes at once.
+	:param volumes: meshes to get the bounds of, list of Blender objects
+	:return: bounds, np.ndarray (n, 2, 3), min and max of every axis
+	"""
+	return BOUNDS.get_many(volumes)
+
+
+def get_triangles(objects):
+	"""
+	Function that returns the world triangles of the evaluated meshes of several
+	objects, with their modifiers applied.
+	:param objects: objects to get the triangles of, list of Blender objects
+	:return: corners of the triangles, np.ndarray (n, 3, 3), float64
+	"""
+	depsgraph = bpy.context.evaluated_depsgraph_get()
+	triangles = []
+	for _object in [x for x in objects if x.type == 'MESH']:
+		evaluated = _object.evaluated_get(depsgraph)
+		mesh = evaluated.to_mesh()
+		mesh.calc_loop_triangles()
+		vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+		mesh.vertices.foreach_get('co', vertices)
+		indices = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+		mesh.loop_triangles.foreach_get('vertices', indices)
+		matrix = np.array(evaluated.matrix_world)
+		vertices = vertices.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+		triangles.append(vertices[indices.reshape(-1, 3)])
+		evaluated.to_mesh_clear()
+	if not triangles:
+		return np.zeros((0, 3, 3))
+	return np.concatenate(triangles)
+
+
+def get_polygons(_object, surface=False):
+	"""
+	Function that returns the world vertices and the polygons of a mesh object
+	read at once from its data, without the modifiers.
+	:param _object: mesh object, Blender object
+	:param surface: also return the UVs and the normals, bool, default False
+	:return: vertices, np.ndarray (n, 3), float32
+	         number of vertices of every polygon, np.ndarray (m,), int32
+	         vertices of the polygons one after the other, np.ndarray (sum,), int32
+	         if surface, UVs of the vertices of the polygons (zeros without a
+	         UV layer), np.ndarray (sum, 2), float32
+	         and world normals of the polygons, np.ndarray (m, 3), float32
+	"""
+	mesh = _object.data
+	vertices, totals, loops, index, order = _polygons(mesh, _object.matrix_world)
+	if not surface:
+		return vertices, totals, loops
+	uvs = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+	if mesh.uv_layers.active is not None:
+		mesh.uv_layers.active.data.foreach_get('uv', uvs)
+	normals = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+	mesh.polygons.foreach_get('normal', normals)
+	matrix = np.linalg.inv(np.array(_object.matrix_world, dtype=np.float64)[:3, :3]).T
+	normals = normals.reshape(-1, 3)[order] @ matrix.T
+	normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+	return vertices, totals, loops, uvs.reshape(-1, 2)[index], normals.astype(np.float32)
+
+
+def merge_objects(objects, name='merged'):
+	"""
+	Function that joins the evaluated meshes of several objects into one mesh
+	object written at once from arrays. The instance id of every face is kept
+	in the 'inst_id' face attribute, read from the face attribute of the
+	source mesh or from the "inst_id" property of its object. Every pair of
+	material and instance id gets its own material slot whose material has the
+	instance id as pass index, so that the masks can be rendered from the
+	material index pass; a material shared by several instance ids is copied.
+	:param objects: objects to join, list of Blender objects
+	:param name: name of the new object, str, default 'merged'
+	:return: merged object, not linked to a collection, Blender object
+	"""
+	depsgraph = bpy.context.evaluated_depsgraph_get()
+	vertices, totals, loops, uvs, ids, slots = [], [], [], [], [], []
+	materials, pairs, offset = [], {}, 0
+	for _object in [x for x in objects if x.type == 'MESH']:
+		evaluated = _object.evaluated_get(depsgraph)
+		mesh = evaluated.to_mesh()
+		_vertices, _totals, _loops, index, order = _polygons(mesh, evaluated.matrix_world)
+		uv = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+		if mesh.uv_layers.active is not None:
+			mesh.uv_layers.active.data.foreach_get('uv', uv)
+		_ids = np.full(len(mesh.polygons), _object.get('inst_id', 0), dtype=np.int32)
+		attribute = mesh.attributes.get('inst_id')
+		if attribute is not None and attribute.domain == 'FACE':
+			attribute.data.foreach_get('value', _ids)
+		_slots = np.empty(len(mesh.polygons), dtype=np.int32)
+		mesh.polygons.foreach_get('material_index', _slots)
+		_slots, _ids = _slots[order], _ids[order]
+		source = [x.material for x in evaluated.material_slots] or [None]
+		_slots = np.minimum(_slots, len(source) - 1)
+		for slot, inst_id in sorted(set(zip(_slots.tolist(), _ids.tolist()))):
+			if (source[slot], inst_id) not in pairs:
+				pairs[(source[slot], inst_id)] = len(materials)
+				materials.append(_material(source[slot], inst_id, materials))
+		lookup = np.array([[pairs.get((x, y), 0) for y in range(_ids.max() + 1)]
+		                   for x in source], dtype=np.int32) if len(_ids) else None
+		vertices.append(_vertices)
+		totals.append(_totals)
+		loops.append(_loops + offset)
+		uvs.append(uv.reshape(-1, 2)[index])
+		ids.append(_ids)
+		if lookup is not None:
+			slots.append(lookup[_slots, _ids])
+		offset += len(_vertices)
+		evaluated.to_mesh_clear()
+
+	vertices, totals, loops = [np.concatenate(x) if x else np.zeros(0) for x in
+	                           [vertices, totals, loops]]
+	data = bpy.data.meshes.new(name)
+	data.vertices.add(len(vertices))
+	data.vertices.foreach_set('co', vertices.astype(np.float32).ravel())
+	data.loops.add(len(loops))
+	data.loops.foreach_set('vertex_index', loops.astype(np.int32))
+	data.polygons.add(len(totals))
+	data.polygons.foreach_set('loop_start', (np.cumsum(totals) - totals).astype(np.int32))
+	data.polygons.foreach_set('loop_total', totals.astype(np.int32))
+	if slots:
+		data.polygons.foreach_set('material_index', np.concatenate(slots))
+		data.attributes.new('inst_id', 'INT', 'FACE').data.foreach_set(
+			'value', np.concatenate(ids))
+		data.uv_layers.new(name='UVMap').data.foreach_set(
+			'uv', np.concatenate(uvs).astype(np.float32).ravel())
+	for material in materials:
+		data.materials.append(material)
+	data.update()
+	return bpy.data.objects.new(name, data)
+
+
+def _material(material, inst_id, materials):
+	"""
+	Function that returns the material of the faces of one instance id, with
+	the instance id as pass index.
+	:param material: material of the faces, Blender material or None
+	:param inst_id: instance id of the faces, int
+	:param materials: materials already given to other instance ids, list
+	:return: material, Blender material
+	"""
+	if material is None:
+		name = 'inst_{}'.format(inst_id)
+		material = bpy.data.materials.get(name) or bpy.data.materials.new(name)
+	elif material in materials:
+		material = material.copy()
+		material.use_fake_user = False  # removed with the building
+	material.pass_index = inst_id
+	return material
+
+
+def _polygons(mesh, matrix):
+	"""
+	Function that reads the world vertices and the polygons of a mesh.
+	:param mesh: mesh, Blender mesh
+	:param matrix: world matrix of its object, Matrix
+	:return: vertices, np.ndarray (n, 3), float32
+	         number of vertices of every polygon, np.ndarray (m,), int32
+	         vertices of the polygons one after the other, np.ndarray (sum,), int32
+	         loops of the polygons one after the other, np.ndarray (sum,)
+	         order of the polygons, np.ndarray (m,)
+	"""
+	vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+	mesh.vertices.foreach_get('co', vertices)
+	totals = np.empty(len(mesh.polygons), dtype=np.int32)
+	mesh.polygons.foreach_get('loop_total', totals)
+	starts = np.empty(len(mesh.polygons), dtype=np.int32)
+	mesh.polygons.foreach_get('loop_start', starts)
+	loops = np.empty(len(mesh.loops), dtype=np.int32)
+	mesh.loops.foreach_get('vertex_index', loops)
+	matrix = np.array(matrix, dtype=np.float32)
+	vertices = vertices.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+	# the loops of a polygon are contiguous but the polygons may be in any order
+	order = np.argsort(starts, kind='stable')
+	totals, starts = totals[order], starts[order]
+	index = np.repeat(starts - np.cumsum(totals) + totals, totals) + np.arange(totals.sum())
+	return vertices, totals, loops[index], index, order
+
+
 def get_min_max(volume, axis):
 	"""
-	Function that returns limits of a mesh on the indicated axis. Only applied
-	to objects that are not rotated or rotated to 90 degrees
+	Function that returns limits of a mesh on the indicated axis.
 	:param volume: volume to get the dims of, mesh
 	:param axis: int, 0 - width; 1 - length; 2 - height
 	:return: min, max, float
 	"""
-	bpy.context.view_layer.update()
-	bb_vertices = [Vector(v) for v in volume.bound_box]
-	mat = volume.matrix_world
-	world_bb_vertices = [mat @ v for v in bb_vertices]
-	return min([x[axis:axis+1][0] for x in world_bb_vertices]), \
-	       max([x[axis:axis+1][0] for x in world_bb_vertices])
+	bounds = BOUNDS.get(volume)
+	return float(bounds[0, axis]), float(bounds[1, axis])
+
 
 def gancio(v1, v2, axis, border1=0, border2=0):
 	"""
@@ -81,8 +379,7 @@ def gancio(v1, v2, axis, border1=0, border2=0):
 	:return:
 	"""
 	mapping = {0: -1, 1: 1}
-	coords1 = [get_min_max(v1.mesh, 0), get_min_max(v1.mesh, 1)]
-	coords2 = [get_min_max(v2.mesh, 0), get_min_max(v2.mesh, 1)]
+	coords1, coords2 = get_bounds([v1.mesh, v2.mesh])[:, :, :2].transpose(0, 2, 1)
 
 	v2.mesh.location[axis] = coords1[axis][border1] + \
 	                         (0.5 * np.diff(coords2[axis]) * mapping[border1])
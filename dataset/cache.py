@@ -0,0 +1,139 @@
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import sys
+import tempfile
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+import dataset_config
+from dataset_config import CACHE_DIR, CACHE_VERSION
+
+
+# Stages of a sample, the stages they are computed from and the values of
+# dataset_config that change their result
+STAGES = {'layout': ([], ['MIN_HEIGHT', 'MIN_WIDTH', 'MIN_LENGTH', 'MAX_HEIGHT',
+                          'MAX_WIDTH', 'MAX_LENGTH', 'MAX_VOLUMES', 'BUILDINGS',
+                          'VALIDITY_TOLERANCE', 'VALIDITY_OVERLAP',
+                          'VALIDITY_ATTEMPTS']),
+          'mesh': (['layout'], ['use_materials', 'MATERIAL_PROB', 'use_modules',
+                                'MODULES', 'MODULE_BATCH', 'GEOMETRY',
+                                'MERGE_BUILDING']),
+          'obj': (['mesh'], []),
+          'cloud': (['mesh'], ['POINTS']),
+          'render': (['mesh'], ['IMAGE_SIZE', 'ENGINE', 'RENDER_OUTPUTS',
+                                'RENDER_FORMAT'])}
+
+
+class StageCache:
+	"""
+	Class that stores the outputs of every stage of a sample under a key hashed
+	from the inputs of the stage: the keys of the stages it is computed from
+	and the configuration values it depends on. A stage whose key is in the
+	cache is restored instead of computed.
+	"""
+	def __init__(self, folder=CACHE_DIR, version=CACHE_VERSION):
+		"""
+		Class initialization
+		:param folder: folder of the cache, str, default CACHE_DIR
+		:param version: version of the code, change it to invalidate the cache,
+		int, default CACHE_VERSION
+		"""
+		self.folder = folder if os.path.isabs(folder) else os.path.join(file_dir, folder)
+		self.version = version
+
+	def has(self, stage, key):
+		"""
+		Function that checks whether the outputs of a stage are cached.
+		:param stage: name of the stage, str
+		:param key: key of the stage, str
+		:return: bool
+		"""
+		return os.path.isfile(os.path.join(self._entry(stage, key), 'done'))
+
+	def keys(self, seed, index, extra=None):
+		"""
+		Function that computes the keys of all the stages of a sample.
+		:param seed: run seed, int
+		:param index: index of the sample, int
+		:param extra: other inputs of the stages that are not in dataset_config,
+		dict stage -> dict, default None
+		:return: keys, dict stage -> str
+		"""
+		extra = extra or {}
+		keys = {}
+		for stage, (parents, config) in STAGES.items():
+			inputs = {'stage': stage, 'version': self.version,
+			          'parents': [keys[x] for x in parents],
+			          'config': {x: getattr(dataset_config, x) for x in config},
+			          'extra': extra.get(stage)}
+			if not parents:
+				inputs['sample'] = [seed, index]
+			keys[stage] = hashlib.sha1(json.dumps(inputs, sort_keys=True,
+			                                      default=str).encode()).hexdigest()
+		return keys
+
+	def load(self, stage, key, name):
+		"""
+		Function that reads data stored with a stage.
+		:param stage: name of the stage, str
+		:param key: key of the stage, str
+		:param name: name of the data, str
+		:return: data, np.ndarray or json object
+		"""
+		path = os.path.join(self._entry(stage, key), name)
+		if os.path.isfile(path + '.npy'):
+			return np.load(path + '.npy')
+		with open(path + '.json', 'r') as f:
+			return json.load(f)
+
+	def restore(self, stage, key, files):
+		"""
+		Function that puts the cached files of a stage to their locations. Files
+		the stage did not write are skipped.
+		:param stage: name of the stage, str
+		:param key: key of the stage, str
+		:param files: paths to restore the files to, list of str
+		:return:
+		"""
+		entry = self._entry(stage, key)
+		for path in files:
+			if not os.path.isfile(os.path.join(entry, os.path.basename(path))):
+				continue
+			os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+			shutil.copyfile(os.path.join(entry, os.path.basename(path)), path)
+
+	def store(self, stage, key, files=(), data=None):
+		"""
+		Function that stores the outputs of a stage. The entry is written to a
+		temporary folder and moved in place once it is complete. The files are
+		copied, not linked, so that outputs written again in place do not
+		change the cache.
+		:param stage: name of the stage, str
+		:param key: key of the stage, str
+		:param files: output files of the stage, list of str
+		:param data: data of the stage, dict name -> np.ndarray or json object
+		:return:
+		"""
+		entry = self._entry(stage, key)
+		os.makedirs(os.path.dirname(entry), exist_ok=True)
+		tmp = tempfile.mkdtemp(dir=os.path.dirname(entry))
+		for path in files:
+			shutil.copyfile(path, os.path.join(tmp, os.path.basename(path)))
+		for name, value in (data or {}).items():
+			if isinstance(value, np.ndarray):
+				np.save(os.path.join(tmp, name + '.npy'), value)
+			else:
+				with open(os.path.join(tmp, name + '.json'), 'w') as f:
+					json.dump(value, f)
+		with open(os.path.join(tmp, 'done'), 'w') as f:
+			f.write(key)
+		if os.path.isdir(entry):
+			shutil.rmtree(entry)
+		os.replace(tmp, entry)
+
+	def _entry(self, stage, key):
+		return os.path.join(self.folder, stage, key[:2], key)
@@ -1,74 +1,331 @@
+import argparse
 import bpy, bmesh
 from datetime import datetime
 from math import ceil, radians
 import numpy as np
 import os
-import random
 import sys
+import textwrap
 
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
-from annotation import Annotation
+from annotation import Annotation, StreamingAnnotation
 from blender_utils import extrude, gancio, get_min_max
+from cache import STAGES, StageCache
 from dataset_config import *
 from generator import BuildingFactory
+from manifest import Manifest
 from material import MaterialFactory
 from module import *
-from point_cloud import PointCloud
+from point_cloud import PointCloud, write_ply
+from profiler import Profiler
 from renderer import Renderer
+from seeding import get_rng, sample_rng, sample_seed
 from shp2obj import Collection, deselect_all
+from storage import ShardWriter
 
 
 class Dataset:
-	def __init__(self):
+	def __init__(self, start=0, size=SIZE, seed=None, filename=None,
+	             render_mode=RENDER_MODE, profile=RENDER_PROFILE, threads=THREADS,
+	             cache=CACHE):
+		"""
+		Class initialization
+		:param start: index of the first sample to generate, int, default 0
+		:param size: number of samples to generate, int, default SIZE
+		:param seed: run seed, every sample is generated from its own seed derived
+		from it, int, default None (SEED)
+		:param filename: name of the .json annotation, str, default None
+		(dataset name)
+		:param render_mode: 'full' - all the render outputs, 'mask' - only the
+		masks with the fast render settings, str, default RENDER_MODE
+		:param profile: name of the render profile, str, default RENDER_PROFILE
+		:param threads: number of render threads, 0 - all the cores, int,
+		default THREADS
+		:param cache: restore the stages of a sample whose inputs did not change
+		from the stage cache, bool, default CACHE
+		"""
 		self.name = 'Building_dataset_{}_{}_{}'.format(datetime.now().year,
 		                                               datetime.now().month,
 		                                               datetime.now().day)
-		self.size = SIZE
-		self.json = Annotation()
-		self.factory = BuildingFactory()
-		self.material_factory = MaterialFactory()
+		self.filename = filename or self.name + '.json'
+		self.start = start
+		self.size = size
+		self.seed = SEED if seed is None else seed
+		self.render_mode = render_mode
+		self.profile = profile
+		self.threads = threads
+		if ANNOTATION_STREAM:
+			self.json = StreamingAnnotation(os.path.splitext(self.filename)[0] + '.jsonl')
+		else:
+			self.json = Annotation()
+			if os.path.isfile(self.filename):  # the records of the completed samples
+				self.json.load(self.filename)
+		self.manifest = Manifest(os.path.splitext(self.filename)[0] + '.manifest.jsonl')
+		self.storage = None
+		if STORAGE == 'shards':
+			self.storage = ShardWriter(os.path.splitext(self.filename)[0] + '_storage')
+		self.profiler = Profiler(os.path.splitext(self.filename)[0] + '.profile.jsonl')
+		self.cache = StageCache() if cache else None
 
-	def populate(self):
-		for i in range(self.size):
-			building = self.factory.produce()
+	def build(self, rng=None):
+		"""
+		Function that produces a building with its materials and modules.
+		:param rng: random generator of the sample, np.random.Generator,
+		default None (unseeded)
+		:return: building, ComposedBuilding
+		"""
+		rng = get_rng(rng)
+		material_factory = MaterialFactory(rng)
+		with self.profiler.stage('produce'):
+			building = BuildingFactory(rng).produce()
+		with self.profiler.stage('make'):
 			building.make()
-			if use_materials:
-				_monomaterial = np.random.random() < MATERIAL_PROB
-				mat = self.material_factory.produce()
-				print(mat.name)
-				for v in building.volumes:
+		if use_materials:
+			_monomaterial = rng.random() < MATERIAL_PROB
+			mat = material_factory.produce()
+			print(mat.name)
+			for v in building.volumes:
+				with self.profiler.stage('materials'):
 					if not _monomaterial:
-						mat = self.material_factory.produce()
+						mat = material_factory.produce()
 					v.apply(mat)
 
-					for module_name in MODULES:
-						for side in range(2):
-							mod = GridApplier(ModuleFactory().mapping[module_name])
+				for module_name in MODULES:
+					for side in range(2):
+						with self.profiler.stage('modules'):
+							if MODULE_BATCH:
+								mod = BatchGridApplier(ModuleFactory().mapping[module_name])
+							else:
+								mod = GridApplier(ModuleFactory().mapping[module_name])
 							module = ModuleFactory().produce(module_name)
 							module.connect(v, side)
-							step = (np.random.randint(ceil(module.scale[0]), 6),
-							        np.random.randint(ceil(module.scale[0]), 6))
+							step = (int(rng.integers(ceil(module.scale[0]), 6)),
+							        int(rng.integers(ceil(module.scale[0]), 6)))
 							mod.apply(module, step=step, offset=(2.0, 2.0, 2.0, 1.0))
+		return building
+
+	def populate(self):
+		for i in range(self.start, self.start + self.size):
+			keys = self.cache.keys(self.seed, i, self._extra()) if self.cache else None
+			if self.manifest.done(i, keys=keys) and self._recorded(i):
+				continue
+			self.manifest.start(i, sample_seed(self.seed, i))
+			self.profiler.start(i)
+
+			hits = {x: self.cache is not None and self.cache.has(x, keys[x])
+			        for x in STAGES}
+			if hits['mesh'] and hits['obj'] and hits['render']:
+				# nothing to do in Blender, the outputs are copied from the cache
+				with self.profiler.stage('restore'):
+					record = self.cache.load('render', keys['render'], 'record')
+					self.cache.restore('render', keys['render'], self._images(i))
+					self.cache.restore('obj', keys['obj'], self._models(i))
+					triangles = None
+					if not hits['cloud']:
+						triangles = self.cache.load('mesh', keys['mesh'], 'triangles')
+				counts = {}
+			else:
+				record, triangles, counts = self._generate(i, keys, hits)
+			with self.profiler.stage('point_cloud'):
+				points, normals = self._point_cloud(i, triangles, keys, hits)
+				if self.storage is not None:
+					self.storage.add(i, points, normals, record)
+			with self.profiler.stage('commit'):
+				self.json.commit(record)  # only once all the outputs are written
+				self.manifest.complete(i, self._outputs(i), keys,
+				                       self.storage.files() if self.storage else ())
+			self.profiler.end(counts)
+
+	def _generate(self, index, keys=None, hits=None):
+		"""
+		Function that generates a sample in Blender. The stages found in the
+		cache are restored instead of computed, the others are stored in it.
+		:param index: index of the sample, int
+		:param keys: cache keys of the stages of the sample, dict, default None
+		:param hits: whether the stages are in the cache, dict, default None
+		:return: annotation of the sample, dict
+		         world triangles of the building, np.ndarray (n, 3, 3)
+		         datablock counts after the sample, dict
+		"""
+		hits = hits or {}
+		building = self.build(sample_rng(self.seed, index))
+		if hits.get('render'):
+			with self.profiler.stage('restore'):
+				record = self.cache.load('render', keys['render'], 'record')
+				self.cache.restore('render', keys['render'], self._images(index))
+		else:
+			with self.profiler.stage('annotation'):
+				record = self.json.make(building, '{}.png'.format(index),
+				                        '{}.obj'.format(index))
+		if MERGE_BUILDING:
+			# after the annotation, which reads the materials of the volumes
+			with self.profiler.stage('merge'):
+				building.merge()
+		if not hits.get('render'):
+			with self.profiler.stage('render'):
+				renderer = Renderer(mode=0, render_mode=self.render_mode,
+				                    profile=self.profile, threads=self.threads)
+				renderer.render(filename='building_{}'.format(index))
+			if self.cache is not None:
+				self.cache.store('render', keys['render'], self._images(index),
+				                 {'record': record})
+		with self.profiler.stage('save'):
+			if hits.get('obj'):
+				self.cache.restore('obj', keys['obj'], self._models(index))
+			else:
+				building.save(index)
+				if self.cache is not None:
+					self.cache.store('obj', keys['obj'], [x for x in self._models(index)
+					                                      if os.path.isfile(x)])
+		with self.profiler.stage('triangles'):
+			triangles = building.triangles()
+			if self.cache is not None and not hits.get('mesh'):
+				self.cache.store('mesh', keys['mesh'], data={'triangles': triangles})
+		with self.profiler.stage('demolish'):
+			counts = building.demolish()
+		return record, triangles, counts
+
+	def _point_cloud(self, index, triangles, keys=None, hits=None):
+		"""
+		Function that samples the point cloud of a sample, or restores it from
+		the cache. The points are drawn from their own random stream, so they do
+		not depend on whether the building was generated or restored.
+		:param index: index of the sample, int
+		:param triangles: world triangles of the building, np.ndarray (n, 3, 3)
+		:param keys: cache keys of the stages of the sample, dict, default None
+		:param hits: whether the stages are in the cache, dict, default None
+		:return: points, normals, np.ndarray (POINTS, 3)
+		"""
+		if hits and hits.get('cloud'):
+			cloud = self.cache.load('cloud', keys['cloud'], 'cloud')
+			points, normals = cloud[:, :3], cloud[:, 3:]
+			if self.storage is None:
+				write_ply(self._cloud(index), points, normals)
+			return points, normals
+		points, normals = PointCloud().make(index, triangles, save=self.storage is None,
+		                                    rng=sample_rng(self.seed, index, 1))
+		if self.cache is not None:
+			self.cache.store('cloud', keys['cloud'],
+			                 data={'cloud': np.hstack([points, normals])})
+		return points, normals
+
+	def _recorded(self, index):
+		"""
+		Function that checks whether the annotation has the record of a sample.
+		The streamed records are on disk before the sample is complete; without
+		streaming, the records of a run that did not reach write are lost.
+		:param index: index of the sample, int
+		:return: bool
+		"""
+		return ANNOTATION_STREAM or self.json.has('{}.obj'.format(index))
+
+	def _extra(self):
+		"""
+		Function that returns the inputs of the stages that are arguments of
+		the run rather than values of dataset_config.
+		:return: inputs of the stages, dict stage -> dict
+		"""
+		# no profile keeps the render settings of setup.blend
+		return {'render': {'render_mode': self.render_mode, 'profile': self.profile,
+		                   'settings': RENDER_PROFILES.get(self.profile)}}
+
+	def _images(self, index):
+		"""
+		Function that returns the paths of the images rendered for a sample.
+		:param index: index of the sample, int
+		:return: paths, list of str
+		"""
+		if RENDER_OUTPUTS and RENDER_FORMAT == 'OPEN_EXR_MULTILAYER' and \
+				self.render_mode != 'mask':
+			return ['{}/building_{}.exr'.format(IMG_SAVE, index)]
+		images = {'rgb': '{}/building_{}.png'.format(IMG_SAVE, index),
+		          'mask': '{}/building_{}_mask.png'.format(MASK_SAVE, index),
+		          'depth': '{}/building_{}_depth.png'.format(DEPTH_SAVE, index),
+		          'normal': '{}/building_{}_normal.png'.format(NORMAL_SAVE, index)}
+		if self.render_mode == 'mask':
+			return [images['mask']]
+		return [images[x] for x in RENDER_OUTPUTS or ['rgb', 'mask']]
 
-			self.json.add(building, '{}.png'.format(i), '{}.obj'.format(i))
-			# building.save(filename=str(i))
-			renderer = Renderer(mode=0)
-			renderer.render(filename='building_{}'.format(i))
-			building.save(i)
-			building.save(i, ext='ply')
-			building.demolish()
-			cloud = PointCloud()
-			cloud.make(i)
+	def _models(self, index):
+		"""
+		Function that returns the paths of the model files of a sample.
+		:param index: index of the sample, int
+		:return: .obj and .mtl paths, list of str
+		"""
+		return ['{}/{}/{}.{}'.format(file_dir, MODEL_SAVE, index, x) for x in
+		        ['obj', 'mtl']]
 
+	def _cloud(self, index):
+		return '{}/{}/{}.ply'.format(file_dir, CLOUD_SAVE, index)
+
+	def _outputs(self, index):
+		"""
+		Function that returns the paths of the files written for a sample.
+		:param index: index of the sample, int
+		:return: paths, list of str
+		"""
+		outputs = self._models(index)[:1]
+		if self.storage is None:
+			outputs.append(self._cloud(index))
+		return outputs + self._images(index)
 
 	def write(self):
-		self.json.write(self.name + '.json')
+		"""
+		Function that writes the annotation of the generated samples.
+		:return:
+		"""
+		self.json.write(self.filename)
+		if ANNOTATION_STREAM:
+			self.json.close()
+		self.manifest.close()
+		if self.storage is not None:
+			self.storage.close()
+		self.profiler.close()
 
 
 if __name__ == '__main__':
-	d = Dataset()
+
+	start, size, seed, annotation, render_mode = 0, SIZE, None, None, RENDER_MODE
+	profile, threads = RENDER_PROFILE, THREADS
+
+	if '--' in sys.argv:
+		argv = sys.argv[sys.argv.index('--') + 1:]
+		parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+			USAGE: blender --background setup.blend --python dataset.py -- --start 0 --size 10
+
+			------------------------------------------------------------------------
+
+			This is an algorithm that generates a range of the synthetic dataset.
+			Used by parallel.py to run one shard per Blender process.
+
+			------------------------------------------------------------------------
+
+			'''))
+		parser.add_argument('--start', type=int, default=0,
+		                    help='index of the first sample to generate')
+		parser.add_argument('--size', type=int, default=SIZE,
+		                    help='number of samples to generate')
+		parser.add_argument('--seed', type=int, default=None,
+		                    help='run seed')
+		parser.add_argument('--annotation', type=str, default=None,
+		                    help='path of the .json annotation to write')
+		parser.add_argument('--render_mode', type=str, default=RENDER_MODE,
+		                    choices=['full', 'mask'],
+		                    help='full - all the render outputs, mask - only the masks')
+		parser.add_argument('--profile', type=str, default=RENDER_PROFILE,
+		                    choices=list(RENDER_PROFILES),
+		                    help='render profile')
+		parser.add_argument('--threads', type=int, default=THREADS,
+		                    help='number of render threads, 0 - all the cores')
+		args = parser.parse_args(argv)
+		start, size, seed, annotation = args.start, args.size, args.seed, \
+		                                args.annotation
+		render_mode, profile, threads = args.render_mode, args.profile, args.threads
+
+	d = Dataset(start=start, size=size, seed=seed, filename=annotation,
+	            render_mode=render_mode, profile=profile, threads=threads)
 	d.populate()
 	d.write()
 
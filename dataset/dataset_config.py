@@ -30,4 +30,67 @@ IMG_SAVE = 'Images'
 MASK_SAVE = 'Masks'
 CLOUD_SAVE = 'PointCloud'
 
-ENGINE = 'CYCLES'
\ No newline at end of file
+ENGINE = 'CYCLES'
+
+# Sharded generation (parallel.py)
+BLENDER = 'blender'  # path to the blender executable used for the workers
+WORKERS = 4  # number of Blender processes running at the same time
+SEED = 0  # run seed, every sample gets its own SeedSequence from it and its index
+SHARD_RETRIES = 2  # number of times a failed shard is restarted
+
+GEOMETRY = 'numpy'  # how volumes are built: 'numpy' - arrays pushed in one call,
+# 'ops' - Blender operators
+
+MODULE_BATCH = 'instance'  # how the modules of a facade are placed: 'instance' -
+# linked duplicates, 'merge' - one mesh per facade, None - one module at a time
+MERGE_BUILDING = False  # join the volumes and the modules of a building into one
+# mesh before it is rendered, saved and sampled; the masks are rendered from
+# the material index pass
+
+ANNOTATION_STREAM = True  # write every annotation record to a .jsonl file as it
+# is produced, a crashed run is resumed from the last record
+ANNOTATION_FSYNC = 100  # number of records between two flushes to disk
+
+MATERIAL_CACHE_SIZE = 64  # material copies kept before unused ones are removed
+IMAGE_CACHE_SIZE = 32  # texture images kept before unused ones are removed
+
+RENDER_OUTPUTS = ['rgb', 'mask', 'depth', 'normal']  # outputs written by one
+# render through a File Output node, [] to save the render result and the
+# viewer node separately
+RENDER_FORMAT = 'PNG'  # 'PNG' - one file per output, 'OPEN_EXR_MULTILAYER' -
+# one file per sample with a layer per output
+DEPTH_SAVE = 'Depth'
+NORMAL_SAVE = 'Normals'
+RENDER_MODE = 'full'  # 'full' - every render output with ENGINE, 'mask' - only
+# the masks, rendered with one Cycles sample without bounces
+
+# Cycles render profiles: samples, adaptive sampling threshold (0 - off), tile
+# size in pixels, denoiser (None - off) and maximum number of light bounces
+RENDER_PROFILES = {'draft': {'samples': 16, 'adaptive_threshold': 0.1, 'tile': 64,
+                             'denoiser': 'OPENIMAGEDENOISE', 'max_bounces': 2},
+                   'train': {'samples': 64, 'adaptive_threshold': 0.05, 'tile': 64,
+                             'denoiser': 'OPENIMAGEDENOISE', 'max_bounces': 4},
+                   'hero': {'samples': 512, 'adaptive_threshold': 0.01, 'tile': 32,
+                            'denoiser': 'OPENIMAGEDENOISE', 'max_bounces': 12}}
+RENDER_PROFILE = 'train'  # profile applied by the renderer, None - keep the
+# settings of setup.blend
+THREADS = 0  # render threads of one Blender process, 0 - all the cores (or the
+# cores divided by WORKERS in parallel.py)
+
+STORAGE = None  # None - one .ply file per point cloud, 'shards' - point clouds
+# and labels in memory-mapped shards next to the annotation (storage.py)
+STORAGE_SHARD = 4096  # number of samples per shard
+
+PROFILE = True  # write the wall and CPU time of every stage of every sample to
+# <annotation>.profile.jsonl and a summary with percentiles at the end of a run
+
+CACHE = False  # keep the outputs of every stage of a sample (layout, mesh, obj,
+# point cloud, render) under a hash of their inputs, a run again only computes
+# the stages whose inputs changed
+CACHE_DIR = '.cache'
+CACHE_VERSION = 2  # change to invalidate the cache after a change of the code
+
+VALIDITY_TOLERANCE = 0.01  # largest gap between two volumes in contact
+VALIDITY_OVERLAP = 0.9  # largest share of a volume inside another one
+VALIDITY_ATTEMPTS = 10  # number of times an invalid layout is drawn again, 0 - off
+VALIDITY_CHUNK = 65536  # number of buildings checked at once
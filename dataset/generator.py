@@ -3,22 +3,23 @@ from math import radians
 import numpy as np
 import os
 
-import random
 import sys
 
-sys.path.append("D:\ProgramFiles\Anaconda\envs\py37\Lib\site-packages")
-from pyntcloud import PyntCloud
-
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
-from blender_utils import extrude, gancio, get_min_max
+from blender_utils import extrude, gancio, get_bounds, get_min_max, get_polygons, \
+	get_triangles, merge_objects
 from dataset_config import *
+from layout import *
+from lifecycle import SceneManager
 from material import Material
 from module import *
 from point_cloud import PointCloud
 from renderer import Renderer
-from shp2obj import Collection, deselect_all
+from seeding import get_rng, sample_rng
+from shp2obj import Collection, deselect_all, write_mtl, write_obj
+from validity import resample
 from volume import *
 
 
@@ -26,8 +27,13 @@ class BuildingFactory:
 	"""
 	Factory that produces volumes.
 	"""
-	def __init__(self):
-
+	def __init__(self, rng=None):
+		"""
+		Class initialization
+		:param rng: random generator of the sample, np.random.Generator,
+		default None (unseeded)
+		"""
+		self.rng = get_rng(rng)
 		self.mapping = {'Patio': (Patio, 4),
 			            'L': (LBuilding, 2),
 			            'C': (CBuilding, 3),
@@ -48,19 +54,39 @@ class BuildingFactory:
 			assert name in list(self.mapping.keys()), "{} building typology " \
 			                                          "does not exist".format(name)
 		else:
-			name = np.random.choice(list(self.mapping.keys()))
-		_volumes = CollectionFactory().produce(number=self.mapping[name][1]).collection
-		return self.mapping[name][0](_volumes)
+			name = self.rng.choice(list(self.mapping.keys()))
+		_volumes = CollectionFactory(self.rng).produce(number=self.mapping[name][1]).collection
+		building = self.mapping[name][0](_volumes)
+		building.rng = self.rng
+		building.typology = name
+		return building
+
+	def realise(self, layout):
+		"""
+		Function that creates the meshes of a building planned without Blender.
+		:param layout: layout of the building, BuildingLayout
+		:return: building, ComposedBuilding
+		"""
+		building = ComposedBuilding([])
+		building.realise(layout)
+		return building
 
 
 class ComposedBuilding:
 	"""
 	Class that represents a building composed of one or several volumes.
 	"""
+	layout_type = BuildingLayout
+
 	def __init__(self, volumes):
 		assert isinstance(volumes, list), "Expected volumes as list," \
 		                                  " got {}".format(type(volumes))
 		self.volumes = volumes
+		self.layout = None
+		self.rng = None  # random generator of the layout, set by BuildingFactory
+		self.typology = None  # name in BuildingFactory.mapping, set by BuildingFactory
+		self.mesh = None  # single object of the building, set by merge
+		self.bb = None  # bounding box of the volumes, kept by merge
 
 	# def demolish(self):
 	# 	for v in self.volumes:
@@ -72,36 +98,85 @@ class ComposedBuilding:
 	# 			pass
 
 	def demolish(self):
-		for _mesh in bpy.data.collections['Building'].objects:
-			try:
-				deselect_all()
-				_mesh.select_set(True)
-				bpy.ops.object.delete()
-			except Exception:
-				pass
+		"""
+		Function that removes the building from the scene together with the
+		datablocks it leaves behind. The compositor mask tree is kept for the
+		next building.
+		:return: datablock counts after the cleaning, dict
+		"""
+		return SceneManager().demolish(compositor=False)
+
+	def triangles(self):
+		"""
+		Function that returns the world triangles of the building, its volumes
+		and modules.
+		:return: corners of the triangles, np.ndarray (n, 3, 3)
+		"""
+		return get_triangles(list(bpy.data.collections[SceneManager().collection].all_objects))
 
 	def get_bb(self):
 		"""
 		Function that gets the bounding box of the Building
 		:return: bounding box, list of float
-		[width_from, height_from, width_to, height_to]
+		[width_from, width_to, length_from, length_to]
+		"""
+		if self.bb is not None:
+			return self.bb
+		bounds = get_bounds([v.mesh for v in self.volumes])
+		x_min, y_min = bounds[:, 0, :2].min(axis=0)
+		x_max, y_max = bounds[:, 1, :2].max(axis=0)
+		return [round(float(x_min), 3), round(float(x_max), 3),
+		        round(float(y_min), 3), round(float(y_max), 3)]
+
+	def merge(self):
+		"""
+		Function that joins the volumes and the modules of the building into one
+		mesh object, so that one object is rendered, exported and sampled instead
+		of the volumes and the hundreds of modules nested in their collections.
+		The instance ids of the volumes and the modules are kept in the 'inst_id'
+		face attribute and as the pass index of the materials (see
+		blender_utils.merge_objects), from which the masks are rendered.
+		:return: merged object, Blender object
 		"""
-		x_min, y_min, x_max, y_max = list(get_min_max(self.volumes[0].mesh, 0)) + \
-		                             list(get_min_max(self.volumes[0].mesh, 1))
-		for v in self.volumes[1:]:
-			_bb = list(get_min_max(v.mesh, 0)) + \
-			      list(get_min_max(v.mesh, 1))
-			x_min, y_min = min(_bb[0], x_min), min(_bb[1], y_min)
-			x_max, y_max = max(_bb[2], x_max), max(_bb[3], y_max)
-		return [round(x_min, 3), round(y_min, 3), round(x_max, 3),
-		        round(y_max, 3)]
+		self.bb = self.get_bb()
+		manager = SceneManager()
+		collection = bpy.data.collections[manager.collection]
+		self.mesh = merge_objects(list(collection.all_objects), 'building')
+		manager.clear()
+		collection.objects.link(self.mesh)
+		return self.mesh
 
 	def make(self):
 		"""
-		Function that composes the building based on its typology.
+		Function that composes the building based on its typology: the layout is
+		planned without Blender, planned again while its volumes go into each
+		other or float apart (see validity.check), and then realised as meshes.
 		:return:
 		"""
-		self._correct_volumes()
+		self.layout = self.layout_type([VolumeLayout.from_volume(v) for v in
+		                                self.volumes], self.rng).make()
+		factory = LayoutFactory(self.rng)
+		if self.typology in factory.mapping:  # same draws as LayoutFactory.produce
+			self.layout.typology = self.typology
+			self.layout = resample(self.layout, lambda: factory.draw(self.typology))
+		return self.realise(self.layout)
+
+	def realise(self, layout):
+		"""
+		Function that creates the meshes of the volumes of a building layout.
+		:param layout: layout of the building, BuildingLayout
+		:return: volumes, list of Volume
+		"""
+		self.layout = layout
+		self.volumes = []
+		for _layout in layout.volumes:
+			v = _layout.volume or Volume(location=_layout.position)
+			v.width, v.length, v.height = _layout.width, _layout.length, \
+			                              _layout.height
+			v.create()
+			v.mesh.location = _layout.location
+			v.mesh.rotation_euler[2] = _layout.rotation
+			self.volumes.append(v)
 		return self.volumes
 
 	def save(self, filename='test', ext='obj'):
@@ -112,11 +187,16 @@ class ComposedBuilding:
 		:param ext: file extension, str, default='obj'
 		:return:
 		"""
-		deselect_all()
-		for v in self.volumes:
-			v.mesh.select_set(True)
 		if not MODEL_SAVE in os.listdir(file_dir):
 			os.mkdir(file_dir + '/' + MODEL_SAVE)
+		if ext == 'obj' and self.mesh is not None:
+			self._write_obj('{}/{}/{}'.format(file_dir, MODEL_SAVE, filename))
+			return
+		deselect_all()
+		# the volumes of a merged building are removed, its one object is left
+		for _object in [self.mesh] if self.mesh is not None else \
+				[v.mesh for v in self.volumes]:
+			_object.select_set(True)
 		if ext == 'obj':
 			bpy.ops.export_scene.obj(filepath='{}/Models/{}.{}'.format(file_dir,
 			                                                           filename,
@@ -129,230 +209,142 @@ class ComposedBuilding:
 		else:
 			return NotImplementedError
 
-	def _correct_volumes(self):
-		for v in self.volumes:
-			v.create()
+	def _write_obj(self, path):
+		"""
+		Function that writes the merged object and its materials from arrays,
+		without the exporter: the UVs and the normals of its polygons and the
+		image textures of its materials.
+		:param path: path of the .obj and .mtl files without extension, str
+		:return:
+		"""
+		vertices, totals, loops, uvs, normals = get_polygons(self.mesh, surface=True)
+		# merge_objects writes the polygons in the order of their loops, the
+		# order of get_polygons
+		slots = np.empty(len(self.mesh.data.polygons), dtype=np.int32)
+		self.mesh.data.polygons.foreach_get('material_index', slots)
+		materials = list(self.mesh.data.materials) or [None]
+		names = [x.name if x is not None else 'None' for x in materials]
+		write_obj(path + '.obj', vertices, totals, loops, self.mesh.name, (names, slots),
+		          uvs, normals)
+		colors, textures = zip(*[_surface(x) for x in materials])
+		write_mtl(path + '.mtl', names, colors, textures)
+
+
+def _surface(material):
+	"""
+	Function that returns the diffuse color and texture of a material, read
+	from the 'RGB' and 'Diffuse_texture' nodes of the materials of the dataset.
+	:param material: material, Blender material, None for the faces without one
+	:return: color, list of float, and absolute path of the texture image, str,
+	None without one
+	"""
+	if material is None or material.node_tree is None:
+		return [0.8, 0.8, 0.8], None
+	nodes = material.node_tree.nodes
+	color = list(nodes['RGB'].outputs[0].default_value) if 'RGB' in nodes else \
+		list(material.diffuse_color)
+	texture = nodes['Diffuse_texture'].image if 'Diffuse_texture' in nodes else None
+	return color, bpy.path.abspath(texture.filepath) if texture is not None else None
 
 
 class LBuilding(ComposedBuilding):
 	"""
 	Class that represents an L-shaped building.
 	"""
+	layout_type = LBuildingLayout
+
 	def __init__(self, volumes):
 		ComposedBuilding.__init__(self, volumes)
 
-	def make(self):
-		# add rotation if len > width (or vice versa)
-		self._correct_volumes()
-		gancio(self.volumes[0], self.volumes[1], 0, 0, 0)
-		return self.volumes
-
-	def _correct_volumes(self):
-
-		if np.random.random() < 0.5:  # same height
-			_height = max(min(self.volumes[0].height,
-			                  min(self.volumes[0].width * 3, MAX_HEIGHT)),
-			              MIN_HEIGHT)
-			for v in self.volumes:
-				v.height = _height
-
-		for v in self.volumes:
-			v.create()
-		self.volumes = sorted(self.volumes, key=lambda x: x.length,
-		                      reverse=True)
-
 
 class CBuilding(LBuilding):
+	layout_type = CBuildingLayout
+
 	def __init__(self, volumes):
 		LBuilding.__init__(self, volumes)
 		assert len(
 			volumes) == 3, "C-shaped bulding can be composed of 3 volumes" \
 		                   "only, got {}".format(len(volumes))
 
-	def make(self):
-		self._correct_volumes()
-		for v in self.volumes[1:]:
-			if v.width < v.length:
-				v.mesh.rotation_euler[2] = radians(90)
-
-		gancio(self.volumes[0], self.volumes[1], 0, 1, 0)
-		gancio(self.volumes[0], self.volumes[2], 0, 0, 0)
-		return self.volumes
-
 
 class Patio(ComposedBuilding):
 	"""
 	Class that represents an L-shaped building.
 	"""
+	layout_type = PatioLayout
+
 	def __init__(self, volumes):
 		ComposedBuilding.__init__(self, volumes)
 		assert len(volumes) in [2, 4], "Patio bulding can be composed of 4 " \
 		                               "volumes only, got {}".format(len(volumes))
-		self.width = [3, 12]
-		self.length = [6, 20]
-
-	def make(self):
-
-		self._correct_volumes()
-		if np.random.random() < 0.5:
-			# circular linkage between buildings
-			for i, _v in enumerate(self.volumes[:-1]):
-				if i % 2 == 0:
-					self.volumes[i + 1].mesh.rotation_euler[2] = radians(90)
-				if i == 0:
-					gancio(_v, self.volumes[i + 1], 0, 1, 1)
-				elif i == 1:
-					gancio(_v, self.volumes[i + 1], 1, 1, 0)
-				elif i == 2:
-					gancio(_v, self.volumes[i + 1], 0, 0, 0)
-		else:
-			# cap linkage between buildings
-			for i, _v in enumerate(self.volumes[:-1]):
-				if i % 2 == 0:
-					self.volumes[i + 1].mesh.rotation_euler[2] = radians(90)
-				if i == 0:
-					gancio(_v, self.volumes[i + 1], 1, 1, 0)
-				elif i == 1:
-					gancio(_v, self.volumes[i + 1], 1, 1, 0)
-				elif i == 2:
-					gancio(_v, self.volumes[i + 1], 1, 0, 1)
-
-		return self.volumes
-
-	def _correct_volumes(self):
-		for v in self.volumes:
-			v.width = min(max(v.width, self.width[0]), self.width[1])
-			v.length = v.width * (np.random.random() + 1.5)
-			v.height = max(min(v.height, min(v.width * 3, MAX_HEIGHT)), MIN_HEIGHT)
-			v.create()
-		self.volumes = sorted(self.volumes, key=lambda x: x.length)
 
 
 class PatioEqual(Patio):
 	"""
 	Class that represents a Patio building with equal height volumes.
 	"""
+	layout_type = PatioEqualLayout
 
 	def __init__(self, volumes):
 		Patio.__init__(self, volumes)
 
-	def _correct_volumes(self):
-		_height = max(min(self.volumes[0].height, min(self.volumes[0].width * 3,
-		                                              MAX_HEIGHT)), MIN_HEIGHT)
-		for v in self.volumes:
-			v.width = min(max(v.width, self.width[0]), self.width[1])
-			v.length = v.width * (np.random.random() + 1.5)
-			v.height = _height
-			v.create()
-		self.volumes = sorted(self.volumes, key=lambda x: x.length)
-
 
 class ClosedPatio(Patio):
 	"""
 	Class that represents a Patio building with equal height volumes.
 	"""
+	layout_type = ClosedPatioLayout
 
 	def __init__(self, volumes):
 		Patio.__init__(self, volumes)
 		assert len(self.volumes) == 2, "Expected 2 volumes for Closed Patio, " \
 		                               "got {}".format(len(self.volumes))
 
-	def _correct_volumes(self):
-		for v in self.volumes:
-			v.width = min(max(v.width, self.width[0]), self.width[1])
-			v.length = v.width * (np.random.random() + 1.5)
-			v.height = max(min(v.height, min(v.width * 3, MAX_HEIGHT)),
-		              MIN_HEIGHT)
-			v.create()
-
-		for v in self.volumes[:2]:
-			v1 = Factory().produce(scale=(v.width, v.length, v.height))
-			self.volumes.append(v1)
-
 
 class TBuilding(ComposedBuilding):
 	"""
 	Class that represents a T-shaped building with random location of the
 	second volume along the side of the first volume.
 	"""
+	layout_type = TBuildingLayout
+
 	def __init__(self, volumes):
 		ComposedBuilding.__init__(self, volumes)
 		assert len(volumes) == 2, "L-shaped bulding can be composed of 2 volumes" \
 		                          "only, got {}".format(len(volumes))
 
-	def make(self):
-		self._correct_volumes()
-		x_min, x_max = get_min_max(self.volumes[0].mesh, 0)  # width
-		y_min, y_max = get_min_max(self.volumes[0].mesh, 1)  # length
-
-		if random.random() < 0.5:
-			self.volumes[1].mesh.location[0] = random.choice(np.linspace(int(x_min + (self.volumes[1].length)),
-				      int(x_max - (self.volumes[1].length)), 10))
-			self.volumes[1].mesh.location[1] = y_min - self.volumes[1].width
-
-		else:
-			self.volumes[1].mesh.location[1] = random.choice(np.linspace(
-				int(y_min + (self.volumes[1].width)),
-				int(y_max - (self.volumes[1].width)), 10))
-			self.volumes[1].mesh.location[0] = x_min - self.volumes[1].length
-
-		return self.volumes
-
 
 class Skyscraper(ComposedBuilding):
 	"""
 	Class that represents a Skyscraper building with height significantly larger
 	than width or length of the building.
 	"""
+	layout_type = SkyscraperLayout
 
 	def __init__(self, volumes):
 		ComposedBuilding.__init__(self, volumes)
 
-	def _correct_volumes(self):
-		for _v in self.volumes:
-			_v.height = np.random.randint(100, 200)
-			_v.length = max(30, _v.length)
-			_v.width = max(30, _v.width)
-			_v.create()
-
 
 class EBuilding(ComposedBuilding):
 	"""
 	Class that represents a E-shaped building with random locations of the
 	volumes along the side of the first volume.
 	"""
+	layout_type = EBuildingLayout
+
 	def __init__(self, volumes):
 		ComposedBuilding.__init__(self, volumes)
 
-	def make(self):
-
-		self._correct_volumes()
-		x_min, x_max = get_min_max(self.volumes[0].mesh, 0)  # width
-		y_min, y_max = get_min_max(self.volumes[0].mesh, 1)  # length
-
-		if random.random() < 0.5:
-			for _volume in self.volumes[1:]:
-				_volume.mesh.location[0] = random.choice(np.linspace(int(x_min + (_volume.length)),
-					      int(x_max - (_volume.length)), 10))
-				_volume.mesh.location[1] = y_min - _volume.width
-
-		else:
-			for _volume in self.volumes[1:]:
-				_volume.mesh.location[1] = random.choice(np.linspace(
-					int(y_min + (_volume.width)),
-					int(y_max - (_volume.width)), 10))
-				_volume.mesh.location[0] = x_min - _volume.length
-
-		return self.volumes
-
 
 if __name__ == '__main__':
 
 	NUM_IMAGES = 1
 	for image in range(NUM_IMAGES):
-		f = CollectionFactory()
-		collection = f.produce(number=np.random.randint(1, 4))
+		rng = sample_rng(SEED, image)
+		f = CollectionFactory(rng)
+		collection = f.produce(number=int(rng.integers(1, 4)))
 		building = ComposedBuilding(collection.collection)
+		building.rng = rng
 		building.make()
 
 		axis = 1
@@ -362,7 +354,7 @@ if __name__ == '__main__':
 			mod = GridApplier(Window)
 			w = Window()
 			w.connect(v, 1)
-			step = (np.random.randint(1, 6), np.random.randint(1, 6))
+			step = (int(rng.integers(1, 6)), int(rng.integers(1, 6)))
 			if j == 0:
 				mod.apply(w, step=step, offset=(2.0, 2.0, 2.0, 1.0))
 			else:
@@ -370,19 +362,21 @@ if __name__ == '__main__':
 
 			w = Window()
 			w.connect(v, 0, 0)
-			step = (np.random.randint(1, 6), np.random.randint(1, 6))
+			step = (int(rng.integers(1, 6)), int(rng.integers(1, 6)))
 			if j == 0:
 				mod.apply(w, step=step, offset=(2.0, 2.0, 2.0, 1.0))
 			else:
 				mod.apply(w, step=step)
 
+		if MERGE_BUILDING:
+			building.merge()
 		renderer = Renderer(mode=0)
 		renderer.render(filename='building_{}'.format(image))
 		building.save(image)
-		building.save(image, ext='ply')
+		triangles = building.triangles()
 		building.demolish()
 		cloud = PointCloud()
-		cloud.make(image)
+		cloud.make(image, triangles, rng=sample_rng(SEED, image, 1))
 		# cloud = PyntCloud.from_file("Models/{}.obj".format(image))
 		# cloud.to_file("{}.ply".format(image))
 		# cloud.to_file("{}.npz".format(image))
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+# Corners of the box as indices of the (x, y, z) signs, bottom ring then top ring
+_CORNERS = np.array([[-1, -1, -1], [1, -1, -1], [1, 1, -1], [-1, 1, -1],
+                     [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1]], dtype=np.float64)
+
+# Quads of the box, counter-clockwise seen from the outside
+_QUADS = np.array([[0, 3, 2, 1],  # bottom
+                   [4, 5, 6, 7],  # top
+                   [0, 1, 5, 4],  # front, -y
+                   [1, 2, 6, 5],  # right, +x
+                   [2, 3, 7, 6],  # back, +y
+                   [3, 0, 4, 7]])  # left, -x
+
+# In-plane axes of every quad used for the uv projection
+_UV_AXES = np.array([[0, 1], [0, 1], [0, 2], [1, 2], [0, 2], [1, 2]])
+
+
+def box(length, width, height):
+	"""
+	Function that creates a triangulated box centred at the origin. The box
+	matches the volume made by the operators: a plane of size 2 resized to
+	(length, width) and extruded by height, with the origin in the centre of its
+	bounds.
+	:param length: half size of the box along x, float
+	:param width: half size of the box along y, float
+	:param height: size of the box along z, float
+	:return: vertices, np.ndarray (8, 3), float
+	         triangles, np.ndarray (12, 3), int
+	         uvs of every triangle corner, np.ndarray (12, 3, 2), float
+	"""
+	assert min(length, width, height) > 0, "Expected positive dimensions, " \
+	                                       "got {}".format((length, width, height))
+	vertices = _CORNERS * np.array([length, width, height / 2.0])
+	triangles = np.concatenate([_QUADS[:, [0, 1, 2]], _QUADS[:, [0, 2, 3]]], axis=1)
+	triangles = triangles.reshape(-1, 3)
+	return vertices, triangles, _box_uvs(vertices)
+
+
+def transform(vertices, location=(0.0, 0.0, 0.0), rotation=0.0):
+	"""
+	Function that moves local vertices to world coordinates.
+	:param vertices: local vertices, np.ndarray (n, 3)
+	:param location: location of the object, tuple (x, y, z)
+	:param rotation: rotation of the object around z axis in radians, float
+	:return: world vertices, np.ndarray (n, 3)
+	"""
+	c, s = np.cos(rotation), np.sin(rotation)
+	matrix = np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+	return np.asarray(vertices) @ matrix.T + np.asarray(location, dtype=np.float64)
+
+
+def normals(vertices, triangles):
+	"""
+	Function that computes the unit normals of the triangles.
+	:param vertices: vertices, np.ndarray (n, 3)
+	:param triangles: triangles, np.ndarray (m, 3), int
+	:return: normals, np.ndarray (m, 3)
+	"""
+	corners = vertices[triangles]
+	n = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+	return n / np.maximum(np.linalg.norm(n, axis=1, keepdims=True), 1e-12)
+
+
+def _box_uvs(vertices):
+	"""
+	Function that projects every face of the box on its own plane and packs the
+	six islands into a 3 x 2 atlas keeping the proportions of the faces.
+	:param vertices: vertices of the box, np.ndarray (8, 3)
+	:return: uvs of every triangle corner, np.ndarray (12, 3, 2)
+	"""
+	quads = vertices[_QUADS]  # (6, 4, 3)
+	planar = np.take_along_axis(quads, _UV_AXES[:, None, :], axis=2)
+	planar = planar - planar.min(axis=1, keepdims=True)
+	planar /= max(planar.max(), 1e-12)
+	cells = np.array([[0, 0], [1, 0], [2, 0], [0, 1], [1, 1], [2, 1]])
+	uvs = (planar + cells[:, None, :]) / np.array([3.0, 2.0])
+	uvs = np.concatenate([uvs[:, [0, 1, 2]], uvs[:, [0, 2, 3]]], axis=1)
+	return uvs.reshape(-1, 3, 2)
@@ -0,0 +1,218 @@
+import base64
+import json
+import mmap
+import numpy as np
+import os
+import struct
+
+
+# numpy types of the glTF accessor component types
+COMPONENTS = {5120: np.int8, 5121: np.uint8, 5122: np.int16, 5123: np.uint16,
+              5125: np.uint32, 5126: np.float32}
+# number of components of the glTF accessor types
+TYPES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9,
+         'MAT4': 16}
+# glTF is Y up, Blender is Z up: (x, y, z) -> (x, -z, y) as the Blender importer
+Y_UP_TO_Z_UP = np.array([[1.0, 0.0, 0.0, 0.0],
+                         [0.0, 0.0, -1.0, 0.0],
+                         [0.0, 1.0, 0.0, 0.0],
+                         [0.0, 0.0, 0.0, 1.0]])
+TRIANGLES = 4
+
+
+class Gltf:
+	"""
+	Class that reads a .gltf or .glb file without Blender. The binary buffers
+	are memory-mapped (.glb and external .bin files) and the accessors are
+	returned as NumPy views of them, so only the data that is read is loaded.
+	"""
+	def __init__(self, filename):
+		"""
+		Class initialization
+		:param filename: path of the .gltf or .glb file, str
+		"""
+		self.path = filename
+		self.folder = os.path.dirname(os.path.abspath(filename))
+		self._file = open(filename, 'rb')
+		self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		self._buffers = {}
+		if self._map[:4] == b'glTF':
+			self.json, self._bin = self._read_glb()
+		else:
+			self.json, self._bin = json.loads(self._map[:].decode('utf-8')), None
+
+	def close(self):
+		"""
+		Function that unmaps and closes the file. The arrays returned by accessor
+		are views of the file and must be dropped before.
+		:return:
+		"""
+		if self._bin is not None:
+			self._bin.release()
+		self._buffers, self._bin = {}, None
+		self._map.close()
+		self._file.close()
+
+	def accessor(self, index):
+		"""
+		Function that returns the data of an accessor.
+		:param index: index of the accessor, int
+		:return: view of the buffer (a copy for sparse accessors), np.ndarray
+		(count,) or (count, components)
+		"""
+		accessor = self.json['accessors'][index]
+		dtype = np.dtype(COMPONENTS[accessor['componentType']])
+		components = TYPES[accessor['type']]
+		shape = (accessor['count'],) if components == 1 else \
+			(accessor['count'], components)
+		if 'bufferView' not in accessor:
+			data = np.zeros(shape, dtype=dtype)
+		else:
+			data = self._view(accessor['bufferView'], accessor.get('byteOffset', 0),
+			                  dtype, shape)
+		if 'sparse' in accessor:
+			data = self._sparse(data, accessor['sparse'])
+		return data
+
+	def bounds(self, index):
+		"""
+		Function that returns the bounds stored with an accessor.
+		:param index: index of the accessor, int
+		:return: min and max, np.ndarray (2, components), None if not stored
+		"""
+		accessor = self.json['accessors'][index]
+		if 'min' not in accessor or 'max' not in accessor:
+			return None
+		return np.array([accessor['min'], accessor['max']], dtype=np.float64)
+
+	def buffer(self, index):
+		"""
+		Function that returns a binary buffer.
+		:param index: index of the buffer, int
+		:return: buffer, mmap, memoryview or bytes
+		"""
+		if index not in self._buffers:
+			uri = self.json['buffers'][index].get('uri')
+			if uri is None:
+				assert self._bin is not None, "Buffer {} has no data".format(index)
+				self._buffers[index] = self._bin
+			elif uri.startswith('data:'):
+				self._buffers[index] = base64.b64decode(uri.split(',', 1)[1])
+			else:
+				self._buffers[index] = np.memmap(os.path.join(self.folder, uri),
+				                                 dtype=np.uint8, mode='r')
+		return self._buffers[index]
+
+	def nodes(self, scene=None):
+		"""
+		Function that walks the node hierarchy of a scene depth first.
+		:param scene: index of the scene, int, default None (default scene)
+		:return: index of the node, index of its parent (None for the roots)
+		         and its world matrix in Z up, generator of tuple
+		"""
+		stack = [(x, None, Y_UP_TO_Z_UP) for x in reversed(self.roots(scene))]
+		while stack:
+			index, parent, matrix = stack.pop()
+			node = self.json['nodes'][index]
+			matrix = matrix @ local_matrix(node)
+			yield index, parent, matrix
+			stack.extend((x, index, matrix) for x in reversed(node.get('children', [])))
+
+	def roots(self, scene=None):
+		"""
+		Function that returns the root nodes of a scene.
+		:param scene: index of the scene, int, default None (default scene)
+		:return: indices of the nodes, list of int
+		"""
+		scene = self.json.get('scene', 0) if scene is None else scene
+		return self.json['scenes'][scene]['nodes']
+
+	def triangles(self, mesh):
+		"""
+		Function that returns the triangle primitives of a mesh.
+		:param mesh: index of the mesh, int
+		:return: POSITION accessor and indices (None if not indexed) of every
+		primitive, list of tuple
+		"""
+		return [(x['attributes']['POSITION'], x.get('indices')) for x in
+		        self.json['meshes'][mesh]['primitives']
+		        if x.get('mode', TRIANGLES) == TRIANGLES and 'POSITION' in x['attributes']]
+
+	def _sparse(self, data, sparse):
+		"""
+		Function that applies the sparse values of an accessor to its data.
+		:param data: data of the accessor, np.ndarray (count,) or (count, components)
+		:param sparse: sparse storage of the accessor, dict
+		:return: copy of the data with the sparse values, np.ndarray
+		"""
+		indices, values, count = sparse['indices'], sparse['values'], sparse['count']
+		indices = self._view(indices['bufferView'], indices.get('byteOffset', 0),
+		                     np.dtype(COMPONENTS[indices['componentType']]), (count,))
+		values = self._view(values['bufferView'], values.get('byteOffset', 0),
+		                    data.dtype, (count,) + data.shape[1:])
+		data = data.copy()
+		data[indices] = values
+		return data
+
+	def _view(self, index, offset, dtype, shape):
+		"""
+		Function that returns the elements of a buffer view.
+		:param index: index of the buffer view, int
+		:param offset: offset of the first element in the view, int
+		:param dtype: type of the components, np.dtype
+		:param shape: shape of the elements, tuple (count,) or (count, components)
+		:return: view of the buffer, np.ndarray
+		"""
+		view = self.json['bufferViews'][index]
+		components = 1 if len(shape) == 1 else shape[1]
+		stride = view.get('byteStride', dtype.itemsize * components)
+		strides = (stride,) if components == 1 else (stride, dtype.itemsize)
+		return np.ndarray(shape, dtype=dtype, buffer=self.buffer(view['buffer']),
+		                  offset=view.get('byteOffset', 0) + offset, strides=strides)
+
+	def _read_glb(self):
+		"""
+		Function that reads the chunks of a .glb file.
+		:return: json, binary chunk (memoryview of the file) or None
+		"""
+		magic, version, length = struct.unpack_from('<4sII', self._map, 0)
+		assert version == 2, "Expected a glTF 2.0 file, got version {}".format(version)
+		content, binary, offset = None, None, 12
+		while offset < length:
+			size, kind = struct.unpack_from('<I4s', self._map, offset)
+			if kind == b'JSON':
+				content = json.loads(self._map[offset + 8:offset + 8 + size].decode('utf-8'))
+			elif kind == b'BIN\x00':
+				binary = memoryview(self._map)[offset + 8:offset + 8 + size]
+			offset += 8 + size
+		return content, binary
+
+
+def local_matrix(node):
+	"""
+	Function that returns the local matrix of a node, from its matrix or from
+	its translation, rotation and scale.
+	:param node: node, dict
+	:return: matrix, np.ndarray (4, 4)
+	"""
+	if 'matrix' in node:
+		return np.array(node['matrix'], dtype=np.float64).reshape(4, 4).T
+	x, y, z, w = node.get('rotation', [0.0, 0.0, 0.0, 1.0])
+	rotation = np.array([[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+	                     [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+	                     [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]])
+	matrix = np.eye(4)
+	matrix[:3, :3] = rotation * np.array(node.get('scale', [1.0, 1.0, 1.0]))
+	matrix[:3, 3] = node.get('translation', [0.0, 0.0, 0.0])
+	return matrix
+
+
+def transform(points, matrix):
+	"""
+	Function that applies a matrix to points.
+	:param points: points, np.ndarray (n, 3)
+	:param matrix: matrix, np.ndarray (4, 4)
+	:return: points, np.ndarray (n, 3), float32
+	"""
+	return (np.asarray(points, dtype=np.float64) @ matrix[:3, :3].T +
+	        matrix[:3, 3]).astype(np.float32)
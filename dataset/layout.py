@@ -0,0 +1,426 @@
+import argparse
+from math import cos, radians, sin
+import json
+import numpy as np
+import os
+import sys
+import textwrap
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset_config import *
+from geometry import box, transform
+from seeding import get_rng, sample_rng
+from validity import resample
+
+
+class VolumeLayout:
+	"""
+	Class that represents the layout of one volume: its dimensions and placement
+	without any Blender object. Mirrors Volume.
+	"""
+	def __init__(self, scale=(1.0, 1.0, 1.0), location=(0.0, 0.0, 0.0)):
+		assert len(location) == 3, "Expected 3 location coordinates," \
+		                           " got {}".format(len(location))
+		assert len(scale) == 3, "Expected 3 scale coordinates," \
+		                        " got {}".format(len(scale))
+		self.height = float(max(MIN_HEIGHT, scale[2]))
+		self.width = float(max(MIN_WIDTH, scale[0]))
+		self.length = float(max(MIN_LENGTH, scale[1]))
+		self.position = location
+		self.location = None  # location of the volume origin once created
+		self.rotation = 0.0  # rotation around z axis, radians
+		self.volume = None  # Volume the layout was taken from, if any
+
+	@classmethod
+	def from_volume(cls, volume):
+		"""
+		Function that makes the layout of a not yet created Volume.
+		:param volume: volume to take the dimensions from, Volume
+		:return: layout, VolumeLayout
+		"""
+		layout = cls(location=volume.position)
+		layout.width, layout.length, layout.height = volume.width, volume.length, \
+		                                             volume.height
+		layout.volume = volume
+		return layout
+
+	def bounds(self):
+		"""
+		Function that returns the world axis aligned bounds of the volume.
+		:return: bounds, np.ndarray (2, 3), min and max of every axis
+		"""
+		return np.array(self._limits()).T
+
+	def create(self):
+		"""
+		Function that places the volume origin as Volume.create does: in the
+		centre of its bounds, the volume being extruded down from its position.
+		:return:
+		"""
+		self.location = [float(self.position[0]), float(self.position[1]),
+		                 float(self.position[2]) - self.height / 2.0]
+
+	def geometry(self):
+		"""
+		Function that returns the world geometry of the volume.
+		:return: vertices, np.ndarray (8, 3), triangles, np.ndarray (12, 3)
+		"""
+		vertices, triangles, _ = box(self.length, self.width, self.height)
+		return transform(vertices, self.location, self.rotation), triangles
+
+	def to_dict(self):
+		return {'width': float(self.width),
+		        'length': float(self.length),
+		        'height': float(self.height),
+		        'location': [round(x, 6) for x in self.location],
+		        'rotation': self.rotation}
+
+	def _limits(self):
+		"""
+		Function that returns the world limits of the volume on every axis.
+		:return: limits, tuple of three (min, max) tuples of float
+		"""
+		assert self.location is not None, "Volume layout is not created"
+		c, s = abs(cos(self.rotation)), abs(sin(self.rotation))
+		half = (c * self.length + s * self.width, s * self.length + c * self.width,
+		        self.height / 2.0)
+		return tuple((x - h, x + h) for x, h in zip(self.location, half))
+
+
+def attach(v1, v2, axis, border1=0, border2=0):
+	"""
+	Function that attaches one volume layout to another one, same as gancio.
+	:param v1: volume to attach the other volume to, VolumeLayout
+	:param v2: volume to attach to the other volume, VolumeLayout
+	:param axis: axis along which the volume will be attached, bool, 0 - x axis,
+	                                                                 1 - y axis
+	:param border1: max or min side of the axis, 0 - min, 1 - max
+	:param border2: max or min side of the opposite axis, 0 - min, 1 - max
+	:return:
+	"""
+	mapping = {0: -1, 1: 1}
+	coords1, coords2 = v1._limits(), v2._limits()
+	other = abs(1 - axis)
+
+	v2.location[axis] = coords1[axis][border1] + \
+	                    0.5 * (coords2[axis][1] - coords2[axis][0]) * mapping[border1]
+	v2.location[other] = coords1[other][border2] + \
+	                     mapping[abs(1 - border2)] * (coords1[other][1] - coords1[other][0]) + \
+	                     0.5 * (coords2[other][1] - coords2[other][0]) * mapping[border2]
+
+
+class LayoutFactory:
+	"""
+	Factory that produces building layouts, drawing the same random numbers in
+	the same order as BuildingFactory, CollectionFactory and Factory.
+	"""
+	def __init__(self, rng=None):
+		"""
+		Class initialization
+		:param rng: random generator of the sample, np.random.Generator,
+		default None (unseeded)
+		"""
+		self.rng = get_rng(rng)
+		self.mapping = {'Patio': (PatioLayout, 4),
+		                'L': (LBuildingLayout, 2),
+		                'C': (CBuildingLayout, 3),
+		                'Single': (BuildingLayout, 1),
+		                'Skyscraper': (SkyscraperLayout, 1),
+		                'Closedpatio': (ClosedPatioLayout, 2),
+		                'Equalpatio': (PatioEqualLayout, 4)}
+		self.mapping = {x: y for x, y in self.mapping.items() if x in BUILDINGS}
+
+	def produce(self, name=None):
+		"""
+		Function that produces the layout of a building, drawn again while it is
+		invalid (see validity.check).
+		:param name: typology of the building, str, default None (random)
+		:return: layout, BuildingLayout
+		"""
+		if name:
+			name = name.lower().capitalize()
+			assert name in list(self.mapping.keys()), "{} building typology " \
+			                                          "does not exist".format(name)
+		else:
+			name = self.rng.choice(list(self.mapping.keys()))
+		return resample(self.draw(name), lambda: self.draw(name))
+
+	def draw(self, name):
+		"""
+		Function that draws one layout of a typology, valid or not.
+		:param name: typology of the building, str
+		:return: layout, BuildingLayout
+		"""
+		volumes = [VolumeLayout(scale=(int(self.rng.integers(MIN_LENGTH, MAX_LENGTH)),
+		                               int(self.rng.integers(MIN_WIDTH, MAX_WIDTH)),
+		                               int(self.rng.integers(MIN_HEIGHT, MAX_HEIGHT))))
+		           for _ in range(self.mapping[name][1])]
+		layout = self.mapping[name][0](volumes, self.rng)
+		layout.typology = name
+		return layout.make()
+
+
+class BuildingLayout:
+	"""
+	Class that represents the layout of a building composed of one or several
+	volumes. Mirrors ComposedBuilding.
+	"""
+	def __init__(self, volumes, rng=None):
+		"""
+		Class initialization
+		:param volumes: volumes of the building, list of VolumeLayout
+		:param rng: random generator of the sample, np.random.Generator,
+		default None (unseeded)
+		"""
+		assert isinstance(volumes, list), "Expected volumes as list," \
+		                                  " got {}".format(type(volumes))
+		self.volumes = volumes
+		self.typology = 'Single'
+		self.rng = get_rng(rng)
+
+	def get_bb(self):
+		"""
+		Function that gets the bounding box of the building.
+		:return: bounding box, list of float
+		[width_from, width_to, length_from, length_to]
+		"""
+		limits = [v._limits() for v in self.volumes]
+		return [round(min(x[0][0] for x in limits), 3),
+		        round(max(x[0][1] for x in limits), 3),
+		        round(min(x[1][0] for x in limits), 3),
+		        round(max(x[1][1] for x in limits), 3)]
+
+	def make(self):
+		"""
+		Function that composes the building layout based on its typology.
+		:return: layout, BuildingLayout
+		"""
+		self._correct_volumes()
+		return self
+
+	def to_dict(self):
+		return {'typology': self.typology,
+		        'volumes': [v.to_dict() for v in self.volumes],
+		        'bbox': self.get_bb()}
+
+	def _correct_volumes(self):
+		for v in self.volumes:
+			v.create()
+
+
+class LBuildingLayout(BuildingLayout):
+	"""
+	Class that represents the layout of an L-shaped building.
+	"""
+	def make(self):
+		self._correct_volumes()
+		attach(self.volumes[0], self.volumes[1], 0, 0, 0)
+		return self
+
+	def _correct_volumes(self):
+		if self.rng.random() < 0.5:  # same height
+			_height = max(min(self.volumes[0].height,
+			                  min(self.volumes[0].width * 3, MAX_HEIGHT)),
+			              MIN_HEIGHT)
+			for v in self.volumes:
+				v.height = _height
+
+		for v in self.volumes:
+			v.create()
+		self.volumes = sorted(self.volumes, key=lambda x: x.length,
+		                      reverse=True)
+
+
+class CBuildingLayout(LBuildingLayout):
+	"""
+	Class that represents the layout of a C-shaped building.
+	"""
+	def __init__(self, volumes, rng=None):
+		LBuildingLayout.__init__(self, volumes, rng)
+		assert len(
+			volumes) == 3, "C-shaped bulding can be composed of 3 volumes" \
+		                   "only, got {}".format(len(volumes))
+
+	def make(self):
+		self._correct_volumes()
+		for v in self.volumes[1:]:
+			if v.width < v.length:
+				v.rotation = radians(90)
+
+		attach(self.volumes[0], self.volumes[1], 0, 1, 0)
+		attach(self.volumes[0], self.volumes[2], 0, 0, 0)
+		return self
+
+
+class PatioLayout(BuildingLayout):
+	"""
+	Class that represents the layout of a Patio building.
+	"""
+	def __init__(self, volumes, rng=None):
+		BuildingLayout.__init__(self, volumes, rng)
+		assert len(volumes) in [2, 4], "Patio bulding can be composed of 4 " \
+		                               "volumes only, got {}".format(len(volumes))
+		self.width = [3, 12]
+		self.length = [6, 20]
+
+	def make(self):
+		self._correct_volumes()
+		if self.rng.random() < 0.5:
+			# circular linkage between buildings
+			links = {0: (0, 1, 1), 1: (1, 1, 0), 2: (0, 0, 0)}
+		else:
+			# cap linkage between buildings
+			links = {0: (1, 1, 0), 1: (1, 1, 0), 2: (1, 0, 1)}
+		for i, _v in enumerate(self.volumes[:-1]):
+			if i % 2 == 0:
+				self.volumes[i + 1].rotation = radians(90)
+			attach(_v, self.volumes[i + 1], *links[i])
+		return self
+
+	def _correct_volumes(self):
+		for v in self.volumes:
+			v.width = min(max(v.width, self.width[0]), self.width[1])
+			v.length = v.width * (self.rng.random() + 1.5)
+			v.height = max(min(v.height, min(v.width * 3, MAX_HEIGHT)), MIN_HEIGHT)
+			v.create()
+		self.volumes = sorted(self.volumes, key=lambda x: x.length)
+
+
+class PatioEqualLayout(PatioLayout):
+	"""
+	Class that represents the layout of a Patio building with equal height
+	volumes.
+	"""
+	def _correct_volumes(self):
+		_height = max(min(self.volumes[0].height, min(self.volumes[0].width * 3,
+		                                              MAX_HEIGHT)), MIN_HEIGHT)
+		for v in self.volumes:
+			v.width = min(max(v.width, self.width[0]), self.width[1])
+			v.length = v.width * (self.rng.random() + 1.5)
+			v.height = _height
+			v.create()
+		self.volumes = sorted(self.volumes, key=lambda x: x.length)
+
+
+class ClosedPatioLayout(PatioLayout):
+	"""
+	Class that represents the layout of a Patio building closed by copies of
+	its two volumes.
+	"""
+	def __init__(self, volumes, rng=None):
+		PatioLayout.__init__(self, volumes, rng)
+		assert len(self.volumes) == 2, "Expected 2 volumes for Closed Patio, " \
+		                               "got {}".format(len(self.volumes))
+
+	def _correct_volumes(self):
+		for v in self.volumes:
+			v.width = min(max(v.width, self.width[0]), self.width[1])
+			v.length = v.width * (self.rng.random() + 1.5)
+			v.height = max(min(v.height, min(v.width * 3, MAX_HEIGHT)),
+			               MIN_HEIGHT)
+			v.create()
+
+		for v in self.volumes[:2]:
+			v1 = VolumeLayout(scale=(v.width, v.length, v.height))
+			v1.create()
+			self.volumes.append(v1)
+
+
+class TBuildingLayout(BuildingLayout):
+	"""
+	Class that represents the layout of a T-shaped building with random location
+	of the second volume along the side of the first volume.
+	"""
+	def __init__(self, volumes, rng=None):
+		BuildingLayout.__init__(self, volumes, rng)
+		assert len(volumes) == 2, "L-shaped bulding can be composed of 2 volumes" \
+		                          "only, got {}".format(len(volumes))
+
+	def make(self):
+		self._correct_volumes()
+		_place_along(self.volumes[0], self.volumes[1:], self.rng.random() < 0.5,
+		             self.rng)
+		return self
+
+
+class SkyscraperLayout(BuildingLayout):
+	"""
+	Class that represents the layout of a Skyscraper building with height
+	significantly larger than width or length of the building.
+	"""
+	def _correct_volumes(self):
+		for _v in self.volumes:
+			_v.height = int(self.rng.integers(100, 200))
+			_v.length = max(30, _v.length)
+			_v.width = max(30, _v.width)
+			_v.create()
+
+
+class EBuildingLayout(BuildingLayout):
+	"""
+	Class that represents the layout of an E-shaped building with random
+	locations of the volumes along the side of the first volume.
+	"""
+	def make(self):
+		self._correct_volumes()
+		_place_along(self.volumes[0], self.volumes[1:], self.rng.random() < 0.5,
+		             self.rng)
+		return self
+
+
+def _place_along(base, volumes, along_x, rng):
+	"""
+	Function that places volumes at random positions along one side of the base
+	volume, as TBuilding and EBuilding do.
+	:param base: volume to place the others along, VolumeLayout
+	:param volumes: volumes to place, list of VolumeLayout
+	:param along_x: side of the base volume, bool, True - along x axis,
+	False - along y axis
+	:param rng: random generator, np.random.Generator
+	:return:
+	"""
+	(x_min, x_max), (y_min, y_max), _ = base._limits()
+	for _volume in volumes:
+		if along_x:
+			_volume.location[0] = float(rng.choice(np.linspace(
+				int(x_min + _volume.length), int(x_max - _volume.length), 10)))
+			_volume.location[1] = float(y_min - _volume.width)
+		else:
+			_volume.location[1] = float(rng.choice(np.linspace(
+				int(y_min + _volume.width), int(y_max - _volume.width), 10)))
+			_volume.location[0] = float(x_min - _volume.length)
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+		USAGE: python layout.py --size 10000 --seed 0
+
+		------------------------------------------------------------------------
+
+		This is an algorithm that generates building layouts (volumes, their
+		placement and bounding boxes) without Blender.
+
+		------------------------------------------------------------------------
+
+		'''))
+	parser.add_argument('--size', type=int, default=SIZE,
+	                    help='number of layouts to generate')
+	parser.add_argument('--seed', type=int, default=None,
+	                    help='run seed, layout n is the building of sample n of a '
+	                         'dataset with the same seed')
+	parser.add_argument('--out', type=str, default='layouts.json',
+	                    help='path of the .json file to write')
+	args = parser.parse_args()
+
+	if args.seed is None:
+		f = LayoutFactory()
+		layouts = [f.produce() for _ in range(args.size)]
+	else:
+		layouts = [LayoutFactory(sample_rng(args.seed, i)).produce()
+		           for i in range(args.size)]
+	with open(args.out, 'w') as _file:
+		json.dump([x.to_dict() for x in layouts], _file)
+	print('Layouts successfully written as {}'.format(args.out))
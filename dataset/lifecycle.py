@@ -0,0 +1,94 @@
+import bpy
+import os
+import sys
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from blender_utils import BOUNDS
+from material import TEXTURES
+
+
+class SceneManager:
+	"""
+	Class that removes everything a building left in the scene: its objects,
+	the collections of its modules and the datablocks nobody uses anymore.
+	"""
+	def __init__(self, collection='Building'):
+		"""
+		Class initialization
+		:param collection: name of the collection the buildings are made in, str
+		"""
+		self.collection = collection
+		self._keep_nodes = ['Render Layers', 'Composite']
+
+	def clear(self):
+		"""
+		Function that removes all the objects of the building collection and its
+		child collections without operators.
+		:return:
+		"""
+		collection = bpy.data.collections[self.collection]
+		for _object in list(collection.all_objects):
+			bpy.data.objects.remove(_object, do_unlink=True)
+		for child in list(collection.children_recursive if
+		                  hasattr(collection, 'children_recursive') else
+		                  collection.children):
+			bpy.data.collections.remove(child)
+		BOUNDS.invalidate()
+
+	def counts(self):
+		"""
+		Function that counts the datablocks of the file.
+		:return: counts, dict
+		"""
+		scene = bpy.context.scene
+		return {'objects': len(bpy.data.objects),
+		        'meshes': len(bpy.data.meshes),
+		        'materials': len(bpy.data.materials),
+		        'images': len(bpy.data.images),
+		        'collections': len(bpy.data.collections),
+		        'node_groups': len(bpy.data.node_groups),
+		        'compositor_nodes': len(scene.node_tree.nodes) if scene.node_tree else 0}
+
+	def demolish(self, compositor=True):
+		"""
+		Function that returns the scene to its state before the building.
+		:param compositor: remove the compositor nodes added for the building,
+		bool, default True
+		:return: datablock counts after the cleaning, dict
+		"""
+		self.clear()
+		self.purge()
+		if compositor:
+			self.reset_compositor()
+		return self.counts()
+
+	def purge(self):
+		"""
+		Function that removes the meshes, materials and images without users.
+		Materials and images kept with a fake user (material templates), the
+		render result images and the textures of material.TEXTURES, which are
+		loaded once and evicted by the cache, stay.
+		:return: number of removed datablocks, int
+		"""
+		removed = 0
+		textures = TEXTURES.names()
+		for data in [bpy.data.meshes, bpy.data.materials, bpy.data.images]:
+			for block in [x for x in data if x.users == 0 and x.name not in textures and
+			              getattr(x, 'type', '') not in ['RENDER_RESULT', 'COMPOSITING']]:
+				data.remove(block)
+				removed += 1
+		return removed
+
+	def reset_compositor(self):
+		"""
+		Function that removes all the compositor nodes except the render layers
+		and the composite output.
+		:return:
+		"""
+		tree = bpy.context.scene.node_tree
+		if tree is None:
+			return
+		for node in [x for x in tree.nodes if x.name not in self._keep_nodes]:
+			tree.nodes.remove(node)
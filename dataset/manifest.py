@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+
+
+def file_hash(filename, block=1 << 20):
+	"""
+	Function that computes the sha1 of a file.
+	:param filename: path of the file, str
+	:param block: size of the blocks read at once, int
+	:return: hex digest, str
+	"""
+	h = hashlib.sha1()
+	with open(filename, 'rb') as f:
+		for chunk in iter(lambda: f.read(block), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+class Manifest:
+	"""
+	Class that records the status and the output files of every sample in an
+	append-only JSON Lines file. Every record is flushed to disk before the
+	function returns, and the last record of an index wins.
+	"""
+	def __init__(self, filename):
+		"""
+		Class initialization
+		:param filename: path of the manifest .jsonl file, str
+		"""
+		self.path = filename
+		self.samples = self._load()
+		self._file = open(self.path, 'a')
+
+	def close(self):
+		if not self._file.closed:
+			self._file.close()
+
+	def complete(self, index, files, keys=None, shared=()):
+		"""
+		Function that marks a sample as complete with the hashes of its outputs.
+		:param index: index of the sample, int
+		:param files: paths of the outputs of the sample, list of str
+		:param keys: cache keys of the stages of the sample, dict, default None
+		:param shared: paths of outputs written with other samples (the shards
+		of the storage), checked for existence only, list of str, default ()
+		:return:
+		"""
+		record = {'index': index, 'status': 'complete',
+		          'seed': self.samples.get(index, {}).get('seed'),
+		          'files': {f: file_hash(f) for f in files}}
+		record['files'].update({f: None for f in shared})
+		if keys is not None:
+			record['keys'] = keys
+		self._append(record)
+
+	def done(self, index, verify=False, keys=None):
+		"""
+		Function that checks whether a sample has a complete set of outputs.
+		:param index: index of the sample, int
+		:param verify: compare the hashes of the files, bool, default False
+		:param keys: cache keys of the stages of the sample, a sample completed
+		with other keys is not done, dict, default None
+		:return: bool
+		"""
+		record = self.samples.get(index)
+		if record is None or record['status'] != 'complete':
+			return False
+		if keys is not None and record.get('keys') != keys:
+			return False
+		for f, h in record['files'].items():
+			if not os.path.isfile(f) or (verify and h is not None and file_hash(f) != h):
+				return False
+		return True
+
+	def start(self, index, seed):
+		"""
+		Function that marks a sample as started.
+		:param index: index of the sample, int
+		:param seed: seed the sample is generated from, int
+		:return:
+		"""
+		self._append({'index': index, 'status': 'started', 'seed': seed,
+		              'files': {}})
+
+	def _append(self, record):
+		self._file.write(json.dumps(record) + '\n')
+		self._file.flush()
+		os.fsync(self._file.fileno())
+		self.samples[record['index']] = record
+
+	def _load(self):
+		"""
+		Function that reads the records of a previous run, ignoring a record
+		that was only partially written.
+		:return: last record of every index, dict
+		"""
+		samples, end = {}, 0
+		if not os.path.isfile(self.path):
+			return samples
+		with open(self.path, 'rb') as f:
+			for line in f:
+				try:
+					assert line.endswith(b'\n')
+					record = json.loads(line)
+				except (AssertionError, ValueError):
+					break
+				samples[record['index']] = record
+				end += len(line)
+		with open(self.path, 'r+b') as f:
+			f.truncate(end)
+		return samples
@@ -1,5 +1,5 @@
 import bpy
-import numpy as np
+from collections import OrderedDict
 import os
 import sys
 
@@ -8,22 +8,124 @@ sys.path.append(file_dir)
 file_dir = file_dir.replace('\\', '/').replace('\r', '/r').replace('\n', '/n').\
 	replace('\t', '/t')
 
+from dataset_config import IMAGE_CACHE_SIZE, MATERIAL_CACHE_SIZE
+from seeding import get_rng
+
+
+class TextureCache:
+	"""
+	Class that loads every texture image once per process and removes the least
+	recently used images that are not used anymore.
+	"""
+	def __init__(self, size=IMAGE_CACHE_SIZE):
+		self.size = size
+		self._images = OrderedDict()  # path -> name of the image in bpy.data
+		self._missing = set()
+
+	def get(self, path):
+		"""
+		Function that returns the image of a texture file, loading it on a miss.
+		:param path: path of the texture file, str
+		:return: image, bpy image object
+		"""
+		if path in self._missing:
+			raise FileNotFoundError(path)
+		image = bpy.data.images.get(self._images.get(path, ''))
+		if image is not None:
+			self._images.move_to_end(path)
+			return image
+		try:
+			image = bpy.data.images.load(path, check_existing=True)
+		except RuntimeError:
+			self._missing.add(path)
+			raise
+		self._images[path] = image.name
+		_evict(self._images, bpy.data.images, self.size)
+		return image
+
+	def names(self):
+		"""
+		Function that returns the names of the cached images, which are removed
+		by the cache only.
+		:return: names of the images in bpy.data, set of str
+		"""
+		return set(self._images.values())
+
+
+class MaterialCache:
+	"""
+	Class that keeps one template material per material family and hands out
+	copies of it. The least recently made copies that are not used anymore are
+	removed.
+	"""
+	def __init__(self, size=MATERIAL_CACHE_SIZE):
+		self.size = size
+		self._templates = {}  # family -> name of the template in bpy.data
+		self._instances = OrderedDict()  # name of the copy -> name of the copy
+
+	def instance(self, family, load):
+		"""
+		Function that returns a new copy of the template of a material family.
+		:param family: name of the material family, str
+		:param load: function that loads the template on a miss, callable
+		:return: material, bpy material object
+		"""
+		template = bpy.data.materials.get(self._templates.get(family, ''))
+		if template is None:
+			template = load()
+			template.use_fake_user = True  # keep the template without users
+			self._templates[family] = template.name
+		material = template.copy()
+		self._instances[material.name] = material.name
+		_evict(self._instances, bpy.data.materials, self.size)
+		return material
+
+
+def _evict(cache, data, size):
+	"""
+	Function that removes the least recently used datablocks without users
+	until the cache fits its size.
+	:param cache: names of the datablocks, oldest first, OrderedDict
+	:param data: collection of the datablocks, e.g. bpy.data.images
+	:param size: number of datablocks to keep, int
+	:return:
+	"""
+	for key in list(cache.keys())[:max(0, len(cache) - size)]:
+		block = data.get(cache[key])
+		if block is None:
+			del cache[key]
+		elif block.users == 0:
+			data.remove(block)
+			del cache[key]
+
+
+TEXTURES = TextureCache()
+MATERIALS = MaterialCache()
+
 
 class Material:
 	"""
 	Class that represents a material object in Blender.
 	"""
-	def __init__(self, name):
+	def __init__(self, name, filename='material'):
 		self.name = name.lower().capitalize()  # name of the material and its texture folder
-		self.filename = 'material'
+		self.filename = filename
 		self._path = file_dir + '/Textures/{}.blend'.format(self.filename)
 		self._add = '\\Material\\'
-		self.value = self._load()  # loads material into the scene
+		self.value = self._load()  # copy of the material template
 		self._update_nodes()  # loads the textures to the material
 
 	def _load(self):
+		return MATERIALS.instance(self.name, self._load_template)
+
+	def _load_template(self):
+		"""
+		Function that loads the material the copies are made of, from the scene
+		or from the .blend file of the material.
+		:return: material, bpy material object
+		"""
 		try:
-			return bpy.data.materials[self.name].copy()
+			return bpy.data.materials[self.name]
 		except KeyError:
 			try:
 				# print(file_dir)
@@ -42,7 +144,7 @@ class Material:
 		"""
 		Function that uploads texture map into the Material tree nodes. Textures
 		 are taken from folder Texture/Material where Material corresponds to the
-		 name of the material.
+		 name of the material. Every texture is loaded once per process.
 		:param map_type: type of the map to upload, str, one of 'Diffuse', 'Normal',
 		'Roughness', 'Displacement'
 		:return: texture map, bpy image object
@@ -51,12 +153,8 @@ class Material:
 			"Unknown map type, expected one of: 'Diffuse', 'Normal'," \
 			"'Roughness', 'Displacement'"
 		try:
-			bpy.ops.image.open(filepath=file_dir + '/Textures/{}/{}.png'.
-			                   format(self.name, map_type.capitalize()))
-			_images = [x.filepath for x in bpy.data.images]
-			return bpy.data.images[_images.index('//Textures'
-			                                     '\\{}\\{}.png'.format(self.name,
-			                                                               map_type))]
+			return TEXTURES.get(file_dir + '/Textures/{}/{}.png'.
+			                    format(self.name, map_type.capitalize()))
 		except Exception as e:
 			print('Failed to load {} texture of {}'.format(map_type, self.name))
 			print(repr(e))
@@ -76,7 +174,7 @@ class MaskMaterial(Material):
 	def __init__(self, name='mask', filename='mask', color=(1.0, 1.0, 1.0)):
 		self.filename = filename
 		self.color = color
-		Material.__init__(self, name, filename=self.filename)
+		Material.__init__(self, name, filename=filename)
 
 	def _update_nodes(self):
 		self.value.node_tree.nodes['RGB'].outputs[0].default_value[0] = self.color[0]
@@ -88,8 +186,14 @@ class MaterialFactory:
 	"""
 	Class that produces materials based on the given name.
 	"""
-	def __init__(self):
-		self.materials = os.listdir('{}/Textures'.format(file_dir))
+	def __init__(self, rng=None):
+		"""
+		Class initialization
+		:param rng: random generator of the sample, np.random.Generator,
+		default None (unseeded)
+		"""
+		self.rng = get_rng(rng)
+		self.materials = sorted(os.listdir('{}/Textures'.format(file_dir)))
 		self.materials = [x for x in self.materials if os.path.isdir('{}/Textures/{}'.format(file_dir, x))]
 
 	def produce(self, name=None, color=None):
@@ -97,13 +201,13 @@ class MaterialFactory:
 			if name == 'mask':
 				if not color:
 					color = [1.0, 0.0, 0.0]
-				return MaskMaterial(name, color)
+				return MaskMaterial(name, color=color)
 			else:
 				name = name.lower().capitalize()
 				assert name in self.materials, "Unknown material {}, not in Textures folder".format(name)
 				return Material(name)
 		else:
-			return Material(np.random.choice(self.materials))
+			return Material(self.rng.choice(self.materials))
 
 
 if __name__ == '__main__':
@@ -212,6 +212,26 @@ class GridApplier(ModuleApplier):
 		default=None
 		:return:
 		"""
+		self._validate(module, grid, offset, step)
+
+		for x, h in self._grid(module, grid, offset, step):
+			m = copy(module)
+			position = np.array([0, 0, 0])
+			position[abs(1-module.connector.axis)] = x
+			position[2] = h
+			m.position(position)
+		module.remove()
+
+	def _validate(self, module, grid, offset, step):
+		"""
+		Function that checks the parameters of the grid.
+		:param module: module connected to the volume, Module
+		:param grid: parameters of the grid, tuple (rows, cols), int
+		:param offset: offset from the borders of the volume, tuple
+		(left, bottom, right, top)
+		:param step: parameter of the grid, tuple (hor_step, vert_step)
+		:return:
+		"""
 		assert grid or step, "Please, provide either grid or step parameter"
 		if grid:
 			assert isinstance(grid, list) or isinstance(grid, tuple) or\
@@ -233,6 +253,16 @@ class GridApplier(ModuleApplier):
 		                         "{}".format(len(offset))
 		assert module.connector is not None, "Module should be connected to a volume"
 
+	def _grid(self, module, grid, offset, step):
+		"""
+		Function that computes the grid cells of the module on its volume side.
+		:param module: module connected to the volume, Module
+		:param grid: parameters of the grid, tuple (rows, cols), int
+		:param offset: offset from the borders of the volume, tuple
+		(left, bottom, right, top)
+		:param step: parameter of the grid, tuple (hor_step, vert_step)
+		:return: cells, np.ndarray (n, 2), int, horizontal and vertical offsets
+		"""
 		axis = module.connector.axis
 		_start1 = int(offset[0] + module.scale[abs(1-axis)] / 2)
 		_start2 = int(offset[1] + module.scale[2] / 2)
@@ -251,14 +281,100 @@ class GridApplier(ModuleApplier):
 			if step_h == 0:
 				step_h = math.ceil((_end2 - _start2) / grid[1])
 
-		for x in range(_start1, _end1, step_x):
-			for h in range(_start2, _end2, step_h):
-				m = copy(module)
-				position = np.array([0, 0, 0])
-				position[abs(1-axis)] = x
-				position[2] = h
-				m.position(position)
-		module.remove()
+		xs, hs = np.meshgrid(np.arange(_start1, _end1, step_x),
+		                     np.arange(_start2, _end2, step_h), indexing='ij')
+		return np.stack([xs.ravel(), hs.ravel()], axis=1)
+
+
+class BatchGridApplier(GridApplier):
+	"""
+	Vertical Grid Applier that places all the modules of a facade at once from
+	one template module instead of creating every module with operators.
+	"""
+	def __init__(self, module_type, mode=MODULE_BATCH):
+		"""
+		Class initialization
+		:param module_type: class of the modules to apply, Module subclass
+		:param mode: how the modules are realised, str, 'instance' - linked
+		duplicates sharing the template mesh, 'merge' - one mesh per facade with
+		per-face 'inst_id' and 'instance' attributes, default MODULE_BATCH
+		"""
+		GridApplier.__init__(self, module_type)
+		assert mode in ['instance', 'merge'], "Unknown batch mode {}".format(mode)
+		self.name = 'batch_grid'
+		self.mode = mode
+
+	def _apply(self, module, grid, offset, step):
+		"""
+		Function that applies the module to every cell of the grid.
+		:param module: template module connected to the volume, Module
+		:param grid: parameters of the grid, tuple (rows, cols), int
+		:param offset: offset from the borders of the volume, tuple
+		(left, bottom, right, top)
+		:param step: parameter of the grid, tuple (hor_step, vert_step)
+		:return:
+		"""
+		self._validate(module, grid, offset, step)
+		if module.connector.side != 0:
+			# the copies of GridApplier are connected to the min side of the axis
+			module.connect(module.connector.volume, module.connector.axis)
+		cells = self._grid(module, grid, offset, step)
+		offsets = np.zeros((len(cells), 3))
+		offsets[:, abs(1 - module.connector.axis)] = cells[:, 0]
+		offsets[:, 2] = cells[:, 1]
+		if len(offsets):
+			if self.mode == 'instance':
+				self._instance(module, offsets)
+			else:
+				self._merge(module, offsets)
+		bpy.data.objects.remove(module.mesh, do_unlink=True)
+
+	def _instance(self, module, offsets):
+		"""
+		Function that realises the modules as linked duplicates of the template.
+		:param module: template module, Module
+		:param offsets: offsets of the modules from the template, np.ndarray (n, 3)
+		:return:
+		"""
+		locations = np.array(module.mesh.location) + offsets
+		for location in locations:
+			_object = module.mesh.copy()
+			_object.location = location
+			module.parent.objects.link(_object)
+
+	def _merge(self, module, offsets):
+		"""
+		Function that realises the modules as one mesh.
+		:param module: template module, Module
+		:param offsets: offsets of the modules from the template, np.ndarray (n, 3)
+		:return:
+		"""
+		data = module.mesh.data
+		data.calc_loop_triangles()
+		vertices = np.empty(len(data.vertices) * 3, dtype=np.float32)
+		data.vertices.foreach_get('co', vertices)
+		triangles = np.empty(len(data.loop_triangles) * 3, dtype=np.int32)
+		data.loop_triangles.foreach_get('vertices', triangles)
+		vertices, triangles = vertices.reshape(-1, 3), triangles.reshape(-1, 3)
+
+		matrix = np.array(module.mesh.matrix_basis)
+		vertices = vertices.astype(np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+		vertices = (vertices[None, :, :] + offsets[:, None, :]).reshape(-1, 3)
+		triangles = (triangles[None, :, :] +
+		             len(data.vertices) * np.arange(len(offsets))[:, None, None])
+		instances = np.repeat(np.arange(len(offsets)), len(data.loop_triangles))
+
+		merged = bpy.data.meshes.new(module.name)
+		merged.from_pydata(vertices.tolist(), [], triangles.reshape(-1, 3).tolist())
+		merged.attributes.new('inst_id', 'INT', 'FACE').data.foreach_set(
+			'value', np.full(len(instances), module.mesh["inst_id"], dtype=np.int32))
+		merged.attributes.new('instance', 'INT', 'FACE').data.foreach_set(
+			'value', instances.astype(np.int32))
+		merged.update()
+		_object = bpy.data.objects.new(module.name, merged)
+		_object["inst_id"] = module.mesh["inst_id"]
+		_object.pass_index = module.mesh.pass_index
+		module.parent.objects.link(_object)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,224 @@
+import argparse
+from datetime import datetime
+import json
+import math
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+file_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(file_dir)
+
+from dataset_config import *
+
+
+class Shard:
+	"""
+	Class that represents a disjoint range of dataset indices generated by one
+	Blender process.
+	"""
+	def __init__(self, index, start, size, seed, path):
+		self.index = index
+		self.start = start
+		self.size = size
+		self.seed = seed  # run seed, samples are seeded by the run seed and index
+		self.path = path  # annotation of the shard, written when it is finished
+		self.attempts = 0
+		self.process = None
+		self.log = None
+
+	def done(self):
+		"""
+		Function that checks whether the shard has been successfully generated.
+		:return: bool
+		"""
+		if not os.path.isfile(self.path):
+			return False
+		try:
+			with open(self.path, 'r') as f:
+				return len(json.load(f)) == self.size
+		except ValueError:
+			return False
+
+	def command(self, blender=BLENDER, render_mode=RENDER_MODE,
+	            profile=RENDER_PROFILE, threads=THREADS):
+		"""
+		Function that returns the command that generates the shard.
+		:param blender: path to the blender executable, str
+		:param render_mode: 'full' or 'mask', str, default RENDER_MODE
+		:param profile: name of the render profile, str, default RENDER_PROFILE
+		:param threads: number of render threads, int, default THREADS
+		:return: command, list of str
+		"""
+		command = [blender, '--background', 'setup.blend', '--python', 'dataset.py',
+		           '--', '--start', str(self.start), '--size', str(self.size),
+		           '--seed', str(self.seed), '--annotation', self.path,
+		           '--render_mode', render_mode, '--threads', str(threads)]
+		if profile is not None:
+			command += ['--profile', profile]
+		return command
+
+
+class ShardedDataset:
+	"""
+	Class that splits the dataset generation into shards and runs them in
+	parallel headless Blender processes.
+	"""
+	def __init__(self, size=SIZE, workers=WORKERS, shard_size=None, seed=SEED,
+	             blender=BLENDER, retries=SHARD_RETRIES, render_mode=RENDER_MODE,
+	             profile=RENDER_PROFILE, threads=THREADS):
+		"""
+		Class initialization
+		:param size: number of samples in the dataset, int, default SIZE
+		:param workers: number of Blender processes run at the same time, int,
+		default WORKERS
+		:param shard_size: number of samples per shard, int, default None (one
+		shard per worker)
+		:param seed: run seed, int, default SEED
+		:param blender: path to the blender executable, str, default BLENDER
+		:param retries: number of restarts of a failed shard, int,
+		default SHARD_RETRIES
+		:param render_mode: 'full' - all the render outputs, 'mask' - only the
+		masks, str, default RENDER_MODE
+		:param profile: name of the render profile, str, default RENDER_PROFILE
+		:param threads: number of render threads of every worker, 0 - the cores
+		of the machine divided by the workers, int, default THREADS
+		"""
+		assert workers > 0, "Expected at least one worker, got {}".format(workers)
+		self.name = 'Building_dataset_{}_{}_{}'.format(datetime.now().year,
+		                                               datetime.now().month,
+		                                               datetime.now().day)
+		self.size = size
+		self.workers = workers
+		self.shard_size = shard_size or max(1, math.ceil(size / workers))
+		self.seed = seed
+		self.blender = blender
+		self.retries = retries
+		self.render_mode = render_mode
+		self.profile = profile
+		self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+		self.shard_dir = '{}/shards_{}_{}'.format(file_dir, self.seed, self.shard_size)
+		self.shards = self._split()
+
+	def populate(self):
+		"""
+		Function that generates all the shards that are not finished yet,
+		restarting the failed ones.
+		:return: failed shards, list of Shard
+		"""
+		self._make_dirs()
+		queue = [s for s in self.shards if not s.done()]
+		print('{} of {} shards left to generate'.format(len(queue), len(self.shards)))
+		running, failed = [], []
+		while queue or running:
+			while queue and len(running) < self.workers:
+				running.append(self._start(queue.pop(0)))
+			time.sleep(1.0)
+			for shard in [s for s in running if s.process.poll() is not None]:
+				running.remove(shard)
+				shard.log.close()
+				if shard.process.returncode == 0 and shard.done():
+					print('Shard {} finished'.format(shard.index))
+				elif shard.attempts <= self.retries:
+					print('Shard {} failed, restarting'.format(shard.index))
+					queue.append(shard)
+				else:
+					print('Shard {} failed {} times'.format(shard.index, shard.attempts))
+					failed.append(shard)
+		return failed
+
+	def write(self, filename=None):
+		"""
+		Function that merges the annotations of all the shards into one file.
+		:param filename: name of the .json file, str, default None (dataset name)
+		:return:
+		"""
+		if filename is None:
+			filename = self.name + '.json'
+		full = []
+		for shard in self.shards:
+			assert shard.done(), "Shard {} is not finished".format(shard.index)
+			with open(shard.path, 'r') as f:
+				full.extend(json.load(f))
+		with open(filename, 'w') as f:
+			json.dump(full, f)
+		print('Annotation successfully written as {}'.format(filename))
+
+	def _make_dirs(self):
+		"""
+		Function that creates the output folders before starting the workers so
+		that they do not race on creating them.
+		:return:
+		"""
+		for folder in [self.shard_dir] + ['{}/{}'.format(file_dir, x) for x in
+		                                  [MODEL_SAVE, IMG_SAVE, MASK_SAVE, CLOUD_SAVE,
+		                                   DEPTH_SAVE, NORMAL_SAVE]]:
+			os.makedirs(folder, exist_ok=True)
+
+	def _split(self):
+		"""
+		Function that splits the dataset indices into disjoint shards.
+		:return: shards, list of Shard
+		"""
+		shards = []
+		for i, start in enumerate(range(0, self.size, self.shard_size)):
+			size = min(self.shard_size, self.size - start)
+			shards.append(Shard(i, start, size, self.seed,
+			                    '{}/{}.json'.format(self.shard_dir, i)))
+		return shards
+
+	def _start(self, shard):
+		"""
+		Function that starts a Blender process generating the shard.
+		:param shard: shard to generate, Shard
+		:return: shard, Shard
+		"""
+		shard.attempts += 1
+		shard.log = open('{}/{}.log'.format(self.shard_dir, shard.index), 'w')
+		shard.process = subprocess.Popen(shard.command(self.blender, self.render_mode,
+		                                               self.profile, self.threads),
+		                                 cwd=file_dir, stdout=shard.log,
+		                                 stderr=subprocess.STDOUT)
+		return shard
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+		USAGE: python parallel.py --workers 8
+
+		------------------------------------------------------------------------
+
+		This is an algorithm that generates the synthetic dataset in parallel
+		headless Blender processes and merges their annotations.
+
+		------------------------------------------------------------------------
+
+		'''))
+	parser.add_argument('--size', type=int, default=SIZE,
+	                    help='number of samples in the dataset')
+	parser.add_argument('--workers', type=int, default=WORKERS,
+	                    help='number of Blender processes run at the same time')
+	parser.add_argument('--shard_size', type=int, default=None,
+	                    help='number of samples per shard')
+	parser.add_argument('--seed', type=int, default=SEED, help='run seed')
+	parser.add_argument('--blender', type=str, default=BLENDER,
+	                    help='path to the blender executable')
+	parser.add_argument('--render_mode', type=str, default=RENDER_MODE,
+	                    choices=['full', 'mask'],
+	                    help='full - all the render outputs, mask - only the masks')
+	parser.add_argument('--profile', type=str, default=RENDER_PROFILE,
+	                    choices=list(RENDER_PROFILES), help='render profile')
+	parser.add_argument('--threads', type=int, default=THREADS,
+	                    help='render threads of every worker, 0 - cores / workers')
+	args = parser.parse_args()
+
+	d = ShardedDataset(size=args.size, workers=args.workers,
+	                   shard_size=args.shard_size, seed=args.seed,
+	                   blender=args.blender, render_mode=args.render_mode,
+	                   profile=args.profile, threads=args.threads)
+	if d.populate():
+		sys.exit(1)
+	d.write()
@@ -1,13 +1,12 @@
+import numpy as np
 import os
 import sys
 
-sys.path.append("D:\ProgramFiles\Anaconda\envs\py37\Lib\site-packages")
-from pyntcloud import PyntCloud
-
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
 from dataset_config import *
+from seeding import get_rng
 
 
 # Question: how many points per building (2048) - ModelNet40
@@ -16,10 +15,32 @@ class PointCloud:
 	def __init__(self):
 		self.points = POINTS
 
-	def make(self, filename):
-		self._make(filename)
+	def make(self, filename, triangles=None, save=True, rng=None):
+		"""
+		Function that samples the point cloud of a building and writes it as a
+		.ply file.
+		:param filename: name of the file without extension, str or int
+		:param triangles: world triangles of the building, np.ndarray (n, 3, 3),
+		default None (sample the mesh previously exported to the .ply file)
+		:param save: write the .ply file, bool, default True
+		:param rng: random generator of the sample, np.random.Generator,
+		default None (unseeded)
+		:return: points, normals, np.ndarray (POINTS, 3), None for the .ply mesh
+		"""
+		if triangles is None:
+			self._make(filename)
+			return None, None
+		points, normals = sample(triangles, self.points, rng)
+		if save:
+			os.makedirs('{}/{}'.format(file_dir, CLOUD_SAVE), exist_ok=True)
+			write_ply('{}/{}/{}.ply'.format(file_dir, CLOUD_SAVE, filename), points,
+			          normals)
+		return points, normals
 
 	def _make(self, filename):
+		sys.path.append("D:\ProgramFiles\Anaconda\envs\py37\Lib\site-packages")
+		from pyntcloud import PyntCloud
+
 		print(filename)
 		cloud = PyntCloud.from_file("{}/{}.ply".format(CLOUD_SAVE, filename))
 		cloud = cloud.get_sample('mesh_random', n=self.points, rgb=False,
@@ -27,6 +48,55 @@ class PointCloud:
 		cloud.to_file("{}/{}.ply".format(CLOUD_SAVE, filename))
 
 
+def sample(triangles, number, rng=None):
+	"""
+	Function that samples points uniformly on the surface of a mesh: triangles
+	are drawn with a probability proportional to their area and the points are
+	placed inside them with random barycentric coordinates.
+	:param triangles: corners of the triangles, np.ndarray (n, 3, 3)
+	:param number: number of points to sample, int
+	:param rng: random generator, np.random.Generator, default None (unseeded)
+	:return: points, np.ndarray (number, 3), float32
+	         unit normals of the triangles of the points, np.ndarray (number, 3),
+	         float32
+	"""
+	triangles = np.asarray(triangles, dtype=np.float64)
+	assert triangles.ndim == 3 and triangles.shape[1:] == (3, 3), \
+		"Expected triangles of shape (n, 3, 3), got {}".format(triangles.shape)
+	cross = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+	areas = np.linalg.norm(cross, axis=1)
+	assert areas.sum() > 0, "Expected a mesh with a surface to sample"
+	rng = get_rng(rng)
+	chosen = rng.choice(len(triangles), size=number, p=areas / areas.sum())
 
+	u, v = rng.random(number), rng.random(number)
+	outside = u + v > 1.0  # fold the points of the parallelogram into the triangle
+	u[outside], v[outside] = 1.0 - u[outside], 1.0 - v[outside]
+	corners = triangles[chosen]
+	points = corners[:, 0] + u[:, None] * (corners[:, 1] - corners[:, 0]) + \
+	         v[:, None] * (corners[:, 2] - corners[:, 0])
+	normals = cross[chosen] / areas[chosen, None]
+	return points.astype(np.float32), normals.astype(np.float32)
 
 
+def write_ply(filename, points, normals=None):
+	"""
+	Function that writes a point cloud as a binary .ply file.
+	:param filename: path of the file, str
+	:param points: points, np.ndarray (n, 3)
+	:param normals: normals of the points, np.ndarray (n, 3), default None
+	:return:
+	"""
+	names = ['x', 'y', 'z'] + (['nx', 'ny', 'nz'] if normals is not None else [])
+	vertices = np.empty(len(points), dtype=[(x, '<f4') for x in names])
+	for i, name in enumerate(['x', 'y', 'z']):
+		vertices[name] = points[:, i]
+	if normals is not None:
+		for i, name in enumerate(['nx', 'ny', 'nz']):
+			vertices[name] = normals[:, i]
+	header = ['ply', 'format binary_little_endian 1.0',
+	          'element vertex {}'.format(len(points))] + \
+	         ['property float {}'.format(x) for x in names] + ['end_header']
+	with open(filename, 'wb') as f:
+		f.write(('\n'.join(header) + '\n').encode('ascii'))
+		f.write(vertices.tobytes())
@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+import json
+import numpy as np
+import os
+import sys
+import time
+
+try:
+	import resource
+except ImportError:  # not available on Windows
+	resource = None
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset_config import *
+
+
+class Profiler:
+	"""
+	Class that measures the wall and CPU time of the stages of every sample
+	and appends one JSON line per sample to a log file. The times of the
+	samples are kept to summarise them with percentiles at the end of the run.
+	"""
+	def __init__(self, filename, enabled=PROFILE):
+		"""
+		Class initialization
+		:param filename: path of the .jsonl log, str
+		:param enabled: measure the stages, bool, default PROFILE
+		"""
+		self.path = filename
+		self.enabled = enabled
+		self.record = None
+		self.times = {}  # stage -> wall times of the samples, list of float
+		self._file = open(self.path, 'a') if self.enabled else None
+
+	def start(self, index):
+		"""
+		Function that starts the record of a sample.
+		:param index: index of the sample, int
+		:return:
+		"""
+		if not self.enabled:
+			return
+		self.record = {'index': index, 'stages': {},
+		               'start': (time.perf_counter(), time.process_time())}
+
+	@contextmanager
+	def stage(self, name):
+		"""
+		Function that measures a stage of the current sample. The times of a
+		stage measured several times in a sample are summed.
+		:param name: name of the stage, str
+		:return:
+		"""
+		if self.record is None:
+			yield
+			return
+		wall, cpu = time.perf_counter(), time.process_time()
+		try:
+			yield
+		finally:
+			stage = self.record['stages'].setdefault(name, {'wall': 0.0, 'cpu': 0.0,
+			                                                'calls': 0})
+			stage['wall'] += time.perf_counter() - wall
+			stage['cpu'] += time.process_time() - cpu
+			stage['calls'] += 1
+
+	def end(self, counts=None):
+		"""
+		Function that finishes the record of a sample and writes it.
+		:param counts: datablock counts after the sample, dict, default None
+		:return: record of the sample, dict
+		"""
+		if self.record is None:
+			return None
+		record, self.record = self.record, None
+		wall, cpu = record.pop('start')
+		record['wall'] = time.perf_counter() - wall
+		record['cpu'] = time.process_time() - cpu
+		record['max_rss'] = _max_rss()
+		record['datablocks'] = counts or {}
+		for name, stage in record['stages'].items():
+			self.times.setdefault(name, []).append(stage['wall'])
+		self.times.setdefault('total', []).append(record['wall'])
+		self._file.write(json.dumps(record) + '\n')
+		self._file.flush()
+		return record
+
+	def summary(self, percentiles=(50, 90, 99)):
+		"""
+		Function that summarises the wall times of the stages of the samples
+		measured in this run.
+		:param percentiles: percentiles to compute, tuple of int
+		:return: mean, percentiles and maximum of every stage in seconds, dict
+		"""
+		summary = {}
+		for name, times in self.times.items():
+			times = np.asarray(times)
+			summary[name] = {'samples': len(times), 'mean': float(times.mean()),
+			                 'max': float(times.max())}
+			summary[name].update({'p{}'.format(p): float(np.percentile(times, p))
+			                      for p in percentiles})
+		return summary
+
+	def close(self):
+		"""
+		Function that closes the log, writes the summary next to it and prints
+		it.
+		:return:
+		"""
+		if not self.enabled or self._file.closed:
+			return
+		self._file.close()
+		summary = self.summary()
+		with open(os.path.splitext(self.path)[0] + '.summary.json', 'w') as f:
+			json.dump(summary, f, indent=4)
+		total = summary.get('total', {}).get('mean', 0.0) or 1.0
+		print('{:<14}{:>8}{:>10}{:>10}{:>10}{:>10}{:>8}'.format(
+			'stage', 'samples', 'mean', 'p50', 'p90', 'p99', 'share'))
+		for name, stage in sorted(summary.items(), key=lambda x: -x[1]['mean']):
+			print('{:<14}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>7.1f}%'.format(
+				name, stage['samples'], stage['mean'], stage['p50'], stage['p90'],
+				stage['p99'], 100 * stage['mean'] / total))
+
+
+def _max_rss():
+	"""
+	Function that returns the peak resident memory of the process.
+	:return: peak resident memory in MB, float or None if it is unknown
+	"""
+	if resource is None:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# kilobytes on Linux, bytes on macOS
+	return round(rss / (1024.0 ** 2 if sys.platform == 'darwin' else 1024.0), 1)
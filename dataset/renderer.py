@@ -9,26 +9,74 @@ import sys
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
-from dataset_config import ENGINE, MASK_SAVE, IMG_SAVE, MODULES, IMAGE_SIZE
+from dataset_config import ENGINE, MASK_SAVE, IMG_SAVE, MODULES, IMAGE_SIZE, \
+	DEPTH_SAVE, NORMAL_SAVE, RENDER_FORMAT, RENDER_MODE, RENDER_OUTPUTS, \
+	MERGE_BUILDING, RENDER_PROFILE, RENDER_PROFILES, THREADS
 from shp2obj import deselect_all
 
 
+# Cycles settings of the mask render mode. The object index pass is written by
+# the first sample only, so one sample without bounces gives the same masks as
+# the full render while the materials still decide displacement and alpha.
+MASK_SETTINGS = {'samples': 1, 'use_adaptive_sampling': False,
+                 'use_denoising': False, 'max_bounces': 0, 'diffuse_bounces': 0,
+                 'glossy_bounces': 0, 'transmission_bounces': 0,
+                 'volume_bounces': 0, 'caustics_reflective': False,
+                 'caustics_refractive': False}
+
+
 class Renderer:
 	"""
 	Class that manages the scene rendering. Incomplete.
 	"""
-	def __init__(self, mode=0):
+	def __init__(self, mode=0, outputs=RENDER_OUTPUTS, render_mode=RENDER_MODE,
+	             profile=RENDER_PROFILE, threads=THREADS):
+		"""
+		Class initialization
+		:param mode: segmentation mode: 0 - color, 1 - grayscale, default 0
+		:param outputs: outputs written by one render, list of str from 'rgb',
+		'mask', 'depth', 'normal', default RENDER_OUTPUTS. If empty, the image
+		and the mask are saved from the render result and the viewer node
+		:param render_mode: 'full' - all the outputs with ENGINE, 'mask' - only
+		the mask with one Cycles sample (MASK_SETTINGS), str, default RENDER_MODE
+		:param profile: name of the Cycles profile in RENDER_PROFILES, None - keep
+		the settings of the scene, str, default RENDER_PROFILE
+		:param threads: number of render threads, 0 - all the cores, int,
+		default THREADS
+		"""
+		assert render_mode in ['full', 'mask'], \
+			"Unknown render mode {}".format(render_mode)
+		assert profile is None or profile in RENDER_PROFILES, \
+			"Unknown render profile {}, expected one of {}".format(
+				profile, list(RENDER_PROFILES))
+		assert threads >= 0, "Expected a positive number of threads, got {}".format(threads)
 		self.engine = ENGINE
 		self.mode = mode
+		self.outputs = outputs
+		self.file_format = RENDER_FORMAT
+		self.render_mode = render_mode
+		if self.render_mode == 'mask':
+			self.engine = 'CYCLES'  # the other engines have no object index pass
+			self.outputs = ['mask']
+			self.file_format = 'PNG'
 		if self.mode == 0:
 			bpy.types.ImageFormatSettings.color_mode = 'RGBA'
 		self._scene_name = bpy.data.scenes[-1].name
 		self.scene = bpy.data.scenes[self._scene_name]
-		self.scene.view_layers["View Layer"].use_pass_object_index = True
+		self.scene.view_layers["View Layer"].use_pass_object_index = not MERGE_BUILDING
+		# the instances of a merged building are told apart by their materials
+		self.scene.view_layers["View Layer"].use_pass_material_index = MERGE_BUILDING
+		if self.outputs:
+			self.scene.view_layers["View Layer"].use_pass_z = 'depth' in self.outputs
+			self.scene.view_layers["View Layer"].use_pass_normal = 'normal' in self.outputs
 		# self.scene.render.use_overwrite = False
 		self.scene.render.image_settings.color_mode = 'RGBA'
 		self.scene.render.resolution_x = IMAGE_SIZE[0]
 		self.scene.render.resolution_y = IMAGE_SIZE[1]
+		self.profile = profile
+		if self.profile is not None:
+			self._apply_profile(RENDER_PROFILES[self.profile])
+		self._set_threads(threads)
 
 	def render(self, filename='new_mask_test'):
 		"""
@@ -37,12 +85,72 @@ class Renderer:
 		:param filename: name of the file, str
 		:return:
 		"""
-		_ = CustomNodeTree(self.mode).make()
+		viewer = CustomNodeTree(self.mode).make()
 		deselect_all(True)
 		bpy.ops.view3d.camera_to_view_selected()
 		deselect_all()
-		self._render(filename)
-		self._render_mask(filename)
+		if self.render_mode == 'mask':
+			previous = self._apply(MASK_SETTINGS)
+			try:
+				self._render_outputs(filename, viewer)
+			finally:
+				self._apply(previous)
+		elif self.outputs:
+			self._render_outputs(filename, viewer)
+		else:
+			self._render(filename)
+			self._render_mask(filename)
+
+	def _apply_profile(self, profile):
+		"""
+		Function that sets the samples, the adaptive sampling, the tile size, the
+		denoiser and the light bounces of a render profile.
+		:param profile: settings of the profile, dict
+		:return:
+		"""
+		settings = {'samples': profile['samples'],
+		            'use_adaptive_sampling': profile['adaptive_threshold'] > 0,
+		            'adaptive_threshold': profile['adaptive_threshold'],
+		            'use_denoising': profile['denoiser'] is not None,
+		            'max_bounces': profile['max_bounces']}
+		if profile['denoiser'] is not None:
+			settings['denoiser'] = profile['denoiser']
+		self._apply(settings)
+		view_layer = self.scene.view_layers["View Layer"]
+		if hasattr(view_layer, 'cycles') and hasattr(view_layer.cycles, 'use_denoising'):
+			view_layer.cycles.use_denoising = profile['denoiser'] is not None
+		if hasattr(self.scene.cycles, 'tile_size'):
+			self.scene.cycles.tile_size = profile['tile']
+		else:
+			self.scene.render.tile_x = profile['tile']
+			self.scene.render.tile_y = profile['tile']
+
+	def _set_threads(self, threads):
+		"""
+		Function that sets the number of render threads, so that several
+		Blender processes can share the cores of one machine.
+		:param threads: number of threads, 0 - all the cores, int
+		:return:
+		"""
+		if threads == 0:
+			self.scene.render.threads_mode = 'AUTO'
+		else:
+			self.scene.render.threads_mode = 'FIXED'
+			self.scene.render.threads = threads
+
+	def _apply(self, settings):
+		"""
+		Function that sets the Cycles settings of the scene.
+		:param settings: values of the settings, dict
+		:return: previous values of the settings, dict
+		"""
+		cycles = self.scene.cycles
+		previous = {}
+		for key, value in settings.items():
+			if hasattr(cycles, key):
+				previous[key] = getattr(cycles, key)
+				setattr(cycles, key, value)
+		return previous
 
 	def _render_bpycv(self, filename='test'):
 		"""
@@ -81,6 +189,45 @@ class Renderer:
 		bpy.data.images["Viewer Node"].save_render('{}/{}_mask.png'.format(MASK_SAVE,
 		                                                                   filename))
 
+	def _render_outputs(self, filename, viewer):
+		"""
+		Function that renders the scene once and writes all the outputs of the
+		same frame through a File Output node.
+		:param filename: name of the file, str
+		:param viewer: resulting node of the mask tree, node
+		:return:
+		"""
+		tree = OutputNodeTree(self.outputs, self.file_format)
+		node = tree.make(viewer)
+		_tmp = '{}/.render/{}'.format(os.path.abspath(file_dir), os.getpid())
+		os.makedirs(_tmp, exist_ok=True)
+		node.base_path = _tmp + '/' + ('layers_' if tree.multilayer else '')
+		self.scene.render.engine = self.engine
+		bpy.ops.render.render()
+
+		frame = '{:04d}'.format(self.scene.frame_current)
+		if tree.multilayer:
+			self._move('{}/layers_{}.exr'.format(_tmp, frame), IMG_SAVE,
+			           '{}.exr'.format(filename))
+			return
+		folders = {'rgb': (IMG_SAVE, ''), 'mask': (MASK_SAVE, '_mask'),
+		           'depth': (DEPTH_SAVE, '_depth'), 'normal': (NORMAL_SAVE, '_normal')}
+		for output in self.outputs:
+			folder, suffix = folders[output]
+			self._move('{}/{}_{}.png'.format(_tmp, output, frame), folder,
+			           '{}{}.png'.format(filename, suffix))
+
+	def _move(self, source, folder, filename):
+		"""
+		Function that moves a file written by the File Output node to its folder.
+		:param source: path of the written file, str
+		:param folder: folder to move the file to, str
+		:param filename: new name of the file, str
+		:return:
+		"""
+		os.makedirs(folder, exist_ok=True)
+		os.replace(source, '{}/{}'.format(folder, filename))
+
 	def _render_keypoints(self):
 		"""
 		Function that renders the scene as a one-channel mask of predefined
@@ -102,14 +249,22 @@ class CustomNodeTree:
 		self.root_node = self.scene.node_tree.nodes["Render Layers"]
 		self.mode = mode
 		self.margin = 60
+		self.label = 'mask'  # label of the nodes that belong to the mask tree
 
 	def make(self):
 		"""
 		Function that builds the entire node tree for instance segmentation and
-		returns the resulting node.
+		returns the resulting node. The tree is built once per scene and only
+		rebuilt when the mode or MODULES change.
 		:return: resulting node, node
 		"""
-		return self._build_pass_tree()
+		viewer = self._find()
+		if viewer is not None:
+			return viewer
+		self._remove()
+		viewer = self._build_pass_tree()
+		self.scene['mask_tree'] = self._signature()
+		return viewer
 
 	def _build_pass_tree(self):
 		"""
@@ -122,12 +277,26 @@ class CustomNodeTree:
 		for index in range(1, len(MODULES) + 2):
 			result_node = self._material_branch(index, result_node)
 
-		output_node = self.scene.node_tree.nodes.new(type="CompositorNodeViewer")
+		output_node = self._new("CompositorNodeViewer")
+		output_node.name = 'Mask Viewer'
 		output_node.use_alpha = True
 		_ = self.links.new(result_node.outputs["Image"], output_node.inputs["Image"])
 		self._place_node(output_node, result_node, 1)
 		return output_node
 
+	def _find(self):
+		"""
+		Function that returns the output node of the tree built for the same mode
+		and modules, if there is one.
+		:return: resulting node, node or None
+		"""
+		if self.scene.get('mask_tree') != self._signature():
+			return None
+		viewer = self.scene.node_tree.nodes.get('Mask Viewer')
+		if viewer is None or not viewer.inputs["Image"].is_linked:
+			return None
+		return viewer
+
 	def _make_add_node(self, node1, node2):
 		"""
 		Function that combines two nodes together summing their values.
@@ -135,7 +304,7 @@ class CustomNodeTree:
 		:param node2: second image node, node
 		:return: resulting node, node
 		"""
-		add_node = self.scene.node_tree.nodes.new(type="CompositorNodeMixRGB")
+		add_node = self._new("CompositorNodeMixRGB")
 		add_node.blend_type = 'Add'.upper()
 		link = self.links.new(node1.outputs["Image"], add_node.inputs[1])
 		link = self.links.new(node2.outputs["Image"], add_node.inputs[2])
@@ -149,9 +318,9 @@ class CustomNodeTree:
 		TODO: make a separate class
 		TODO: add an option to make color masks (3 values -> rgba node)
 		"""
-		node = self.scene.node_tree.nodes.new(type="CompositorNodeValue")
+		node = self._new("CompositorNodeValue")
 		node.outputs[0].default_value = value
-		alpha_node = self.scene.node_tree.nodes.new(type="CompositorNodeSetAlpha")
+		alpha_node = self._new("CompositorNodeSetAlpha")
 		_ = self.links.new(node.outputs["Value"], alpha_node.inputs["Image"])
 		return alpha_node
 
@@ -163,7 +332,7 @@ class CustomNodeTree:
 		TODO: make a separate class
 		TODO: add an option to make color masks (3 values -> rgba node)
 		"""
-		hsv_node = self.scene.node_tree.nodes.new(type="CompositorNodeCombHSVA")
+		hsv_node = self._new("CompositorNodeCombHSVA")
 		hsv_node.inputs[0].default_value = value
 		hsv_node.inputs[1].default_value = 1.0
 		hsv_node.inputs[2].default_value = 1.0
@@ -175,11 +344,12 @@ class CustomNodeTree:
 		:param index: index of the objects to render as a mask, int >= 0
 		:return: mask_id_node, node
 		"""
-		node = self.scene.node_tree.nodes.new(type="CompositorNodeIDMask")
+		node = self._new("CompositorNodeIDMask")
 		node.use_antialiasing = True
 		node.index = index
 		node.update()
-		_ = self.links.new(self.root_node.outputs["IndexOB"], node.inputs["ID value"])
+		_ = self.links.new(self.root_node.outputs["IndexMA" if MERGE_BUILDING else "IndexOB"],
+		                   node.inputs["ID value"])
 		return node
 
 	def _make_multiply_node(self, node1, node2):
@@ -189,7 +359,7 @@ class CustomNodeTree:
 		:param node2: second image node, node
 		:return: resulting node, node
 		"""
-		multiply_node = self.scene.node_tree.nodes.new(type="CompositorNodeMixRGB")
+		multiply_node = self._new("CompositorNodeMixRGB")
 		multiply_node.blend_type = 'Multiply'.upper()
 		_ = self.links.new(node1.outputs["Alpha"], multiply_node.inputs[1])
 		_ = self.links.new(node2.outputs["Image"], multiply_node.inputs[2])
@@ -223,6 +393,28 @@ class CustomNodeTree:
 			return add_node
 		return multiply_node
 
+	def _new(self, node_type):
+		"""
+		Function that adds a node to the tree and marks it as a mask node.
+		:param node_type: type of the node, str
+		:return: node, node
+		"""
+		node = self.scene.node_tree.nodes.new(type=node_type)
+		node.label = self.label
+		return node
+
+	def _remove(self):
+		"""
+		Function that removes the mask nodes of a previous tree.
+		:return:
+		"""
+		nodes = self.scene.node_tree.nodes
+		for node in [x for x in nodes if x.label == self.label]:
+			nodes.remove(node)
+
+	def _signature(self):
+		return '{}:{}:{}'.format(self.mode, ','.join(MODULES), MERGE_BUILDING)
+
 	def _place_node(self, node, prev_node, axis):
 		"""
 		Function that places a node near the previous one aligned along one axis.
@@ -239,6 +431,126 @@ class CustomNodeTree:
 		node.location[axis] = prev_node.location[axis]
 
 
+class OutputNodeTree(CustomNodeTree):
+	"""
+	Class that builds the File Output node writing the render, the mask, the
+	depth and the normals of one render.
+	"""
+	def __init__(self, outputs=RENDER_OUTPUTS, file_format=RENDER_FORMAT):
+		"""
+		Class initialization
+		:param outputs: outputs to write, list of str from 'rgb', 'mask',
+		'depth', 'normal'
+		:param file_format: 'PNG' - one file per output, 'OPEN_EXR_MULTILAYER' -
+		one file with a layer per output
+		"""
+		CustomNodeTree.__init__(self)
+		assert set(outputs) <= {'rgb', 'mask', 'depth', 'normal'}, \
+			"Unknown render outputs {}".format(outputs)
+		assert file_format in ['PNG', 'OPEN_EXR_MULTILAYER'], \
+			"Unknown render format {}".format(file_format)
+		self.outputs = list(outputs)
+		self.file_format = file_format
+		self.multilayer = file_format == 'OPEN_EXR_MULTILAYER'
+		self.label = 'outputs'
+
+	def make(self, viewer):
+		"""
+		Function that returns the File Output node, building it the first time.
+		:param viewer: resulting node of the mask tree, node
+		:return: file output node, node
+		"""
+		node = self._find()
+		if node is not None:
+			return node
+		self._remove()
+		node = self._build_output_tree(viewer)
+		self.scene['output_tree'] = self._signature()
+		return node
+
+	def _build_output_tree(self, viewer):
+		"""
+		Function that links the outputs to the inputs of a File Output node.
+		:param viewer: resulting node of the mask tree, node
+		:return: file output node, node
+		"""
+		node = self._new("CompositorNodeOutputFile")
+		node.name = 'Sample Output'
+		node.format.file_format = self.file_format
+		if self.multilayer:
+			node.format.color_depth = '32'
+			slots = node.layer_slots
+		else:
+			node.format.color_mode = 'RGBA'
+			slots = node.file_slots
+		slots.clear()
+		self._place_node(node, viewer, 0)
+
+		sources = {'rgb': self.root_node.outputs["Image"],
+		           'mask': viewer.inputs["Image"].links[0].from_socket}
+		if 'depth' in self.outputs:
+			sources['depth'] = self._depth()
+		if 'normal' in self.outputs:
+			sources['normal'] = self._normal()
+		for output in self.outputs:
+			slots.new(output if self.multilayer else output + '_')
+			_ = self.links.new(sources[output], node.inputs[-1])
+			if not self.multilayer and output == 'depth':
+				slot = node.file_slots[-1]
+				slot.use_node_format = False
+				slot.format.file_format = 'PNG'
+				slot.format.color_mode = 'BW'
+				slot.format.color_depth = '16'
+		return node
+
+	def _depth(self):
+		"""
+		Function that makes the depth of the render fit the [0, 1] range of an
+		image, except for the multilayer format that keeps the distances.
+		:return: depth socket, node socket
+		"""
+		if self.multilayer:
+			return self.root_node.outputs["Depth"]
+		node = self._new("CompositorNodeNormalize")
+		_ = self.links.new(self.root_node.outputs["Depth"], node.inputs[0])
+		return node.outputs[0]
+
+	def _normal(self):
+		"""
+		Function that maps the normals of the render from [-1, 1] to [0, 1],
+		except for the multilayer format that keeps the values.
+		:return: normal socket, node socket
+		"""
+		if self.multilayer:
+			return self.root_node.outputs["Normal"]
+		scale = self._new("CompositorNodeMixRGB")
+		scale.blend_type = 'MULTIPLY'
+		scale.inputs[2].default_value = (0.5, 0.5, 0.5, 1.0)
+		_ = self.links.new(self.root_node.outputs["Normal"], scale.inputs[1])
+		shift = self._new("CompositorNodeMixRGB")
+		shift.blend_type = 'ADD'
+		shift.inputs[2].default_value = (0.5, 0.5, 0.5, 1.0)
+		_ = self.links.new(scale.outputs["Image"], shift.inputs[1])
+		return shift.outputs["Image"]
+
+	def _find(self):
+		"""
+		Function that returns the File Output node built for the same outputs,
+		if it is still linked to the mask tree.
+		:return: file output node, node or None
+		"""
+		if self.scene.get('output_tree') != self._signature():
+			return None
+		node = self.scene.node_tree.nodes.get('Sample Output')
+		if node is None or not all(x.is_linked for x in node.inputs):
+			return None
+		return node
+
+	def _signature(self):
+		return '{}:{}:{}'.format(self.file_format, ','.join(self.outputs),
+		                         ','.join(MODULES))
+
+
 if __name__ == '__main__':
 
 	from generator import *
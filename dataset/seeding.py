@@ -0,0 +1,39 @@
+import numpy as np
+
+
+def sample_seed(seed, index):
+	"""
+	Function that derives the seed of one sample from the run seed, so that any
+	sample can be generated again on its own.
+	:param seed: run seed, int
+	:param index: index of the sample, int
+	:return: seed of the sample, int
+	"""
+	return int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
+
+
+def sample_rng(seed, index, stream=None):
+	"""
+	Function that returns the random generator of one sample. The generators of
+	different indices are independent, so sample n is generated without
+	drawing the numbers of the samples before it.
+	:param seed: run seed, int
+	:param index: index of the sample, int
+	:param stream: independent stream of the sample, so that a stage draws the
+	same numbers whether the stages before it ran or not, int, default None
+	:return: random generator, np.random.Generator
+	"""
+	entropy = [seed, index] if stream is None else [seed, index, stream]
+	return np.random.default_rng(np.random.SeedSequence(entropy))
+
+
+def get_rng(rng=None):
+	"""
+	Function that returns the random generator to draw from.
+	:param rng: random generator, seed or None, np.random.Generator or int,
+	default None (a new generator seeded from the operating system)
+	:return: random generator, np.random.Generator
+	"""
+	if isinstance(rng, np.random.Generator):
+		return rng
+	return np.random.default_rng(rng)
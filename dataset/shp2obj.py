@@ -1,5 +1,6 @@
 import argparse
-import bpy
+from collections import deque
+import multiprocessing
 import numpy as np
 import os
 import sys
@@ -7,8 +8,15 @@ import textwrap
 
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
-from annotation import Annotation
-from blender_utils import get_min_max
+try:
+	import bpy
+	from blender_utils import get_polygons
+except ImportError:  # outside Blender, only GltfReader is available
+	bpy = None
+from annotation import Annotation, StreamingAnnotation
+from dataset_config import *
+from gltf import Gltf, transform
+from spatial import open_index
 
 
 class Building:
@@ -17,28 +25,114 @@ class Building:
 	"""
 	def __init__(self, mesh):
 		self.building = mesh
+		self.name = mesh.name
+		self._arrays = None
+
+	def arrays(self):
+		"""
+		Function that reads the mesh of the building once.
+		:return: world vertices, polygon sizes and polygon vertices, see
+		blender_utils.get_polygons
+		"""
+		if self._arrays is None:
+			self._arrays = get_polygons(self.building)
+		return self._arrays
 
 	def get_bb(self):
 		"""
 		Function that gets the bounding box of the Building
 		:return: bounding box, list of float
-		[width_from, height_from, width_to, height_to]
+		[width_from, width_to, length_from, length_to]
 		"""
-		_bb = list(get_min_max(self.building, 0)) + \
-		      list(get_min_max(self.building, 1))
-		return _bb
+		vertices = self.arrays()[0]
+		if not len(vertices):
+			return [0.0, 0.0, 0.0, 0.0]
+		low, high = vertices.min(axis=0), vertices.max(axis=0)
+		return [float(low[0]), float(high[0]), float(low[1]), float(high[1])]
 
-	def save(self, filename='test', ext='obj'):
+	def save(self, filename='test.obj'):
 		"""
-		Function that saves the building as a separate file.
-		:param filename: name of the file to write without extension, str,
-		default='test'
-		:param ext: file extension, str, default='obj'
+		Function that saves the building as a separate .obj file.
+		:param filename: path of the file to write, str, default='test.obj'
 		:return:
 		"""
-		deselect_all()
-		self.building.select_set(True)
-		bpy.ops.export_scene.obj(filepath=filename, use_selection=True)
+		write_obj(filename, *self.arrays(), name=self.name)
+
+	def release(self):
+		"""
+		Function that returns the arrays read from the mesh and drops them from
+		the building.
+		:return: arrays of the mesh, see arrays, None if they were not read
+		"""
+		arrays, self._arrays = self._arrays, None
+		return arrays
+
+
+class GltfBuilding(Building):
+	"""
+	Class that represents a building of a .gltf file read without Blender. The
+	mesh is read from the file every time it is needed and not kept.
+	"""
+	def __init__(self, gltf, name, mesh, matrix):
+		"""
+		Class initialization
+		:param gltf: file the building is in, Gltf
+		:param name: name of the building, str
+		:param mesh: index of the mesh of the building, int
+		:param matrix: world matrix of the building in Z up, np.ndarray (4, 4)
+		"""
+		self.gltf = gltf
+		self.name = name
+		self.mesh = mesh
+		self.matrix = matrix
+
+	def arrays(self):
+		"""
+		Function that reads the mesh of the building.
+		:return: world vertices, np.ndarray (n, 3), float32
+		         number of vertices of every polygon, np.ndarray (m,), int32
+		         vertices of the polygons one after the other, np.ndarray (sum,)
+		"""
+		vertices, loops, offset = [], [], 0
+		for position, indices in self.gltf.triangles(self.mesh):
+			points = self.gltf.accessor(position)
+			vertices.append(transform(points, self.matrix))
+			if indices is None:
+				loops.append(np.arange(len(points), dtype=np.int64) + offset)
+			else:
+				loops.append(self.gltf.accessor(indices).astype(np.int64) + offset)
+			offset += len(points)
+		if not vertices:
+			return np.zeros((0, 3), np.float32), np.zeros(0, np.int32), np.zeros(0, np.int64)
+		loops = np.concatenate(loops)
+		return np.concatenate(vertices), np.full(len(loops) // 3, 3, np.int32), loops
+
+	def get_bb(self):
+		"""
+		Function that gets the bounding box of the Building from the bounds
+		stored in the file, without reading the mesh.
+		:return: bounding box, list of float
+		[width_from, width_to, length_from, length_to]
+		"""
+		corners = []
+		for position, _ in self.gltf.triangles(self.mesh):
+			bounds = self.gltf.bounds(position)
+			if bounds is None:
+				return Building.get_bb(self)
+			# the 8 corners of the box, exact for the axis swaps of a GIS export
+			corners.append(np.stack(np.meshgrid(*bounds.T, indexing='ij'), -1).reshape(-1, 3))
+		if not corners:
+			return [0.0, 0.0, 0.0, 0.0]
+		corners = transform(np.concatenate(corners), self.matrix)
+		low, high = corners.min(axis=0), corners.max(axis=0)
+		return [float(low[0]), float(high[0]), float(low[1]), float(high[1])]
+
+	def release(self):
+		"""
+		Function that returns the arrays read from the mesh, which are not kept.
+		:return: None
+		"""
+		return None
 
 
 class Collection:
@@ -147,13 +241,8 @@ class BlenderReader:
 		"""
 		to_clean = [x for x in self.obj if
 		            x.parent and x.parent.name != self.filename.split('.')[0]]
-		deselect_all()
-		for mesh in to_clean:
-			try:
-				mesh.select_set(True)
-				bpy.ops.object.delete()
-			except Exception:
-				pass
+		for mesh in to_clean:  # without the operator, which scans the whole scene
+			bpy.data.objects.remove(mesh, do_unlink=True)
 
 	def _import(self):
 		"""
@@ -163,6 +252,49 @@ class BlenderReader:
 		bpy.ops.import_scene.gltf(filepath=self.filename)
 
 
+class GltfReader:
+	"""
+	Class that reads the buildings of a .gltf or .glb file without Blender.
+	The buildings are the meshes that BlenderReader keeps: the nodes at the
+	root of the scene and their children (QGIS puts the buildings under a root
+	node named as the file, and their outlines under the buildings).
+	"""
+	def __init__(self, filename):
+		self.filename = os.path.splitext(os.path.basename(filename))[0]
+		self.gltf = Gltf(filename)
+		self.obj = list(self._buildings())
+
+	def __iter__(self):
+		return iter(self.obj)
+
+	def read(self):
+		"""
+		Function that returns the buildings of the file.
+		:return: buildings, list of GltfBuilding
+		"""
+		return self.obj
+
+	def close(self):
+		self.gltf.close()
+
+	def _buildings(self):
+		"""
+		Function that walks the nodes of the file and yields the buildings, the
+		meshes are not read.
+		:return: buildings, generator of GltfBuilding
+		"""
+		nodes, roots = self.gltf.json['nodes'], set(self.gltf.roots())
+		for index, parent, matrix in self.gltf.nodes():
+			node = nodes[index]
+			if 'mesh' not in node or not self.gltf.triangles(node['mesh']):
+				continue
+			if parent is not None and parent not in roots:
+				continue
+			name = node.get('name') or self.gltf.json['meshes'][node['mesh']].get(
+				'name') or 'node_{}'.format(index)
+			yield GltfBuilding(self.gltf, name, node['mesh'], matrix)
+
+
 def deselect_all(value=False):
 	"""
 	Function that deselects all the objects in the scene.
@@ -172,49 +304,285 @@ def deselect_all(value=False):
 		obj.select_set(value)
 
 
-###############################################################################
-# arguments
+_BUILDINGS = []  # buildings to write, shared with the forked workers
 
-if __name__ == '__main__':
 
-	filename = 'test.gltf'
-	save = 'samples'
+def split(buildings, folder, annotation, workers=WORKERS, chunk=64, indices=None):
+	"""
+	Function that writes every building to its own .obj file. The files are
+	written by worker processes in chunks of buildings and the annotation
+	record of a building is committed once its file is written. The records of
+	a chunk are made when the chunk is sent to the workers, so the meshes of
+	Blender buildings are read in this process one chunk at a time and sent
+	with it; the meshes of GltfBuilding are read by the workers one building at
+	a time.
+	:param buildings: buildings to write, Collection of Building
+	:param folder: folder to write the .obj files to, str
+	:param annotation: annotation to commit the records to, Annotation
+	:param workers: number of processes writing the files, int, default WORKERS
+	:param chunk: number of buildings written by a process at once, int,
+	default 64
+	:param indices: indices of the buildings to write, the files are named
+	after them, list of int, default None (all the buildings)
+	:return: number of written buildings, int
+	"""
+	global _BUILDINGS
+	os.makedirs(folder, exist_ok=True)
+	workers = min(workers, os.cpu_count() or 1)
+	buildings = list(buildings)
+	if indices is None:
+		indices = range(len(buildings))
+	_BUILDINGS = [(int(i), buildings[i]) for i in indices]
+	# the workers are forked to share the buildings without pickling them
+	pool = None
+	if workers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+		pool = multiprocessing.get_context('fork').Pool(workers)
+	pending = deque()  # records and results of the chunks sent
+	try:
+		for start in range(0, len(_BUILDINGS), chunk):
+			stop = min(start + chunk, len(_BUILDINGS))
+			records = [annotation.make(b, '{}/{}.png'.format(folder, i),
+			                           '{}/{}.obj'.format(folder, i))
+			           for i, b in _BUILDINGS[start:stop]]
+			task = (start, stop, folder, [b.release() for _, b in _BUILDINGS[start:stop]])
+			if pool is None:
+				_write_chunk(task)
+				for record in records:
+					annotation.commit(record)
+				continue
+			pending.append((records, pool.apply_async(_write_chunk, (task,))))
+			while len(pending) > 2 * workers:
+				_commit(annotation, *pending.popleft())
+		while pending:
+			_commit(annotation, *pending.popleft())
+	finally:
+		if pool is not None:
+			pool.terminate()
+		_BUILDINGS = []
+	return len(indices)
+
+
+def _commit(annotation, records, result):
+	"""
+	Function that commits the records of a chunk once its files are written.
+	:param annotation: annotation to commit the records to, Annotation
+	:param records: records of the buildings of the chunk, list of dict
+	:param result: result of the chunk, multiprocessing.pool.AsyncResult
+	:return:
+	"""
+	result.get()
+	for record in records:
+		annotation.commit(record)
 
-	if '--' in sys.argv:
-		argv = sys.argv[sys.argv.index('--') + 1:]
-		parser = argparse.ArgumentParser(description=textwrap.dedent('''\
-			USAGE: blender --background setup.blend --python shp2obj.py -- 1.gltf
 
-			------------------------------------------------------------------------
+def write_obj(filename, vertices, totals, loops, name=None, materials=None,
+              uvs=None, normals=None):
+	"""
+	Function that writes a mesh as an .obj file. The axes are converted as by
+	the Blender exporter: Z up becomes Y up.
+	:param filename: path of the file, str
+	:param vertices: vertices, np.ndarray (n, 3)
+	:param totals: number of vertices of every polygon, np.ndarray (m,)
+	:param loops: vertices of the polygons one after the other, np.ndarray (sum,)
+	:param name: name of the object, str, default None
+	:param materials: names of the materials and material of every polygon,
+	(list of str, np.ndarray (m,)), written to the .mtl file next to the .obj
+	file (see write_mtl), default None
+	:param uvs: UVs of the vertices of the polygons, np.ndarray (sum, 2),
+	default None
+	:param normals: normals of the polygons, np.ndarray (m, 3), default None
+	:return:
+	"""
+	vertices = np.asarray(vertices, dtype=np.float64)
+	totals = np.asarray(totals)
+	# the vertex, the UV and the normal of every corner, .obj indices start from 1
+	corners = [np.asarray(loops) + 1]
+	if uvs is not None:
+		corners.append(np.arange(len(corners[0])) + 1)
+	if normals is not None:
+		corners.append(np.repeat(np.arange(len(totals)) + 1, totals))
+	corners = np.stack(corners, axis=1)
+	corner = {1: ' %d', 2: ' %d/%d' if normals is None else ' %d//%d', 3: ' %d/%d/%d'}[
+		corners.shape[1]]
+	if materials is None:
+		groups = [(None, np.ones(len(totals), dtype=bool))]
+	else:
+		names, slots = materials
+		groups = [(x, np.asarray(slots) == i) for i, x in enumerate(names)]
+	with open(filename, 'w') as f:
+		if materials is not None:
+			f.write('mtllib {}.mtl\n'.format(os.path.splitext(os.path.basename(filename))[0]))
+		if name is not None:
+			f.write('o {}\n'.format(name))
+		f.write(('v %.6f %.6f %.6f\n' * len(vertices)) % tuple(_y_up(vertices).ravel().tolist()))
+		if uvs is not None:
+			f.write(('vt %.6f %.6f\n' * len(uvs)) % tuple(np.asarray(uvs).ravel().tolist()))
+		if normals is not None:
+			f.write(('vn %.4f %.4f %.4f\n' * len(normals)) %
+			        tuple(_y_up(normals).ravel().tolist()))
+		for material, mask in groups:
+			if not mask.any():
+				continue
+			if material is not None:
+				f.write('usemtl {}\n'.format(material))
+			f.write(_faces(totals[mask], corner) %
+			        tuple(corners[np.repeat(mask, totals)].ravel().tolist()))
+
+
+def write_mtl(filename, names, colors, textures=None):
+	"""
+	Function that writes the materials of an .obj file with their colors.
+	:param filename: path of the .mtl file, str
+	:param names: names of the materials, list of str
+	:param colors: diffuse colors of the materials, np.ndarray (n, 3)
+	:param textures: paths of the diffuse textures of the materials (None for
+	the materials without one), list of str, default None
+	:return:
+	"""
+	textures = textures or [None] * len(names)
+	with open(filename, 'w') as f:
+		for name, color, texture in zip(names, colors, textures):
+			f.write('newmtl {}\nKd {:.6f} {:.6f} {:.6f}\n'.format(name, *color[:3]))
+			if texture is not None:
+				f.write('map_Kd {}\n'.format(texture))
+			f.write('\n')
 
-			This is an algorithm that divides a .gltf into separate .obj files.
 
-			------------------------------------------------------------------------
+def _faces(totals, corner=' %d'):
+	"""
+	Function that returns the format string of the faces of an .obj file; one
+	format string for the whole file is faster than np.savetxt.
+	:param totals: number of vertices of every polygon, np.ndarray (m,)
+	:param corner: format of one corner, str, default ' %d'
+	:return: format string, str
+	"""
+	if len(totals) and (totals == totals[0]).all():
+		return ('f' + corner * int(totals[0]) + '\n') * len(totals)
+	return ''.join('f' + corner * int(x) + '\n' for x in totals)
 
-			'''))
-		parser.add_argument('file', type=str, help='path to .gltf file')
-		parser.add_argument('--save', type=str,
-		                    help='path to save the .obj files to', default='samples')
-		args = parser.parse_known_args(argv)[0]
-		try:
-			args = parser.parse_args()
 
-		except SystemExit as e:
-			print(repr(e))
+def _y_up(points):
+	return np.stack([points[:, 0], points[:, 2], -points[:, 1]], axis=1)
 
-	filename = args.file
-	save_path = args.save
 
-	a = Annotation()
+def select(buildings, source, bbox=None, center=None, radius=None, nearest=None):
+	"""
+	Function that finds the buildings of a region with the spatial index of
+	the file, read from next to it or built once from the bounding boxes.
+	:param buildings: buildings of the file, list of Building
+	:param source: path of the file, str
+	:param bbox: region, [x_from, x_to, y_from, y_to], list of float,
+	default None
+	:param center: center of the radius and nearest queries, (x, y), default
+	None
+	:param radius: distance to the center, float, default None
+	:param nearest: number of buildings closest to the center, int, default None
+	:return: indices of the buildings, np.ndarray, None without a query
+	"""
+	if bbox is None and radius is None and nearest is None:
+		return None
+	tree = open_index(source, [b.name for b in buildings],
+	                  lambda: [b.get_bb() for b in buildings])
+	selected = np.arange(len(buildings))
+	if bbox is not None:
+		selected = np.intersect1d(selected, tree.bbox(bbox))
+	if radius is not None:
+		assert center is not None, "Expected a center for the radius query"
+		selected = np.intersect1d(selected, tree.radius(center, radius))
+	if nearest is not None:
+		assert center is not None, "Expected a center for the nearest query"
+		selected = np.intersect1d(selected, tree.nearest(center, nearest))
+	return selected
+
+
+def _write_chunk(chunk):
+	"""
+	Function that writes the .obj files of a range of buildings.
+	:param chunk: first and last (excluded) position in the buildings to write,
+	the folder and the arrays of the meshes read in the main process (None for
+	the buildings read here), tuple
+	:return: first and last (excluded) position, tuple of int
+	"""
+	start, stop, folder, meshes = chunk
+	for (index, building), arrays in zip(_BUILDINGS[start:stop], meshes):
+		if arrays is None:
+			building.save('{}/{}.obj'.format(folder, index))
+		else:
+			write_obj('{}/{}.obj'.format(folder, index), *arrays, name=building.name)
+	return start, stop
+
+
+###############################################################################
+# arguments
+
+if __name__ == '__main__':
+
+	filename = 'test.gltf'
+	save = 'samples'
+	annotation = 'test.json'
+	workers = WORKERS
+	reader_type = 'gltf'
+
+	argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+	parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+		USAGE: python shp2obj.py 1.gltf
+		       blender --background setup.blend --python shp2obj.py -- 1.gltf --reader blender
+
+		------------------------------------------------------------------------
+
+		This is an algorithm that divides a .gltf into separate .obj files.
+
+		------------------------------------------------------------------------
+
+		'''))
+	parser.add_argument('file', type=str, help='path to .gltf or .glb file')
+	parser.add_argument('--save', type=str,
+	                    help='path to save the .obj files to', default='samples')
+	parser.add_argument('--annotation', type=str, default='test.json',
+	                    help='path of the .json annotation to write')
+	parser.add_argument('--workers', type=int, default=WORKERS,
+	                    help='number of processes writing the .obj files')
+	parser.add_argument('--bbox', type=float, nargs=4, default=None,
+	                    metavar=('X_FROM', 'X_TO', 'Y_FROM', 'Y_TO'),
+	                    help='write only the buildings intersecting the region')
+	parser.add_argument('--center', type=float, nargs=2, default=None,
+	                    metavar=('X', 'Y'), help='center of --radius and --nearest')
+	parser.add_argument('--radius', type=float, default=None,
+	                    help='write only the buildings closer to the center')
+	parser.add_argument('--nearest', type=int, default=None,
+	                    help='write only the k buildings closest to the center')
+	parser.add_argument('--reader', type=str, default='gltf',
+	                    choices=['gltf', 'blender'],
+	                    help='gltf - read the file without Blender, blender - '
+	                         'import it into the scene')
+	args = parser.parse_args(argv)
+	filename, save, annotation = args.file, args.save, args.annotation
+	workers, reader_type = args.workers, args.reader
+	assert reader_type == 'gltf' or bpy is not None, \
+		"The blender reader runs inside Blender only"
+
+	if ANNOTATION_STREAM:
+		a = StreamingAnnotation(os.path.splitext(annotation)[0] + '.jsonl',
+		                        resume=False)
+	else:
+		a = Annotation()
 
-	reader = BlenderReader(filename)
 	building_collection = Collection(Building)
-	if save not in os.listdir():
-		os.mkdir(save)
-	for b in reader.obj:
-		building_collection.add(Building(b))
-	for i, b in enumerate(building_collection):
-		a.add(name='{}/{}.png'.format(save, i), model='{}/{}.obj'.format(save, i),
-		      bb=b.get_bb())
-		b.save('{}/{}.obj'.format(save, i))
-	a.write('test.json')
+	if reader_type == 'gltf':
+		reader = GltfReader(filename)
+		building_collection.add(reader.read())
+	else:
+		reader = BlenderReader(filename)
+		for b in reader.obj:
+			if b.type == 'MESH':
+				building_collection.add(Building(b))
+	buildings = list(building_collection)
+	indices = select(buildings, filename, args.bbox, args.center, args.radius,
+	                 args.nearest)
+	print('{} buildings written'.format(split(buildings, save, a, workers,
+	                                          indices=indices)))
+	a.write(annotation)
+	if ANNOTATION_STREAM:
+		a.close()
+	if reader_type == 'gltf':
+		reader.close()
@@ -0,0 +1,195 @@
+import hashlib
+import heapq
+import numpy as np
+import os
+
+
+class RTree:
+	"""
+	Class that indexes the bounding boxes of buildings in a Sort-Tile-Recursive
+	packed R-tree: the boxes are sorted into vertical slices by x, each slice
+	by y, and grouped into nodes of a fixed capacity, level by level. The
+	levels are kept as arrays so that every level of a query is vectorised.
+	"""
+	def __init__(self, boxes, capacity=16):
+		"""
+		Class initialization
+		:param boxes: bounding boxes as returned by Building.get_bb,
+		np.ndarray (n, 4), [x_from, x_to, y_from, y_to]
+		:param capacity: number of children of a node, int, default 16
+		"""
+		assert capacity > 1, "Expected a capacity of at least 2, got {}".format(capacity)
+		self.capacity = capacity
+		boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+		self.order = _str_order(boxes, capacity)
+		self.levels = [boxes[self.order]]
+		while len(self.levels[-1]) > capacity:
+			self.levels.append(_parents(self.levels[-1], capacity))
+
+	def __len__(self):
+		return len(self.order)
+
+	def bbox(self, region):
+		"""
+		Function that finds the buildings whose bounding box intersects a region.
+		:param region: region, [x_from, x_to, y_from, y_to], list of float
+		:return: indices of the buildings, np.ndarray, sorted
+		"""
+		x_from, x_to, y_from, y_to = region
+		return self._search(lambda b: (b[:, 0] <= x_to) & (b[:, 1] >= x_from) &
+		                              (b[:, 2] <= y_to) & (b[:, 3] >= y_from))
+
+	def radius(self, center, radius):
+		"""
+		Function that finds the buildings whose bounding box is closer to a
+		point than a distance.
+		:param center: point, (x, y), tuple of float
+		:param radius: distance, float
+		:return: indices of the buildings, np.ndarray, sorted
+		"""
+		return self._search(lambda b: _distance(b, center) <= radius)
+
+	def nearest(self, center, k=1):
+		"""
+		Function that finds the buildings whose bounding boxes are the closest
+		to a point, visiting the nodes in the order of their distance.
+		:param center: point, (x, y), tuple of float
+		:param k: number of buildings, int, default 1
+		:return: indices of the buildings, np.ndarray, from the closest
+		"""
+		top = len(self.levels) - 1
+		heap = [(d, top, i) for i, d in enumerate(_distance(self.levels[top], center))]
+		heapq.heapify(heap)
+		found = []
+		while heap and len(found) < k:
+			_, level, i = heapq.heappop(heap)
+			if level == 0:
+				found.append(self.order[i])
+				continue
+			children = self._children(level, np.array([i]))
+			for child, d in zip(children, _distance(self.levels[level - 1][children], center)):
+				heapq.heappush(heap, (d, level - 1, child))
+		return np.array(found, dtype=np.int64)
+
+	def save(self, filename, signature=''):
+		"""
+		Function that writes the index as an .npz file.
+		:param filename: path of the file, str
+		:param signature: signature of the indexed data, str, default ''
+		:return:
+		"""
+		np.savez(filename, order=self.order, capacity=self.capacity,
+		         signature=np.array(signature),
+		         **{'level_{}'.format(i): x for i, x in enumerate(self.levels)})
+
+	@classmethod
+	def load(cls, filename, signature=None):
+		"""
+		Function that reads an index written by save.
+		:param filename: path of the file, str
+		:param signature: expected signature of the indexed data, str, default
+		None (not checked)
+		:return: index, RTree, None if the signature differs
+		"""
+		with np.load(filename) as data:
+			if signature is not None and str(data['signature']) != signature:
+				return None
+			tree = cls.__new__(cls)
+			tree.capacity = int(data['capacity'])
+			tree.order = data['order']
+			tree.levels = [data['level_{}'.format(i)] for i in
+			               range(len([x for x in data.files if x.startswith('level_')]))]
+		return tree
+
+	def _children(self, level, nodes):
+		"""
+		Function that returns the children of nodes, which are contiguous in the
+		level below.
+		:param level: level of the nodes, int
+		:param nodes: indices of the nodes, np.ndarray
+		:return: indices of the children in the level below, np.ndarray
+		"""
+		children = (nodes[:, None] * self.capacity + np.arange(self.capacity)).ravel()
+		return children[children < len(self.levels[level - 1])]
+
+	def _search(self, test):
+		"""
+		Function that walks down the levels keeping the nodes that pass a test.
+		:param test: function of boxes np.ndarray (n, 4) returning a bool mask
+		:return: indices of the buildings that pass the test, np.ndarray, sorted
+		"""
+		candidates = np.arange(len(self.levels[-1]))
+		for level in range(len(self.levels) - 1, 0, -1):
+			candidates = candidates[test(self.levels[level][candidates])]
+			candidates = self._children(level, candidates)
+		candidates = candidates[test(self.levels[0][candidates])]
+		return np.sort(self.order[candidates])
+
+
+def open_index(source, names, boxes, capacity=16):
+	"""
+	Function that reads the index of the buildings of a file from next to it,
+	or builds and writes it if it is missing or out of date.
+	:param source: path of the file the buildings are read from, str
+	:param names: names of the buildings in their order, list of str
+	:param boxes: function returning the bounding boxes of the buildings,
+	called only when the index is built
+	:param capacity: number of children of a node, int, default 16
+	:return: index, RTree
+	"""
+	stat = os.stat(source)
+	signature = hashlib.sha1('{} {}\n{}'.format(stat.st_size, stat.st_mtime_ns,
+	                                            '\n'.join(names)).encode()).hexdigest()
+	path = os.path.splitext(source)[0] + '.index.npz'
+	if os.path.isfile(path):
+		tree = RTree.load(path, signature)
+		if tree is not None:
+			return tree
+	tree = RTree(boxes(), capacity)
+	tree.save(path, signature)
+	return tree
+
+
+def _distance(boxes, center):
+	"""
+	Function that returns the distances from a point to boxes, 0 inside them.
+	:param boxes: boxes, np.ndarray (n, 4), [x_from, x_to, y_from, y_to]
+	:param center: point, (x, y), tuple of float
+	:return: distances, np.ndarray (n,)
+	"""
+	x, y = center
+	dx = np.maximum(np.maximum(boxes[:, 0] - x, x - boxes[:, 1]), 0.0)
+	dy = np.maximum(np.maximum(boxes[:, 2] - y, y - boxes[:, 3]), 0.0)
+	return np.hypot(dx, dy)
+
+
+def _parents(boxes, capacity):
+	"""
+	Function that groups consecutive boxes into nodes.
+	:param boxes: boxes of a level, np.ndarray (n, 4)
+	:param capacity: number of children of a node, int
+	:return: boxes of the nodes, np.ndarray (ceil(n / capacity), 4)
+	"""
+	starts = np.arange(0, len(boxes), capacity)
+	return np.stack([np.minimum.reduceat(boxes[:, 0], starts),
+	                 np.maximum.reduceat(boxes[:, 1], starts),
+	                 np.minimum.reduceat(boxes[:, 2], starts),
+	                 np.maximum.reduceat(boxes[:, 3], starts)], axis=1)
+
+
+def _str_order(boxes, capacity):
+	"""
+	Function that sorts boxes into the Sort-Tile-Recursive order: vertical
+	slices of sqrt(n / capacity) nodes sorted by x, sorted by y inside.
+	:param boxes: boxes, np.ndarray (n, 4)
+	:param capacity: number of children of a node, int
+	:return: order of the boxes, np.ndarray (n,)
+	"""
+	if not len(boxes):
+		return np.zeros(0, dtype=np.int64)
+	x, y = boxes[:, :2].mean(axis=1), boxes[:, 2:].mean(axis=1)
+	slices = int(np.ceil(np.sqrt(np.ceil(len(boxes) / capacity))))
+	by_x = np.argsort(x, kind='stable')
+	slice_of = np.empty(len(boxes), dtype=np.int64)
+	slice_of[by_x] = np.arange(len(boxes)) // (slices * capacity)
+	return np.lexsort((y, slice_of))
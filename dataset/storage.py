@@ -0,0 +1,354 @@
+import argparse
+import json
+import numpy as np
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+import time
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset_config import *
+
+
+# Numeric labels of a sample taken from its annotation record
+LABEL_DTYPE = np.dtype([('sample', '<i8'), ('bbox', '<f4', (4,)),
+                        ('img_size', '<i4', (2,)), ('focal_length', '<f4'),
+                        ('cam_position', '<f4', (3,))])
+
+# Position of a sample in the storage
+INDEX_DTYPE = np.dtype([('sample', '<i8'), ('shard', '<i4'), ('offset', '<i4')])
+
+
+class ShardWriter:
+	"""
+	Class that stores the point clouds and the labels of the samples in
+	fixed-size shards: one .npy array of points (samples, POINTS, 6) and one of
+	labels per shard, written through memory maps. The position of every
+	sample is appended to index.jsonl once its rows are on disk, so a crashed
+	run loses at most the sample being written.
+	"""
+	def __init__(self, folder, shard_size=STORAGE_SHARD, points=POINTS):
+		"""
+		Class initialization
+		:param folder: folder of the storage, str
+		:param shard_size: number of samples per shard, int, default STORAGE_SHARD
+		:param points: number of points of every cloud, int, default POINTS
+		"""
+		assert shard_size > 0, "Expected a positive shard size, got {}".format(shard_size)
+		self.folder = os.path.abspath(folder)  # as the filename of the memory maps
+		self.shard_size = shard_size
+		self.points = points
+		os.makedirs(self.folder, exist_ok=True)
+		self._write_info()
+		entries = _read_index(os.path.join(self.folder, 'index.jsonl'))
+		if os.path.isfile(os.path.join(self.folder, 'index.npy')):
+			os.remove(os.path.join(self.folder, 'index.npy'))  # rewritten on close
+		self.shard, self.offset = 0, 0
+		if len(entries):
+			last = entries[np.argmax(entries['shard'] * self.shard_size + entries['offset'])]
+			self.shard, self.offset = int(last['shard']), int(last['offset']) + 1
+		self._points, self._labels = None, None
+		self._index = open(os.path.join(self.folder, 'index.jsonl'), 'a')
+
+	def add(self, sample, points, normals, record=None):
+		"""
+		Function that stores the point cloud and the labels of a sample. A sample
+		stored again replaces the previous one.
+		:param sample: id of the sample, int
+		:param points: points, np.ndarray (POINTS, 3)
+		:param normals: normals of the points, np.ndarray (POINTS, 3)
+		:param record: annotation of the sample, dict, default None
+		:return:
+		"""
+		assert len(points) == self.points and len(normals) == self.points, \
+			"Expected {} points, got {}".format(self.points, len(points))
+		if self.offset == self.shard_size:
+			self.shard, self.offset = self.shard + 1, 0
+		if self._points is None or self._points.filename != self._path('points'):
+			self._open()
+		self._points[self.offset, :, :3] = points
+		self._points[self.offset, :, 3:] = normals
+		self._labels[self.offset] = _labels(sample, record or {})
+		self._points.flush()
+		self._labels.flush()
+		self._index.write(json.dumps({'sample': int(sample), 'shard': self.shard,
+		                              'offset': self.offset}) + '\n')
+		self._index.flush()
+		os.fsync(self._index.fileno())
+		self.offset += 1
+
+	def files(self):
+		"""
+		Function that returns the files the last sample was written to. They
+		change with every sample of the shard.
+		:return: paths, list of str
+		"""
+		return [self._path('points'), self._path('labels'),
+		        os.path.join(self.folder, 'index.jsonl')]
+
+	def close(self):
+		"""
+		Function that closes the storage and writes the index as one array.
+		:return:
+		"""
+		if self._index.closed:
+			return
+		self._index.close()
+		self._points, self._labels = None, None
+		np.save(os.path.join(self.folder, 'index.npy'),
+		        _read_index(os.path.join(self.folder, 'index.jsonl')))
+
+	def _open(self):
+		"""
+		Function that opens the arrays of the current shard, creating them if
+		they do not exist.
+		:return:
+		"""
+		if os.path.isfile(self._path('points')):
+			self._points = np.load(self._path('points'), mmap_mode='r+')
+			self._labels = np.load(self._path('labels'), mmap_mode='r+')
+			return
+		self._points = np.lib.format.open_memmap(self._path('points'), mode='w+',
+		                                         dtype=np.float32,
+		                                         shape=(self.shard_size, self.points, 6))
+		self._labels = np.lib.format.open_memmap(self._path('labels'), mode='w+',
+		                                         dtype=LABEL_DTYPE,
+		                                         shape=(self.shard_size,))
+
+	def _path(self, name, shard=None):
+		return _shard_path(self.folder, name, self.shard if shard is None else shard)
+
+	def _write_info(self):
+		"""
+		Function that writes the parameters of the storage, or checks them
+		against the ones of an existing storage.
+		:return:
+		"""
+		info = {'shard_size': self.shard_size, 'points': self.points}
+		path = os.path.join(self.folder, 'info.json')
+		if os.path.isfile(path):
+			with open(path, 'r') as f:
+				existing = json.load(f)
+			assert existing == info, "Storage {} was written with {}, got {}".format(
+				self.folder, existing, info)
+			return
+		with open(path, 'w') as f:
+			json.dump(info, f)
+
+
+class ShardReader:
+	"""
+	Class that gives random access to the samples of one or several storages.
+	The shards are memory-mapped, so a sample is read without copying the
+	shard or parsing a file.
+	"""
+	def __init__(self, *folders):
+		"""
+		Class initialization
+		:param folders: folders of the storages, str
+		"""
+		assert folders, "Expected at least one storage folder"
+		self.folders = folders
+		self._shards = {}
+		indices = []
+		for i, folder in enumerate(folders):
+			index = _load_index(folder)
+			indices.append(np.stack([index['sample'], np.full(len(index), i),
+			                         index['shard'], index['offset']], axis=1))
+		index = np.concatenate(indices) if indices else np.zeros((0, 4), dtype=np.int64)
+		# the last entry of a sample written twice wins
+		_, last = np.unique(index[::-1, 0], return_index=True)
+		self.index = index[::-1][last]
+		self.samples = self.index[:, 0]
+
+	def __len__(self):
+		return len(self.samples)
+
+	def __getitem__(self, sample):
+		"""
+		Function that returns the point cloud and the labels of a sample.
+		:param sample: id of the sample, int
+		:return: points and normals, np.ndarray (POINTS, 6), read-only view
+		         labels, np.void of LABEL_DTYPE
+		"""
+		position = int(np.searchsorted(self.samples, sample))
+		assert position < len(self.samples) and self.samples[position] == sample, \
+			"Sample {} is not in the storage".format(sample)
+		_, folder, shard, offset = self.index[position]
+		points, labels = self._shard(folder, shard)
+		return points[offset], labels[offset]
+
+	def get(self, samples):
+		"""
+		Function that returns the point clouds and the labels of several samples.
+		:param samples: ids of the samples, sequence of int
+		:return: points and normals, np.ndarray (n, POINTS, 6)
+		         labels, np.ndarray (n,) of LABEL_DTYPE
+		"""
+		samples = np.asarray(samples, dtype=np.int64)
+		position = np.minimum(np.searchsorted(self.samples, samples),
+		                      max(len(self.samples) - 1, 0))
+		assert len(self.samples) and np.all(self.samples[position] == samples), \
+			"Samples {} are not in the storage".format(
+				samples[self.samples[position] != samples])
+		rows = self.index[position]
+		keys = (rows[:, 1] << 32) + rows[:, 2]
+		if len(rows) and np.all(keys == keys[0]):  # all in one shard
+			_points, _labels = self._shard(rows[0, 1], rows[0, 2])
+			return np.take(_points, rows[:, 3], axis=0), _labels[rows[:, 3]]
+		points, labels = None, np.empty(len(rows), dtype=LABEL_DTYPE)
+		for key in np.unique(keys):
+			where = np.flatnonzero(keys == key)
+			_points, _labels = self._shard(key >> 32, key & 0xffffffff)
+			if points is None:
+				points = np.empty((len(rows),) + _points.shape[1:], dtype=np.float32)
+			points[where] = np.take(_points, rows[where, 3], axis=0)
+			labels[where] = _labels[rows[where, 3]]
+		return points, labels
+
+	def _shard(self, folder, shard):
+		"""
+		Function that returns the memory-mapped arrays of a shard.
+		:param folder: index of the storage folder, int
+		:param shard: index of the shard, int
+		:return: points, labels, np.memmap
+		"""
+		key = (int(folder), int(shard))
+		if key not in self._shards:
+			self._shards[key] = tuple(np.load(_shard_path(self.folders[key[0]], x, key[1]),
+			                                  mmap_mode='r') for x in ['points', 'labels'])
+		return self._shards[key]
+
+
+def read_ply(filename):
+	"""
+	Function that reads a binary .ply point cloud written by write_ply.
+	:param filename: path of the file, str
+	:return: points and normals, np.ndarray (n, 6)
+	"""
+	with open(filename, 'rb') as f:
+		header = []
+		while not header or header[-1] != 'end_header':
+			header.append(f.readline().decode('ascii').strip())
+		columns = len([x for x in header if x.startswith('property')])
+		return np.fromfile(f, dtype='<f4').reshape(-1, columns)
+
+
+def _labels(sample, record):
+	"""
+	Function that makes the numeric labels of a sample from its annotation.
+	:param sample: id of the sample, int
+	:param record: annotation of the sample, dict
+	:return: labels, np.ndarray () of LABEL_DTYPE
+	"""
+	labels = np.zeros((), dtype=LABEL_DTYPE)
+	labels['sample'] = sample
+	for key in ['bbox', 'img_size', 'focal_length', 'cam_position']:
+		if key in record:
+			labels[key] = record[key]
+	return labels
+
+
+def _load_index(folder):
+	"""
+	Function that reads the index of a storage, from the array written on
+	close if there is one.
+	:param folder: folder of the storage, str
+	:return: index, np.ndarray of INDEX_DTYPE
+	"""
+	if os.path.isfile(os.path.join(folder, 'index.npy')):
+		return np.load(os.path.join(folder, 'index.npy'))
+	return _read_index(os.path.join(folder, 'index.jsonl'))
+
+
+def _read_index(filename):
+	"""
+	Function that reads the index entries, ignoring an entry that was only
+	partially written.
+	:param filename: path of index.jsonl, str
+	:return: index, np.ndarray of INDEX_DTYPE
+	"""
+	entries = []
+	if os.path.isfile(filename):
+		with open(filename, 'rb') as f:
+			for line in f:
+				try:
+					assert line.endswith(b'\n')
+					entry = json.loads(line)
+				except (AssertionError, ValueError):
+					break
+				entries.append((entry['sample'], entry['shard'], entry['offset']))
+	return np.array(entries, dtype=INDEX_DTYPE)
+
+
+def _shard_path(folder, name, shard):
+	return os.path.join(folder, '{}_{:05d}.npy'.format(name, shard))
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description=textwrap.dedent('''\
+		USAGE: python storage.py --size 2000 --reads 2000
+
+		------------------------------------------------------------------------
+
+		This is an algorithm that compares the random access read time of the
+		point clouds stored as one .ply file per sample and in shards.
+
+		------------------------------------------------------------------------
+
+		'''))
+	parser.add_argument('--size', type=int, default=2000, help='number of samples')
+	parser.add_argument('--reads', type=int, default=2000,
+	                    help='number of random samples to read')
+	parser.add_argument('--batch', type=int, default=64,
+	                    help='number of samples read at once')
+	parser.add_argument('--seed', type=int, default=SEED, help='seed')
+	args = parser.parse_args()
+
+	from point_cloud import write_ply
+	try:
+		from pyntcloud import PyntCloud
+	except ImportError:
+		PyntCloud = None
+
+	rng = np.random.default_rng(args.seed)
+	folder = tempfile.mkdtemp()
+	writer = ShardWriter(os.path.join(folder, 'storage'))
+	for i in range(args.size):
+		cloud = rng.random((POINTS, 6)).astype(np.float32)
+		write_ply(os.path.join(folder, '{}.ply'.format(i)), cloud[:, :3], cloud[:, 3:])
+		writer.add(i, cloud[:, :3], cloud[:, 3:])
+	writer.close()
+	order = rng.integers(0, args.size, args.reads)
+
+	start = time.perf_counter()
+	for i in order:
+		cloud = read_ply(os.path.join(folder, '{}.ply'.format(i)))
+	ply = time.perf_counter() - start
+
+	reader = ShardReader(os.path.join(folder, 'storage'))
+	start = time.perf_counter()
+	for i in order:
+		cloud = np.array(reader[i][0])
+	shards = time.perf_counter() - start
+	assert np.array_equal(cloud, read_ply(os.path.join(folder, '{}.ply'.format(order[-1]))))
+
+	start = time.perf_counter()
+	for i in range(0, args.reads, args.batch):
+		clouds, labels = reader.get(order[i:i + args.batch])
+	batches = time.perf_counter() - start
+	if PyntCloud is not None:
+		start = time.perf_counter()
+		for i in order:
+			cloud = PyntCloud.from_file(os.path.join(folder, '{}.ply'.format(i)))
+		print('pyntcloud .ply: {:.0f} samples/s'.format(args.reads / (time.perf_counter() - start)))
+	shutil.rmtree(folder)
+	print('.ply: {:.0f} samples/s, shards: {:.0f} samples/s ({:.1f}x), shards in '
+	      'batches of {}: {:.0f} samples/s ({:.1f}x)'.format(
+		args.reads / ply, args.reads / shards, ply / shards, args.batch,
+		args.reads / batches, ply / batches))
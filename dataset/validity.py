@@ -0,0 +1,242 @@
+import math
+import numpy as np
+import os
+import sys
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from dataset_config import *
+
+
+# One row per building: the largest share of a volume inside another one, the
+# widest gap between a volume and the closest other one and whether it is valid
+VALIDITY_DTYPE = np.dtype([('building', np.int64),
+                           ('overlap', np.float64),
+                           ('gap', np.float64),
+                           ('connected', np.bool_),
+                           ('valid', np.bool_)])
+
+
+# fields of the layouts the validity is computed from
+_FIELDS = ['building', 'width', 'length', 'height', 'x', 'y', 'z', 'rotation']
+
+
+def check(rows, tolerance=VALIDITY_TOLERANCE, overlap=VALIDITY_OVERLAP,
+          chunk=VALIDITY_CHUNK):
+	"""
+	Function that checks the layouts of a batch of buildings at once on the
+	oriented boxes of their volumes. Two volumes are in contact if they overlap
+	or are closer than the tolerance on a separating axis. A building is valid
+	if the contacts connect all its volumes and no volume is inside another
+	one for more than the allowed share of its own volume (the corners where
+	the wings of a patio meet are shared by design). The buildings are checked
+	in chunks of buildings with the same number of volumes, so that the memory
+	does not grow with the batch.
+	:param rows: layouts, np.ndarray of batch_layout.LAYOUT_DTYPE (or with its
+	building, size, position and rotation fields), rows of a building contiguous
+	:param tolerance: largest gap between two volumes in contact, float,
+	default VALIDITY_TOLERANCE
+	:param overlap: largest share of a volume inside another one, float,
+	default VALIDITY_OVERLAP
+	:param chunk: number of buildings checked at once, int, default
+	VALIDITY_CHUNK
+	:return: validity of every building, np.ndarray of VALIDITY_DTYPE
+	"""
+	starts = np.flatnonzero(np.r_[True, rows['building'][1:] != rows['building'][:-1]]) \
+		if len(rows) else np.zeros(0, dtype=np.int64)
+	counts = np.diff(np.append(starts, len(rows)))
+	result = np.zeros(len(starts), dtype=VALIDITY_DTYPE)
+	result['building'] = rows['building'][starts]
+	result['connected'] = True  # buildings of one volume
+	for number in np.unique(counts[counts > 1]):
+		buildings = np.flatnonzero(counts == number)
+		for first in range(0, len(buildings), chunk):
+			part = buildings[first:first + chunk]
+			index = starts[part][:, None] + np.arange(number)
+			result[part] = _check({x: rows[x][index] for x in _FIELDS}, tolerance)
+	result['valid'] = result['connected'] & (result['overlap'] <= overlap)
+	return result
+
+
+def _check(rows, tolerance):
+	"""
+	Function that checks buildings of the same number of volumes.
+	:param rows: fields of the layouts checked, dict name -> np.ndarray (n, v)
+	:param tolerance: largest gap between two volumes in contact, float
+	:return: validity of every building without the valid field,
+	np.ndarray (n,) of VALIDITY_DTYPE
+	"""
+	centre = np.stack([rows['x'], rows['y'], rows['z']], axis=-1)
+	half = np.stack([rows['length'], rows['width'], rows['height'] / 2.0], axis=-1)
+	c, s = np.cos(rows['rotation']), np.sin(rows['rotation'])
+	shape = rows['x'].shape
+	first, second = np.triu_indices(shape[1], 1)  # every pair once
+	box_i = centre[:, first], half[:, first], c[:, first], s[:, first]
+	box_j = centre[:, second], half[:, second], c[:, second], s[:, second]
+
+	result = np.zeros(shape[0], dtype=VALIDITY_DTYPE)
+	result['building'] = rows['building'][:, 0]
+	# world axis aligned bounds, exact for the rotations by multiples of 90
+	# degrees of the typologies
+	extent = np.stack([np.abs(c) * half[..., 0] + np.abs(s) * half[..., 1],
+	                   np.abs(s) * half[..., 0] + np.abs(c) * half[..., 1],
+	                   half[..., 2]], axis=-1)
+	low, high = centre - extent, centre + extent
+	inside = np.clip(np.minimum(high[:, first], high[:, second]) -
+	                 np.maximum(low[:, first], low[:, second]), 0.0, None).prod(axis=-1)
+	volume = (2 * extent).prod(axis=-1)
+	result['overlap'] = np.maximum(inside / volume[:, first],
+	                               inside / volume[:, second]).max(axis=1)
+	depth = np.full(shape + shape[1:], -np.inf)
+	depth[:, first, second] = depth[:, second, first] = _depths(box_i, box_j)
+	result['connected'] = _connected(depth >= -tolerance)
+	# widest gap to the closest other volume
+	result['gap'] = np.maximum(-depth, 0.0).min(axis=2).max(axis=1)
+	return result
+
+
+def _connected(contact):
+	"""
+	Function that checks whether the contacts connect all the volumes of every
+	building, squaring the reachability matrices until they are closed.
+	:param contact: contacts, np.ndarray (n, v, v), bool
+	:return: connected, np.ndarray (n,), bool
+	"""
+	reach = (contact | np.eye(contact.shape[1], dtype=bool)[None]).astype(np.uint8)
+	for _ in range(int(np.ceil(np.log2(max(contact.shape[1], 2))))):
+		reach = (np.einsum('nij,njk->nik', reach, reach) > 0).astype(np.uint8)
+	return reach[:, 0, :].all(axis=1)
+
+
+def _depths(box_i, box_j):
+	"""
+	Function that measures how deep two volumes go into each other with the
+	separating axis test of oriented boxes: the smallest overlap of their
+	projections on the axes of both footprints and on z. Negative depths are
+	the gaps between separated volumes.
+	:param box_i: centres, half sizes along the volume axes, cosines and sines
+	of the rotations around z, (np.ndarray (..., 3), np.ndarray (..., 3),
+	np.ndarray (...), np.ndarray (...))
+	:param box_j: the other volumes, same as box_i
+	:return: depths, np.ndarray (...)
+	"""
+	(centre_i, half_i, c_i, s_i), (centre_j, half_j, c_j, s_j) = box_i, box_j
+	dx, dy = centre_j[..., 0] - centre_i[..., 0], centre_j[..., 1] - centre_i[..., 1]
+	depth = np.full(c_i.shape, np.inf)
+	# the 4 separating axes: the two axes of both footprints
+	for axis_x, axis_y in [(c_i, s_i), (-s_i, c_i), (c_j, s_j), (-s_j, c_j)]:
+		radius_i = half_i[..., 0] * np.abs(c_i * axis_x + s_i * axis_y) + \
+		           half_i[..., 1] * np.abs(c_i * axis_y - s_i * axis_x)
+		radius_j = half_j[..., 0] * np.abs(c_j * axis_x + s_j * axis_y) + \
+		           half_j[..., 1] * np.abs(c_j * axis_y - s_j * axis_x)
+		np.minimum(depth, radius_i + radius_j - np.abs(dx * axis_x + dy * axis_y),
+		           out=depth)
+	depth_z = half_i[..., 2] + half_j[..., 2] - np.abs(centre_j[..., 2] - centre_i[..., 2])
+	return np.minimum(depth, depth_z)
+
+
+def resample(layout, draw, attempts=VALIDITY_ATTEMPTS):
+	"""
+	Function that draws the layout of a building again while it is invalid.
+	:param layout: layout of the building, BuildingLayout
+	:param draw: function drawing a new layout of the same typology
+	:param attempts: largest number of draws, int, default VALIDITY_ATTEMPTS
+	:return: layout, BuildingLayout, the last one drawn if none is valid
+	"""
+	for _ in range(attempts):
+		if valid(layout):
+			break
+		layout = draw()
+	return layout
+
+
+def valid(layout, tolerance=VALIDITY_TOLERANCE, overlap=VALIDITY_OVERLAP):
+	"""
+	Function that checks the layout of one building as check does, with plain
+	floats: for a few volumes this is faster than setting up the arrays.
+	:param layout: layout of the building, BuildingLayout
+	:param tolerance: largest gap between two volumes in contact, float,
+	default VALIDITY_TOLERANCE
+	:param overlap: largest share of a volume inside another one, float,
+	default VALIDITY_OVERLAP
+	:return: bool
+	"""
+	boxes = [_box(v) for v in layout.volumes]
+	reached, contacts = {0}, [[] for _ in boxes]
+	for i in range(len(boxes)):
+		for j in range(i + 1, len(boxes)):
+			inside = 1.0
+			for axis in range(3):
+				inside *= max(min(boxes[i][5][axis], boxes[j][5][axis]) -
+				              max(boxes[i][4][axis], boxes[j][4][axis]), 0.0)
+			if inside > overlap * min(boxes[i][6], boxes[j][6]):
+				return False
+			if _depth(boxes[i], boxes[j]) >= -tolerance:
+				contacts[i].append(j)
+				contacts[j].append(i)
+	stack = [0]
+	while stack:
+		for j in contacts[stack.pop()]:
+			if j not in reached:
+				reached.add(j)
+				stack.append(j)
+	return len(reached) == len(boxes)
+
+
+def _box(volume):
+	"""
+	Function that returns the oriented box of a volume and its world axis
+	aligned bounds as plain floats.
+	:param volume: volume, VolumeLayout
+	:return: centre, half sizes along the volume axes, cosine and sine of the
+	rotation, low and high corners of the bounds and volume of the bounds, tuple
+	"""
+	centre = tuple(float(x) for x in volume.location)
+	half = (float(volume.length), float(volume.width), float(volume.height) / 2.0)
+	c, s = math.cos(volume.rotation), math.sin(volume.rotation)
+	extent = (abs(c) * half[0] + abs(s) * half[1], abs(s) * half[0] + abs(c) * half[1],
+	          half[2])
+	low = tuple(x - e for x, e in zip(centre, extent))
+	high = tuple(x + e for x, e in zip(centre, extent))
+	return centre, half, c, s, low, high, 8.0 * extent[0] * extent[1] * extent[2]
+
+
+def _depth(box_i, box_j):
+	"""
+	Function that measures how deep two volumes go into each other, as _depths
+	for one pair of boxes returned by _box.
+	:param box_i: box of a volume, tuple
+	:param box_j: box of the other volume, tuple
+	:return: depth, float
+	"""
+	(centre_i, half_i, c_i, s_i), (centre_j, half_j, c_j, s_j) = box_i[:4], box_j[:4]
+	dx, dy = centre_j[0] - centre_i[0], centre_j[1] - centre_i[1]
+	depth = half_i[2] + half_j[2] - abs(centre_j[2] - centre_i[2])
+	for axis_x, axis_y in [(c_i, s_i), (-s_i, c_i), (c_j, s_j), (-s_j, c_j)]:
+		radius_i = half_i[0] * abs(c_i * axis_x + s_i * axis_y) + \
+		           half_i[1] * abs(c_i * axis_y - s_i * axis_x)
+		radius_j = half_j[0] * abs(c_j * axis_x + s_j * axis_y) + \
+		           half_j[1] * abs(c_j * axis_y - s_j * axis_x)
+		depth = min(depth, radius_i + radius_j - abs(dx * axis_x + dy * axis_y))
+	return depth
+
+
+def layout_rows(layouts):
+	"""
+	Function that turns the layouts of buildings into rows that can be checked.
+	:param layouts: layouts, list of BuildingLayout
+	:return: rows, np.ndarray with the fields of batch_layout.LAYOUT_DTYPE
+	that are checked
+	"""
+	volumes = [(i, v) for i, layout in enumerate(layouts) for v in layout.volumes]
+	rows = np.zeros(len(volumes), dtype=[(x, np.int64 if x == 'building' else np.float64)
+	                                     for x in ['building', 'width', 'length',
+	                                               'height', 'x', 'y', 'z',
+	                                               'rotation']])
+	for row, (i, v) in zip(rows, volumes):
+		row['building'] = i
+		row['width'], row['length'], row['height'] = v.width, v.length, v.height
+		row['x'], row['y'], row['z'] = v.location
+		row['rotation'] = v.rotation
+	return rows
@@ -2,7 +2,6 @@ import bpy, bmesh
 from math import radians
 import numpy as np
 import os
-import random
 import sys
 
 file_dir = os.path.dirname(__file__)
@@ -10,8 +9,10 @@ sys.path.append(file_dir)
 
 from blender_utils import *
 from dataset_config import *
+from geometry import box, transform
 from material import Material
 from module import *
+from seeding import get_rng
 from shp2obj import Collection, deselect_all
 
 
@@ -19,7 +20,13 @@ class Factory:
 	"""
 	Factory that produces volumes.
 	"""
-	def __init__(self):
+	def __init__(self, rng=None):
+		"""
+		Class initialization
+		:param rng: random generator of the sample, np.random.Generator,
+		default None (unseeded)
+		"""
+		self.rng = get_rng(rng)
 		self.min_width = MIN_WIDTH
 		self.min_length = MIN_LENGTH
 		self.min_height = MIN_HEIGHT
@@ -44,9 +51,9 @@ class Factory:
 		Function that produces a volume based on random parameters.
 		:return: generated volume, Volume
 		"""
-		v = Volume(scale=(np.random.randint(self.min_length, self.max_length),
-		                  np.random.randint(self.min_width, self.max_width),
-		                  np.random.randint(self.min_height, self.max_height)))
+		v = Volume(scale=(int(self.rng.integers(self.min_length, self.max_length)),
+		                  int(self.rng.integers(self.min_width, self.max_width)),
+		                  int(self.rng.integers(self.min_height, self.max_height))))
 		return v
 
 
@@ -54,8 +61,14 @@ class CollectionFactory:
 	"""
 	Class that generates a collection of volumes based on their number.
 	"""
-	def __init__(self):
-		self.volume_factory = Factory()
+	def __init__(self, rng=None):
+		"""
+		Class initialization
+		:param rng: random generator of the sample, np.random.Generator,
+		default None (unseeded)
+		"""
+		self.rng = get_rng(rng)
+		self.volume_factory = Factory(self.rng)
 
 	def produce(self, number=None):
 		"""
@@ -74,7 +87,7 @@ class CollectionFactory:
 		"""
 		c = Collection(Volume)
 		if not number:
-			number = np.random.randint(1, MAX_VOLUMES+1)
+			number = int(self.rng.integers(1, MAX_VOLUMES+1))
 
 		for _ in range(number):
 			c.add(self.volume_factory.produce())
@@ -114,14 +127,54 @@ class Volume:
 		material.value.node_tree.nodes['Mapping'].inputs[3].default_value[2] = self.height * 10 # self.width
 		material.value.node_tree.nodes['Mapping'].inputs[3].default_value /= 2
 		self.mesh.active_material = material.value
-		print(material.value.node_tree.nodes['Mapping'].inputs[3].default_value)
 
 	def create(self):
 		"""
 		Function that creates a mesh based on the input parameters.
 		:return:
 		"""
+		if GEOMETRY == 'numpy':
+			self._create_arrays()
+		else:
+			self._create_ops()
+		self.mesh["inst_id"] = 1  # instance id for the building envelope
+		self.mesh.pass_index = 1
+		deselect_all()
+
+	def geometry(self):
+		"""
+		Function that returns the world geometry of the volume without Blender
+		operators.
+		:return: vertices, np.ndarray (8, 3), triangles, np.ndarray (12, 3)
+		"""
+		vertices, triangles, _ = box(self.length, self.width, self.height)
+		if self.mesh:
+			location, rotation = tuple(self.mesh.location), self.mesh.rotation_euler[2]
+		else:
+			location, rotation = self._origin(), 0.0
+		return transform(vertices, location, rotation), triangles
+
+	def _create_arrays(self):
+		"""
+		Function that creates the mesh from the NumPy box in one call.
+		:return:
+		"""
+		vertices, triangles, uvs = box(self.length, self.width, self.height)
+		data = bpy.data.meshes.new('volume')
+		data.from_pydata(vertices.tolist(), [], triangles.tolist())
+		data.uv_layers.new(name='UVMap').data.foreach_set(
+			'uv', uvs.ravel().astype(np.float32))
+		data.update()
+		self.mesh = bpy.data.objects.new('volume', data)
+		self.mesh.location = self._origin()
+		self.name = self.mesh.name
+		self._nest()
 
+	def _create_ops(self):
+		"""
+		Function that creates the mesh with Blender operators.
+		:return:
+		"""
 		bpy.ops.mesh.primitive_plane_add(location=self.position)
 		bpy.ops.transform.resize(value=(self.length, self.width, 1.0))
 		bpy.context.selected_objects[0].name = 'volume'
@@ -129,8 +182,6 @@ class Volume:
 		self.mesh = bpy.data.objects[self.name]
 		self._nest()
 		self._extrude()
-		self.mesh["inst_id"] = 1  # instance id for the building envelope
-		self.mesh.pass_index = 1
 		deselect_all()
 		self._triangulate()
 
@@ -149,6 +200,15 @@ class Volume:
 			bpy.data.collections['Building'].objects.link(
 					bpy.data.objects[self.name])
 
+	def _origin(self):
+		"""
+		Function that returns the location of the volume origin: the centre of
+		its bounds, the volume being extruded down from its position.
+		:return: location, tuple (x, y, z)
+		"""
+		return (float(self.position[0]), float(self.position[1]),
+		        float(self.position[2]) - self.height / 2.0)
+
 	def _triangulate(self):
 		deselect_all()
 		if self.mesh: